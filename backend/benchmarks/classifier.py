@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.run import DEFAULT_RESULTS_DIR, git_commit
+from benchmarks.slot_extraction import CORPUS
+from intent_classifier import DEFAULT_KEYWORDS_PATH, IntentClassifier
+
+
+def load_programs(path: str) -> Tuple[List[Tuple[str, List[str]]], str]:
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    programs = [(entry["program"], entry["keywords"]) for entry in config["programs"]]
+    return programs, config.get("default_program", "general_food_access")
+
+
+def grow(programs: List[Tuple[str, List[str]]], total: int, rng: random.Random) -> List[Tuple[str, List[str]]]:
+    """The configured keywords padded (or cut) to `total`, shared evenly; padding is made-up two-word phrases"""
+    grown = []
+    for index, (program, keywords) in enumerate(programs):
+        per_program = max(1, total // len(programs) + (index < total % len(programs)))
+        keywords = list(keywords[:per_program])
+        while len(keywords) < per_program:
+            words = ("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(2))
+            keywords.append(" ".join(words))
+        grown.append((program, keywords))
+    return grown
+
+
+class ScanClassifier:
+    """The original router: a substring scan over each program's keywords in priority order"""
+
+    def __init__(self, programs: List[Tuple[str, List[str]]], default_program: str):
+        self.programs = [(program, [keyword.lower() for keyword in keywords]) for program, keywords in programs]
+        self.default_program = default_program
+
+    def classify(self, message: str) -> str:
+        message = message.lower()
+        for program, keywords in self.programs:
+            if any(keyword in message for keyword in keywords):
+                return program
+        return self.default_program
+
+
+def per_message_ns(classify, messages: List[str], rounds: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(rounds):
+        for message in messages:
+            classify(message)
+    return (time.perf_counter_ns() - start) / (rounds * len(messages))
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Routing cost as the keyword list grows: keyword automaton vs substring scan")
+    parser.add_argument("--keywords", type=int, nargs="+", default=[20, 100, 500, 1000, 5000],
+                        help="total keyword counts to compare")
+    parser.add_argument("--rounds", type=int, default=200, help="passes over the message corpus per measurement")
+    parser.add_argument("--config", default=DEFAULT_KEYWORDS_PATH, help="keyword file to start from")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-classifier.json)")
+    args = parser.parse_args(argv)
+
+    programs, default_program = load_programs(args.config)
+    messages = list(CORPUS)
+    rng = random.Random(0)
+    results = {}
+    for total in args.keywords:
+        grown = grow(programs, total, rng)
+        start = time.perf_counter()
+        automaton = IntentClassifier(grown, default_program)
+        build_ms = (time.perf_counter() - start) * 1000
+        scan = ScanClassifier(grown, default_program)
+        mismatches = [m for m in messages if automaton.classify(m)["program"] != scan.classify(m)]
+        results[str(total)] = {
+            "keywords": sum(len(keywords) for _, keywords in grown),
+            "build_ms": round(build_ms, 3),
+            "automaton_ns": round(per_message_ns(automaton.classify, messages, args.rounds), 1),
+            "scan_ns": round(per_message_ns(scan.classify, messages, args.rounds), 1),
+            "mismatches": mismatches,
+        }
+
+    report = {
+        "benchmark": "classifier",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"keywords": args.keywords, "rounds": args.rounds, "messages": len(messages)},
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-classifier.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for result in results.values():
+        print(
+            f"{result['keywords']:>5} keywords: automaton {result['automaton_ns']}ns/message "
+            f"(built in {result['build_ms']}ms), substring scan {result['scan_ns']}ns/message, "
+            f"{len(result['mismatches'])} routed differently"
+        )
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+
+# (label, path into the report, True if higher is better)
+METRICS = [
+    ("requests/sec", ("results", "requests_per_sec"), True),
+    ("p50 ms", ("results", "latency", "p50_ms"), False),
+    ("p95 ms", ("results", "latency", "p95_ms"), False),
+    ("p99 ms", ("results", "latency", "p99_ms"), False),
+    ("bytes/session", ("results", "memory", "bytes_per_session"), False),
+    ("errors", ("results", "errors"), False),
+    ("model hit ratio", ("results", "model", "cache_hit_ratio"), True),
+    # benchmarks/startup.py
+    ("import ms", ("results", "import_ms"), False),
+    ("health ms", ("results", "cold_start", "health_ms"), False),
+    ("warm ms", ("results", "cold_start", "warm_ms"), False),
+    # benchmarks/http_pool.py
+    ("pooled p50 ms", ("results", "pooled", "latency", "p50_ms"), False),
+    ("saved ms/call", ("results", "saved_ms_per_call"), True),
+]
+
+
+def lookup(report: dict, path):
+    for key in path:
+        if not isinstance(report, dict):
+            return None
+        report = report.get(key)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change in the wrong direction that counts as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline  {baseline.get('git_commit')}  {baseline.get('config')}")
+    print(f"candidate {candidate.get('git_commit')}  {candidate.get('config')}")
+    regressions = []
+    for label, path, higher_is_better in METRICS:
+        old, new = lookup(baseline, path), lookup(candidate, path)
+        if old is None and new is None:
+            # Reported by the other benchmark
+            continue
+        if old is None or new is None:
+            print(f"{label:>14}  {old!s:>12}  {new!s:>12}")
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > args.threshold and (old or new):
+            flag = "  REGRESSION"
+            regressions.append(label)
+        print(f"{label:>14}  {old:>12}  {new:>12}  {change:+7.1f}%{flag}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
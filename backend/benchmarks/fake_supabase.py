@@ -0,0 +1,308 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+# Columns with a UNIQUE constraint, per table (see supabase_schema.sql)
+UNIQUE_COLUMNS = {
+    "conversations": "session_id",
+    "webhook_outbox": "idempotency_key",
+    "registration_dedup": "dedup_key",
+}
+
+# Column defaults applied on insert, per table (see supabase_schema.sql)
+COLUMN_DEFAULTS = {
+    "conversations": {"version": 0},
+    "webhook_outbox": {"status": "pending", "attempts": 0, "last_error": None},
+}
+
+# (parent table, embedded table) -> join column, for selects like "conversation_messages(id,role,content)"
+EMBEDDED_JOINS = {
+    ("conversations", "conversation_messages"): "session_id",
+}
+
+# Query parameters that are not column filters
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns", "or", "and"}
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split on commas outside parentheses and double quotes"""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.0):
+        """
+        In-memory stand-in for the subset of the Supabase REST API (PostgREST) the backend uses.
+
+        Supports select with embedded resources, eq/neq/in/lt/lte/gt/gte/is filters
+        (also inside or/and groups), order and limit (also on embedded resources), insert, upsert and update.
+        Unique columns and embedded joins are indexed, so lookups stay O(1) as tables grow.
+        Every request is delayed by `latency` seconds to mimic a network round trip.
+        """
+        self.latency = latency
+        self.tables: Dict[str, List[Dict]] = {}
+        self._next_id: Dict[str, int] = {}
+        # table -> unique value -> row, and (table, join column) -> value -> rows
+        self._unique: Dict[str, Dict] = {}
+        self._joined: Dict[Tuple[str, str], Dict] = {}
+        self.requests = 0
+
+    def _rows(self, table: str) -> List[Dict]:
+        return self.tables.setdefault(table, [])
+
+    def _new_row(self, table: str, values: Dict) -> Dict:
+        row_id = self._next_id.get(table, 1)
+        self._next_id[table] = row_id + 1
+        now = datetime.now(timezone.utc).isoformat()
+        row = {"id": row_id, "created_at": now, "updated_at": now, **COLUMN_DEFAULTS.get(table, {})}
+        row.update(values)
+        self._rows(table).append(row)
+        if table in UNIQUE_COLUMNS:
+            self._unique.setdefault(table, {})[row.get(UNIQUE_COLUMNS[table])] = row
+        for (parent, child), join in EMBEDDED_JOINS.items():
+            if child == table:
+                self._joined.setdefault((table, join), {}).setdefault(row.get(join), []).append(row)
+        return row
+
+    @staticmethod
+    def _coerce(raw: str, current):
+        """Convert a filter value to the type of the column value it is compared with"""
+        if isinstance(current, bool):
+            return raw.lower() == "true"
+        if isinstance(current, (int, float)):
+            try:
+                return type(current)(float(raw)) if isinstance(current, float) else int(float(raw))
+            except ValueError:
+                return raw
+        return raw
+
+    def _matches(self, row: Dict, column: str, expression: str) -> bool:
+        negate = expression.startswith("not.")
+        if negate:
+            expression = expression[4:]
+        op, _, raw = expression.partition(".")
+        if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+            raw = raw[1:-1]
+        value = row.get(column)
+
+        if op == "is":
+            result = value is None if raw == "null" else value == (raw == "true")
+        elif op == "in":
+            options = [option.strip().strip('"') for option in raw.strip("()").split(",")]
+            result = value is not None and str(value) in options
+        elif value is None:
+            result = False
+        else:
+            other = self._coerce(raw, value)
+            try:
+                result = {
+                    "eq": value == other,
+                    "neq": value != other,
+                    "lt": value < other,
+                    "lte": value <= other,
+                    "gt": value > other,
+                    "gte": value >= other,
+                }[op]
+            except (KeyError, TypeError):
+                result = False
+        return not result if negate else result
+
+    def _matches_group(self, row: Dict, operator: str, group: str) -> bool:
+        """Evaluate a logical filter like or=(a.gt.1,and(a.eq.1,id.gt.5))"""
+        results = []
+        for term in _split_top_level(group.strip()[1:-1]):
+            negate = term.startswith("not.")
+            if negate:
+                term = term[4:]
+            name, _, rest = term.partition("(")
+            if name in ("or", "and") and rest:
+                result = self._matches_group(row, name, "(" + rest)
+            else:
+                column, _, expression = term.partition(".")
+                result = self._matches(row, column, expression)
+            results.append(not result if negate else result)
+        return any(results) if operator == "or" else all(results)
+
+    def _filter(self, table: str, params) -> List[Dict]:
+        rows = self._rows(table)
+        unique = UNIQUE_COLUMNS.get(table)
+        lookup = params.get(unique) if unique else None
+        if lookup is not None and lookup.startswith("eq."):
+            # Index lookup instead of a scan, like the real unique index
+            row = self._unique.get(table, {}).get(lookup[3:])
+            rows = [row] if row is not None else []
+        for column, expression in params.multi_items():
+            if column in RESERVED_PARAMS or "." in column:
+                continue
+            rows = [row for row in rows if self._matches(row, column, expression)]
+        for operator in ("or", "and"):
+            for group in params.getlist(operator):
+                rows = [row for row in rows if self._matches_group(row, operator, group)]
+        return rows
+
+    @staticmethod
+    def _order(rows: List[Dict], spec: Optional[str]) -> List[Dict]:
+        if not spec:
+            return rows
+        for part in reversed(spec.split(",")):
+            column, *modifiers = part.split(".")
+            descending = "desc" in modifiers
+            present = [row for row in rows if row.get(column) is not None]
+            missing = [row for row in rows if row.get(column) is None]
+            present.sort(key=lambda row: row[column], reverse=descending)
+            rows = present + missing
+        return rows
+
+    @staticmethod
+    def _split_select(select: str) -> Tuple[List[str], Dict[str, List[str]]]:
+        """Split "a,b,child(x,y)" into (["a", "b"], {"child": ["x", "y"]})"""
+        columns, embedded = [], {}
+        depth, current = 0, ""
+        for char in select + ",":
+            if char == "," and depth == 0:
+                token = current.strip()
+                current = ""
+                if not token:
+                    continue
+                if "(" in token:
+                    name, inner = token.split("(", 1)
+                    embedded[name.strip()] = [c.strip() for c in inner.rstrip(")").split(",") if c.strip()]
+                else:
+                    columns.append(token)
+                continue
+            depth += char == "("
+            depth -= char == ")"
+            current += char
+        return columns, embedded
+
+    def _project(self, table: str, rows: List[Dict], params) -> List[Dict]:
+        columns, embedded = self._split_select(params.get("select", "*"))
+        result = []
+        for row in rows:
+            item = dict(row) if "*" in columns or not columns else {c: row.get(c) for c in columns}
+            for child, child_columns in embedded.items():
+                join = EMBEDDED_JOINS[(table, child)]
+                children = self._joined.get((child, join), {}).get(row.get(join), [])
+                children = self._order(children, params.get(f"{child}.order"))
+                if f"{child}.limit" in params:
+                    children = children[:int(params[f"{child}.limit"])]
+                item[child] = [
+                    dict(r) if "*" in child_columns else {c: r.get(c) for c in child_columns}
+                    for r in children
+                ]
+            result.append(item)
+        return result
+
+    @staticmethod
+    def _prefer(request: Request) -> str:
+        return request.headers.get("prefer", "")
+
+    def _conflict(self, table: str) -> JSONResponse:
+        return JSONResponse({
+            "code": "23505",
+            "details": None,
+            "hint": None,
+            "message": f'duplicate key value violates unique constraint "{table}_{UNIQUE_COLUMNS[table]}_key"'
+        }, status_code=409)
+
+    async def handle(self, request: Request) -> Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        table = request.path_params["table"]
+        params = request.query_params
+
+        if request.method == "GET":
+            rows = self._order(self._filter(table, params), params.get("order"))
+            offset = int(params.get("offset", 0))
+            rows = rows[offset:]
+            if "limit" in params:
+                rows = rows[:int(params["limit"])]
+            return JSONResponse(self._project(table, rows, params))
+
+        if request.method == "PATCH":
+            values = json.loads(await request.body())
+            rows = self._filter(table, params)
+            for row in rows:
+                row.update(values)
+                row["updated_at"] = datetime.now(timezone.utc).isoformat()
+            return JSONResponse([dict(row) for row in rows])
+
+        # POST: insert or upsert
+        body = json.loads(await request.body())
+        items = body if isinstance(body, list) else [body]
+        prefer = self._prefer(request)
+        merge = "resolution=merge-duplicates" in prefer
+        ignore = "resolution=ignore-duplicates" in prefer
+        unique = UNIQUE_COLUMNS.get(table)
+        existing = self._unique.setdefault(table, {}) if unique else {}
+
+        # Check the whole statement first so a conflicting insert writes nothing
+        if unique and not (merge or ignore):
+            seen = set()
+            for item in items:
+                key = item.get(unique)
+                if key in existing or key in seen:
+                    return self._conflict(table)
+                seen.add(key)
+
+        written = []
+        for item in items:
+            key = item.get(unique) if unique else None
+            if unique and key in existing:
+                if ignore:
+                    continue
+                existing[key].update(item)
+                existing[key]["updated_at"] = datetime.now(timezone.utc).isoformat()
+                written.append(existing[key])
+                continue
+            written.append(self._new_row(table, item))
+
+        return JSONResponse([dict(row) for row in written], status_code=201)
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "rows": {table: len(rows) for table, rows in self.tables.items()}
+        }
+
+
+def build_app(fake: FakeSupabase) -> Starlette:
+    """Starlette app serving `fake` under /rest/v1/<table>"""
+    async def stats(request: Request) -> JSONResponse:
+        return JSONResponse(fake.stats())
+
+    return Starlette(routes=[
+        Route("/rest/v1/{table}", fake.handle, methods=["GET", "POST", "PATCH"]),
+        Route("/_stats", stats),
+    ])
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a fake Supabase REST API")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(build_app(FakeSupabase(args.latency_ms / 1000)), host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Only the turn itself is measured: no database, webhook or model
+os.environ.update({"SUPABASE_URL": "", "SUPABASE_KEY": "", "REDIS_URL": "", "WEBHOOK_URL": "", "LLM_MODEL": ""})
+
+from benchmarks.run import DEFAULT_RESULTS_DIR, git_commit, summarize
+from conversation_flow import PROGRAMS, ConversationFlow, get_graph
+
+# Slot-only turns: the program is already set, so the graph only passes through start
+TURNS = (
+    "My name is Amina Yusuf",
+    "I'm 34 years old",
+    "We need rice, beans and cooking oil for a family of six",
+    "34",
+)
+
+
+def slot_turn_states() -> List[Dict]:
+    """(state, message) pairs for every program and slot-only message"""
+    cases = []
+    for program in PROGRAMS:
+        for message in TURNS:
+            state = ConversationFlow.new_state(f"bench-{program}")
+            state["program"] = program
+            state["messages"] = [
+                {"role": "user", "content": "There is no food left in our village"},
+                {"role": "assistant", "content": "To assist you better, may I please have your name?"},
+            ]
+            cases.append((state, message))
+    return cases
+
+
+async def time_turns(flow: ConversationFlow, cases, rounds: int) -> Dict:
+    latencies = []
+    outputs = []
+    for _ in range(rounds):
+        for state, message in cases:
+            state = copy.deepcopy(state)
+            start = time.perf_counter()
+            result = await flow.run_turn(state, message)
+            latencies.append(time.perf_counter() - start)
+            outputs.append(result)
+    return {"latencies": latencies, "outputs": outputs[:len(cases)]}
+
+
+def persisted(state: Dict) -> Dict:
+    """What save_state writes for a state"""
+    return {**ConversationFlow.slot_values(state), "messages": state["messages"]}
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Per-turn latency of slot-only turns through the full graph vs the fast path")
+    parser.add_argument("--rounds", type=int, default=500, help="passes over the slot-only turns per mode")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-fast_path.json)")
+    args = parser.parse_args(argv)
+
+    get_graph()
+    cases = slot_turn_states()
+    graph_flow = ConversationFlow()
+    graph_flow.fast_path = False
+    fast_flow = ConversationFlow()
+    fast_flow.fast_path = True
+
+    async def measure():
+        # One pass each first, so imports and caches are warm
+        await time_turns(graph_flow, cases, 1)
+        await time_turns(fast_flow, cases, 1)
+        return await time_turns(graph_flow, cases, args.rounds), await time_turns(fast_flow, cases, args.rounds)
+
+    graph, fast = asyncio.run(measure())
+    mismatches = [
+        message
+        for (_, message), graph_state, fast_state in zip(cases, graph["outputs"], fast["outputs"])
+        if persisted(graph_state) != persisted(fast_state)
+    ]
+    results = {
+        "graph": summarize(graph["latencies"]),
+        "fast_path": summarize(fast["latencies"]),
+        "mismatches": mismatches,
+    }
+    results["speedup"] = round(results["graph"]["mean_ms"] / results["fast_path"]["mean_ms"], 2)
+
+    report = {
+        "benchmark": "fast_path",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"rounds": args.rounds, "turns": len(cases)},
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-fast_path.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for mode in ("graph", "fast_path"):
+        latency = results[mode]
+        print(f"{mode:>9}: p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  mean {latency['mean_ms']}ms")
+    print(f"fast path is {results['speedup']}x faster; {len(mismatches)} turns saved differently")
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import datetime as dt
+import ipaddress
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks import webhook_sink
+from benchmarks.run import DEFAULT_RESULTS_DIR, BackgroundServer, free_port, git_commit, summarize
+from http_pool import HttpPool
+
+PAYLOAD = {
+    "beneficiary_name": "Amina Yusuf",
+    "beneficiary_age": 34,
+    "assistance_request": "There is no food left in our village after the flood",
+    "program": "emergency_food_aid",
+}
+
+
+def make_certificate(directory: str) -> Tuple[str, str]:
+    """Self-signed certificate for 127.0.0.1 and localhost; returns (certfile, keyfile)"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - dt.timedelta(minutes=5))
+        .not_valid_after(now + dt.timedelta(days=1))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(
+            x509.SubjectAlternativeName([
+                x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+                x509.DNSName("localhost"),
+            ]),
+            critical=False
+        )
+        .sign(key, hashes.SHA256())
+    )
+    certfile = os.path.join(directory, "stub.crt")
+    keyfile = os.path.join(directory, "stub.key")
+    with open(certfile, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    return certfile, keyfile
+
+
+class ConnectionCounter:
+    def __init__(self, app):
+        """ASGI wrapper recording the client address of each request, i.e. one entry per TCP connection"""
+        self.app = app
+        self.connections: Set[Tuple[str, int]] = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope.get("client"):
+            self.connections.add(tuple(scope["client"]))
+        await self.app(scope, receive, send)
+
+
+async def per_call(url: str, calls: int, concurrency: int) -> Tuple[List[float], Optional[str]]:
+    """A new client, and so a new TCP+TLS connection, for every call, as module-level httpx.post does"""
+    async def one() -> Tuple[float, str]:
+        start = time.perf_counter()
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.post(url, json=PAYLOAD)
+        response.raise_for_status()
+        return time.perf_counter() - start, response.http_version
+
+    return await _run(one, calls, concurrency)
+
+
+async def pooled(url: str, calls: int, concurrency: int, pool: HttpPool) -> Tuple[List[float], Optional[str]]:
+    """Every call through the app's shared pool, so connections are reused"""
+    client = pool.get()
+
+    async def one() -> Tuple[float, str]:
+        start = time.perf_counter()
+        response = await client.post(url, json=PAYLOAD)
+        response.raise_for_status()
+        return time.perf_counter() - start, response.http_version
+
+    try:
+        return await _run(one, calls, concurrency)
+    finally:
+        await pool.aclose()
+
+
+async def _run(one, calls: int, concurrency: int) -> Tuple[List[float], Optional[str]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await one()
+
+    results = await asyncio.gather(*(limited() for _ in range(calls)))
+    return [elapsed for elapsed, _ in results], results[-1][1] if results else None
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Per-call latency of fresh vs pooled HTTPS connections to a local webhook stub")
+    parser.add_argument("--calls", type=int, default=300, help="webhook POSTs per mode")
+    parser.add_argument("--concurrency", type=int, default=1, help="POSTs in flight at once")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="stub response latency")
+    parser.add_argument("--http1", action="store_true", help="don't offer HTTP/2 from the pool")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-http_pool.json)")
+    args = parser.parse_args(argv)
+
+    certfile, keyfile = make_certificate(tempfile.mkdtemp(prefix="zha-https-"))
+    # httpx trusts SSL_CERT_FILE, the same way a deployment would trust a private CA
+    os.environ["SSL_CERT_FILE"] = certfile
+
+    results = {}
+    for mode in ("per_call", "pooled"):
+        sink = webhook_sink.WebhookSink(latency=args.latency_ms / 1000)
+        counter = ConnectionCounter(webhook_sink.build_app(sink))
+        with BackgroundServer(counter, free_port(), ssl_certfile=certfile, ssl_keyfile=keyfile) as server:
+            url = f"{server.url}/webhook"
+            if mode == "per_call":
+                latencies, http_version = asyncio.run(per_call(url, args.calls, args.concurrency))
+            else:
+                pool = HttpPool(http2=not args.http1)
+                latencies, http_version = asyncio.run(pooled(url, args.calls, args.concurrency, pool))
+        results[mode] = {
+            "latency": summarize(latencies),
+            "connections": len(counter.connections),
+            "http_version": http_version,
+        }
+
+    saved = results["per_call"]["latency"]["mean_ms"] - results["pooled"]["latency"]["mean_ms"]
+    report = {
+        "benchmark": "http_pool",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {
+            "calls": args.calls,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "http2": not args.http1,
+        },
+        "results": {**results, "saved_ms_per_call": round(saved, 3)},
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-http_pool.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for mode, result in results.items():
+        latency = result["latency"]
+        print(
+            f"{mode:>9}: p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  mean {latency['mean_ms']}ms  "
+            f"{result['connections']} connections  {result['http_version']}"
+        )
+    print(f"saved per call: {report['results']['saved_ms_per_call']}ms")
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks import fake_supabase
+from benchmarks.run import DEFAULT_RESULTS_DIR, FAKE_SUPABASE_KEY, BackgroundServer, free_port, git_commit, summarize
+from database import Database, write_size
+
+# One turn's messages, about the length of a real request and reply
+USER_MESSAGE = "We have had no food since the flood last week, my children are hungry"
+ASSISTANT_MESSAGE = "Please tell me more about your food assistance needs. What specific help are you looking for?"
+
+
+def legacy_size(messages: List[Dict]) -> int:
+    """Bytes the original save wrote: the whole transcript as one JSON column"""
+    return len(json.dumps(messages).encode("utf-8"))
+
+
+async def play(database: Database, turns: int, sessions: int, tail: int) -> Dict:
+    """Save `turns` turns for each session, then load each one; saves are timed over the last `tail` turns"""
+    saves: List[float] = []
+    loads: List[float] = []
+    written = legacy = 0
+    for _ in range(sessions):
+        session_id = str(uuid.uuid4())
+        version = None
+        transcript: List[Dict] = []
+        for turn in range(turns):
+            new_messages = [
+                {"role": "user", "content": f"{USER_MESSAGE} ({turn})"},
+                {"role": "assistant", "content": ASSISTANT_MESSAGE},
+            ]
+            transcript.extend(new_messages)
+            slots = {"program": "emergency_food_aid"} if version is None else {}
+            start = time.perf_counter()
+            version = await database.save_conversation(
+                session_id=session_id,
+                program="emergency_food_aid",
+                beneficiary_name=None,
+                beneficiary_age=None,
+                assistance_request=None,
+                new_messages=new_messages,
+                expected_version=version,
+                changed_slots=slots
+            )
+            elapsed = time.perf_counter() - start
+            if turn >= turns - tail:
+                saves.append(elapsed)
+            written += write_size(slots, new_messages)
+            legacy += legacy_size(transcript)
+
+        start = time.perf_counter()
+        state = await database.load_conversation_state(session_id)
+        loads.append(time.perf_counter() - start)
+        assert state is not None and len(state["messages"]) == min(2 * turns, database.message_window)
+    return {
+        "save": summarize(saves),
+        "load": summarize(loads),
+        "bytes_per_session": written // sessions,
+        "legacy_bytes_per_session": legacy // sessions,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Save and load cost of short vs long conversations with the append-only message log")
+    parser.add_argument("--backend", choices=["mock", "fake-supabase"], default="fake-supabase",
+                        help="Database mock mode, or a local fake of the Supabase REST API")
+    parser.add_argument("--turns", type=int, nargs="+", default=[5, 200], help="conversation lengths to compare")
+    parser.add_argument("--sessions", type=int, default=20, help="conversations per length")
+    parser.add_argument("--tail", type=int, default=5, help="saves timed at the end of each conversation")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-message_log.json)")
+    args = parser.parse_args(argv)
+
+    fake = fake_supabase.FakeSupabase()
+    with contextlib.ExitStack() as stack:
+        env = {"SUPABASE_URL": "", "SUPABASE_KEY": "", "REDIS_URL": "", "MEMORY_SNAPSHOT_PATH": ""}
+        if args.backend == "fake-supabase":
+            server = stack.enter_context(BackgroundServer(fake_supabase.build_app(fake), free_port()))
+            env.update({"SUPABASE_URL": server.url, "SUPABASE_KEY": FAKE_SUPABASE_KEY})
+        os.environ.update(env)
+
+        async def measure() -> Dict:
+            database = Database()
+            try:
+                # One short run first so the client and connections are set up
+                await play(database, 1, 1, 1)
+                return {str(turns): await play(database, turns, args.sessions, args.tail) for turns in args.turns}
+            finally:
+                await database.stop()
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = asyncio.run(measure())
+
+    report = {
+        "benchmark": "message_log",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"backend": args.backend, "turns": args.turns, "sessions": args.sessions, "tail": args.tail},
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-message_log.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for turns, result in results.items():
+        print(
+            f"{turns:>4} turns: save p50 {result['save']['p50_ms']}ms, load p50 {result['load']['p50_ms']}ms, "
+            f"{result['bytes_per_session']} bytes written per session "
+            f"(whole-transcript rewrites: {result['legacy_bytes_per_session']})"
+        )
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks import fake_supabase, stub_model, webhook_sink
+
+
+# One scripted conversation per program: the request routes it, then name, then age.
+# {tag} makes every beneficiary distinct, so registrations are not dropped as duplicates.
+# The "ambiguous" one matches no keyword or slot pattern, so only a model (LLM_MODEL) can resolve it.
+CONVERSATIONS = {
+    "emergency_food_aid": [
+        "There is no food left in our village after the flood, this is an emergency",
+        "My name is Amina Yusuf {tag}",
+        "I'm 34 years old",
+    ],
+    "nutrition_support": [
+        "Need help with nutrition for my baby, my wife is pregnant",
+        "My name is Priya Sharma {tag}",
+        "I'm 27 years old",
+    ],
+    "general_food_access": [
+        "Looking for help buying groceries for my family this month",
+        "My name is Carlos Mendez {tag}",
+        "I'm 52 years old",
+    ],
+    "ambiguous": [
+        "Hello, can someone help our family please",
+        "Amina Yusuf {tag}",
+        "34",
+    ],
+}
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Any JWT-shaped string works against the fake REST API
+FAKE_SUPABASE_KEY = "bench.bench.bench"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Resident set size of a process (Linux only; None elsewhere)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def tree_rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process plus all its descendants, e.g. uvicorn and its workers"""
+    total = rss_bytes(pid)
+    if total is None:
+        return None
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                for child in f.read().split():
+                    total += tree_rss_bytes(int(child)) or 0
+    except OSError:
+        pass
+    return total
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float]) -> Dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+class BackgroundServer:
+    def __init__(self, app, port: int, **options):
+        """Run an ASGI app with uvicorn in a daemon thread; `options` go to uvicorn.Config (e.g. ssl_certfile)"""
+        self.port = port
+        self.scheme = "https" if options.get("ssl_certfile") else "http"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", **options))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"{self.scheme}://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+async def run_conversation(client: httpx.AsyncClient, script: List[str], samples: Dict) -> bool:
+    """Play one scripted conversation; returns False if any turn failed"""
+    session_id = None
+    tag = "".join(random.choices(string.ascii_lowercase, k=8))
+    for turn, message in enumerate(script, start=1):
+        payload = {"message": message.format(tag=tag)}
+        if session_id:
+            payload["session_id"] = session_id
+        start = time.perf_counter()
+        try:
+            response = await client.post("/chat", json=payload)
+        except httpx.HTTPError:
+            samples["errors"] += 1
+            return False
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            samples["errors"] += 1
+            return False
+        session_id = response.json()["session_id"]
+        samples["all"].append(elapsed)
+        samples["per_turn"].setdefault(turn, []).append(elapsed)
+    return True
+
+
+async def drive(client: httpx.AsyncClient, conversations: int, concurrency: int) -> Dict:
+    """Run `conversations` scripted conversations, `concurrency` at a time, cycling through programs"""
+    scripts = list(CONVERSATIONS.values())
+    samples = {"all": [], "per_turn": {}, "errors": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            await run_conversation(client, scripts[index % len(scripts)], samples)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(conversations)))
+    samples["duration"] = time.perf_counter() - start
+    return samples
+
+
+async def run_asgi(args, env: Dict[str, str]) -> Dict:
+    """Benchmark main.app in this process through the ASGI transport"""
+    os.environ.update(env)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import main
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                await drive(client, args.warmup, args.concurrency)
+                gc.collect()
+                rss_before = rss_bytes()
+                samples = await drive(client, args.conversations, args.concurrency)
+                gc.collect()
+                rss_after = rss_bytes()
+                health = (await client.get("/health")).json()
+            # Let the outbox deliver what is queued before shutting down
+            await asyncio.sleep(args.drain_seconds)
+    return {"samples": samples, "rss_before": rss_before, "rss_after": rss_after, "health": health}
+
+
+async def run_uvicorn(args, env: Dict[str, str]) -> Dict:
+    """Benchmark main.app served by a separate uvicorn process"""
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--workers", str(args.workers)
+        ],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("uvicorn did not start")
+                await asyncio.sleep(0.1)
+
+            await drive(client, args.warmup, args.concurrency)
+            rss_before = tree_rss_bytes(process.pid)
+            samples = await drive(client, args.conversations, args.concurrency)
+            rss_after = tree_rss_bytes(process.pid)
+            health = (await client.get("/health")).json()
+            await asyncio.sleep(args.drain_seconds)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"samples": samples, "rss_before": rss_before, "rss_after": rss_after, "health": health}
+
+
+def build_report(
+    args,
+    run: Dict,
+    supabase_stats: Optional[Dict],
+    sink_stats: Dict,
+    model_stats: Optional[Dict] = None
+) -> Dict:
+    samples = run["samples"]
+    requests = len(samples["all"])
+    memory = {"rss_before_bytes": run["rss_before"], "rss_after_bytes": run["rss_after"], "bytes_per_session": None}
+    if run["rss_before"] is not None and run["rss_after"] is not None and args.conversations:
+        memory["bytes_per_session"] = round((run["rss_after"] - run["rss_before"]) / args.conversations)
+
+    return {
+        "benchmark": "chat",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {
+            "mode": args.mode,
+            "backend": args.backend,
+            "workers": args.workers if args.mode == "uvicorn" else 1,
+            "redis": bool(args.redis_url),
+            "conversations": args.conversations,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "db_latency_ms": args.db_latency_ms,
+            "webhook_latency_ms": args.webhook_latency_ms,
+            "webhook_failure_rate": args.webhook_failure_rate,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_budget_ms": args.llm_budget_ms if args.llm_latency_ms is not None else None,
+        },
+        "results": {
+            "requests": requests,
+            "errors": samples["errors"],
+            "duration_s": round(samples["duration"], 3),
+            "requests_per_sec": round(requests / samples["duration"], 2) if samples["duration"] else 0.0,
+            "latency": summarize(samples["all"]),
+            "latency_by_turn": {str(turn): summarize(values) for turn, values in sorted(samples["per_turn"].items())},
+            "memory": memory,
+            "session_cache": run["health"].get("session_cache"),
+            "supabase": supabase_stats,
+            "webhook_sink": sink_stats,
+            # Per worker: lookups by outcome and the cache hit ratio, plus what reached the stub model
+            "model": {**run["health"]["model"], "stub": model_stats} if "model" in run["health"] else None,
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Load-test /chat with scripted multi-turn conversations")
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi",
+                        help="drive the app in-process through ASGI, or a real uvicorn server")
+    parser.add_argument("--backend", choices=["mock", "fake-supabase"], default="fake-supabase",
+                        help="Database mock mode, or a local fake of the Supabase REST API")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (uvicorn mode only)")
+    parser.add_argument("--redis-url", default="", help="REDIS_URL for the app, to share state, locks and cache between workers")
+    parser.add_argument("--conversations", type=int, default=300, help="scripted conversations to run (3 turns each)")
+    parser.add_argument("--concurrency", type=int, default=20, help="conversations in flight at once")
+    parser.add_argument("--warmup", type=int, default=15, help="conversations run before measuring")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="added latency per fake Supabase request")
+    parser.add_argument("--webhook-latency-ms", type=float, default=50.0, help="latency of the webhook sink")
+    parser.add_argument("--webhook-failure-rate", type=float, default=0.0, help="fraction of webhooks answered with 503")
+    parser.add_argument("--llm-latency-ms", type=float, default=None,
+                        help="serve a local stub LLM with this latency and route ambiguous turns to it (default: no model)")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0, help="extra random stub LLM latency, up to this much")
+    parser.add_argument("--llm-budget-ms", type=float, default=800.0, help="LLM_BUDGET_MS for the app")
+    parser.add_argument("--drain-seconds", type=float, default=1.0, help="time left for the outbox to deliver before shutdown")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-<mode>.json)")
+    args = parser.parse_args(argv)
+
+    sink = webhook_sink.WebhookSink(args.webhook_latency_ms / 1000, args.webhook_failure_rate)
+    fake = fake_supabase.FakeSupabase(args.db_latency_ms / 1000)
+    spool_dir = tempfile.mkdtemp(prefix="zha-bench-")
+
+    with contextlib.ExitStack() as stack:
+        sink_server = stack.enter_context(BackgroundServer(webhook_sink.build_app(sink), free_port()))
+        env = {
+            "WEBHOOK_URL": f"{sink_server.url}/webhook",
+            "WEBHOOK_SPOOL_PATH": os.path.join(spool_dir, "webhook_outbox.sqlite3"),
+            "SUPABASE_URL": "",
+            "SUPABASE_KEY": "",
+            "REDIS_URL": args.redis_url,
+            "LLM_MODEL": "",
+        }
+        if args.backend == "fake-supabase":
+            supabase_server = stack.enter_context(BackgroundServer(fake_supabase.build_app(fake), free_port()))
+            env["SUPABASE_URL"] = supabase_server.url
+            env["SUPABASE_KEY"] = FAKE_SUPABASE_KEY
+        model = None
+        if args.llm_latency_ms is not None:
+            model = stub_model.StubModel(args.llm_latency_ms / 1000, args.llm_jitter_ms / 1000)
+            model_server = stack.enter_context(BackgroundServer(stub_model.build_app(model), free_port()))
+            env["LLM_MODEL"] = "stub"
+            env["LLM_BASE_URL"] = f"{model_server.url}/v1"
+            env["LLM_BUDGET_MS"] = str(args.llm_budget_ms)
+
+        runner = run_asgi if args.mode == "asgi" else run_uvicorn
+        run = asyncio.run(runner(args, env))
+        report = build_report(
+            args,
+            run,
+            fake.stats() if args.backend == "fake-supabase" else None,
+            sink.stats(),
+            model.stats() if model is not None else None
+        )
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-{args.mode}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    results = report["results"]
+    latency = results["latency"]
+    print(
+        f"{args.mode}/{args.backend}: {results['requests']} requests, {results['errors']} errors, "
+        f"{results['requests_per_sec']} req/s, p50 {latency['p50_ms']}ms, "
+        f"p95 {latency['p95_ms']}ms, p99 {latency['p99_ms']}ms, "
+        f"{results['memory']['bytes_per_session']} bytes/session"
+    )
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
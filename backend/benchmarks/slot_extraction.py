@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.run import DEFAULT_RESULTS_DIR, git_commit
+from slot_extractor import SlotCandidates, extract_slots
+
+
+# English user messages as they arrive at each step of a conversation; tests/test_slot_extractor.py
+# checks extract_slots against legacy_extract on every one of them
+CORPUS = (
+    # Opening requests
+    "There is no food left in our village after the flood, this is an emergency",
+    "Need help with nutrition for my baby, my wife is pregnant",
+    "Looking for help buying groceries for my family this month",
+    "Hello, can someone help our family please",
+    "We have not eaten in two days",
+    "I need emergency food assistance",
+    "I am looking for food support for my elderly mother",
+    "i'm struggling to feed my 3 kids since I lost my job",
+    "Our house burned down and we lost everything including food",
+    "My son is 2 years old and underweight, the clinic said he needs supplements",
+    "Can I get a food parcel delivered? I can't walk to the distribution point",
+    "food",
+    "help",
+    "hi",
+    # Names
+    "My name is Amina Yusuf",
+    "my name is Priya Sharma",
+    "MY NAME IS CARLOS MENDEZ",
+    "I'm Grace",
+    "Im Joseph Otieno",
+    "I am Fatima",
+    "name is Tendai Moyo",
+    "Amina Yusuf",
+    "My name is Amina and I'm 34",
+    "My name is Li Wei, I am 61 years old",
+    "I'm Daniel, 45 years old, and we need food after the drought",
+    "It's Maria",
+    # Ages
+    "I'm 34 years old",
+    "I am 27 years old",
+    "34",
+    "52 years old",
+    "I'm 70",
+    "age is 29",
+    "My age is 41",
+    "aged 66, living alone",
+    "I'll be 30 next month",
+    "I'm 1 year old",
+    "  19  ",
+    "around forty",
+    # Requests once name and age are known
+    "We need rice, beans and cooking oil for a family of six",
+    "I'm looking for baby formula and diapers",
+    "I am pregnant and was told to ask about nutrition support",
+    "Just some groceries to get us through until payday",
+    "aged parents at home need meals",
+    "name is on the ration card already, we need the monthly supply",
+)
+
+
+def legacy_extract(
+    message: str,
+    want_name: bool = True,
+    want_age: bool = True,
+    want_request: bool = True
+) -> SlotCandidates:
+    """ConversationFlow._extract_info_from_message as it was before slot_extractor, returning candidates"""
+    message_lower = message.lower()
+
+    name = None
+    if want_name:
+        name_patterns = [
+            r"my name is ([A-Za-z\s]+)",
+            r"i['']?m ([A-Za-z\s]+)",
+            r"name is ([A-Za-z\s]+)",
+            r"i am ([A-Za-z\s]+)",
+        ]
+        for pattern in name_patterns:
+            match = re.search(pattern, message, re.IGNORECASE)
+            if match:
+                name = match.group(1).strip()
+                break
+
+    age = None
+    if want_age:
+        age_patterns = [
+            r"i['']?m (\d+) years? old",
+            r"age is (\d+)",
+            r"(\d+) years? old",
+            r"aged (\d+)",
+        ]
+        for pattern in age_patterns:
+            match = re.search(pattern, message, re.IGNORECASE)
+            if match:
+                try:
+                    age = int(match.group(1))
+                    break
+                except ValueError:
+                    pass
+
+    is_name_or_age = False
+    if want_request:
+        name_age_patterns = [
+            r"^(my name is|i['']?m|i am|name is)",
+            r"^(age is|i['']?m \d+|aged \d+)",
+            r"^\d+$",  # Just a number (likely age)
+        ]
+        is_name_or_age = any(re.match(pattern, message_lower) for pattern in name_age_patterns)
+
+    return {"name": name, "age": age, "is_name_or_age": is_name_or_age}
+
+
+def per_message_ns(extract, messages: List[str], rounds: int) -> float:
+    """Mean cost of one call with every slot wanted, the most expensive case"""
+    start = time.perf_counter_ns()
+    for _ in range(rounds):
+        for message in messages:
+            extract(message)
+    return (time.perf_counter_ns() - start) / (rounds * len(messages))
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Per-message cost of slot extraction before and after precompiling")
+    parser.add_argument("--rounds", type=int, default=2000, help="passes over the corpus per implementation")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-slot_extraction.json)")
+    args = parser.parse_args(argv)
+
+    messages = list(CORPUS)
+    mismatches = [message for message in messages if extract_slots(message) != legacy_extract(message)]
+    # Warm both up (the legacy patterns go through re's own cache) before timing
+    per_message_ns(legacy_extract, messages, 10)
+    per_message_ns(extract_slots, messages, 10)
+    results = {
+        "messages": len(messages),
+        "legacy_ns": round(per_message_ns(legacy_extract, messages, args.rounds), 1),
+        "precompiled_ns": round(per_message_ns(extract_slots, messages, args.rounds), 1),
+        "mismatches": mismatches,
+    }
+    results["speedup"] = round(results["legacy_ns"] / results["precompiled_ns"], 2)
+
+    report = {
+        "benchmark": "slot_extraction",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"rounds": args.rounds},
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-slot_extraction.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(
+        f"{results['messages']} messages: legacy {results['legacy_ns']}ns/message, "
+        f"precompiled {results['precompiled_ns']}ns/message ({results['speedup']}x), "
+        f"{len(mismatches)} outputs differ"
+    )
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
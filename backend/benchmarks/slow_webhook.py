@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import string
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Mock database, no model; WEBHOOK_URL is pointed at the sink below
+os.environ.update({"SUPABASE_URL": "", "SUPABASE_KEY": "", "REDIS_URL": "", "LLM_MODEL": ""})
+
+from benchmarks import webhook_sink
+from benchmarks.run import CONVERSATIONS, DEFAULT_RESULTS_DIR, BackgroundServer, free_port, git_commit, summarize
+from conversation_flow import ConversationFlow, get_graph
+from database import Database
+from session_store import SessionStore
+from webhook_client import WebhookClient
+
+
+class BlockingWebhookClient(WebhookClient):
+    """The webhook client as it was before the request path went async: a blocking httpx.post"""
+
+    async def send_webhook(self, beneficiary_name, beneficiary_age, assistance_request, program, idempotency_key=None) -> bool:
+        response = httpx.post(
+            self.webhook_url,
+            json={
+                "beneficiary_name": beneficiary_name,
+                "beneficiary_age": beneficiary_age,
+                "assistance_request": assistance_request,
+                "program": program
+            },
+            timeout=10.0
+        )
+        return response.status_code == 200
+
+
+async def drive(flow: ConversationFlow, conversations: int, concurrency: int) -> Dict:
+    """Run scripted conversations straight through ConversationFlow, `concurrency` at a time"""
+    # Only scripts that complete a registration, so every conversation ends with a webhook
+    scripts = [script for program, script in CONVERSATIONS.items() if program != "ambiguous"]
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        session_id = str(uuid.uuid4())
+        tag = "".join(random.choices(string.ascii_lowercase, k=8))
+        async with semaphore:
+            for message in scripts[index % len(scripts)]:
+                start = time.perf_counter()
+                await flow.process_message(message.format(tag=tag), session_id)
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(conversations)))
+    return {"latencies": latencies, "duration": time.perf_counter() - start}
+
+
+def run_mode(blocking: bool, args) -> Dict:
+    """Requests/sec and turn latency for each webhook latency, with the webhook sent inline on the turn"""
+    client_class = BlockingWebhookClient if blocking else WebhookClient
+    results = {}
+    for latency_ms in args.webhook_latency_ms:
+        sink = webhook_sink.WebhookSink(latency=latency_ms / 1000)
+        with BackgroundServer(webhook_sink.build_app(sink), free_port()) as server:
+            os.environ["WEBHOOK_URL"] = f"{server.url}/webhook"
+            # No outbox, so each completing turn waits for its webhook as it did before the outbox existed
+            flow = ConversationFlow(db=SessionStore(Database()), webhook_client=client_class(), outbox=None)
+
+            async def measure():
+                try:
+                    return await drive(flow, args.conversations, args.concurrency)
+                finally:
+                    await flow.webhook_client.aclose()
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                run = asyncio.run(measure())
+        requests = len(run["latencies"])
+        results[str(latency_ms)] = {
+            "requests": requests,
+            "requests_per_sec": round(requests / run["duration"], 2) if run["duration"] else 0.0,
+            "latency": summarize(run["latencies"]),
+            "webhooks": sink.received,
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(
+        description="Chat throughput on one event loop while every registration waits for a slow webhook"
+    )
+    parser.add_argument("--conversations", type=int, default=60, help="scripted conversations per run (3 turns each)")
+    parser.add_argument("--concurrency", type=int, default=20, help="conversations in flight at once")
+    parser.add_argument("--webhook-latency-ms", type=float, nargs="+", default=[0.0, 100.0, 500.0],
+                        help="webhook sink latencies to run")
+    parser.add_argument("--skip-blocking", action="store_true", help="only run the async webhook client")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-slow_webhook.json)")
+    args = parser.parse_args(argv)
+
+    # Compile the graph up front so the first run doesn't pay for it
+    get_graph()
+    results = {"async": run_mode(False, args)}
+    if not args.skip_blocking:
+        results["blocking"] = run_mode(True, args)
+
+    report = {
+        "benchmark": "slow_webhook",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {
+            "conversations": args.conversations,
+            "concurrency": args.concurrency,
+            "webhook_latency_ms": args.webhook_latency_ms,
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-slow_webhook.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for mode, by_latency in results.items():
+        for latency_ms, result in by_latency.items():
+            latency = result["latency"]
+            print(
+                f"{mode:>8} webhook {float(latency_ms):>6.0f}ms: {result['requests_per_sec']} req/s, "
+                f"p50 {latency['p50_ms']}ms, p95 {latency['p95_ms']}ms, {result['webhooks']} webhooks"
+            )
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
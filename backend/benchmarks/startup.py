@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.run import DEFAULT_RESULTS_DIR, free_port, git_commit
+
+
+# Mock mode, no model and no webhook, so only the app itself is measured
+APP_ENV = {
+    "SUPABASE_URL": "",
+    "SUPABASE_KEY": "",
+    "REDIS_URL": "",
+    "WEBHOOK_URL": "",
+    "LLM_MODEL": "",
+}
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self us, cumulative us, depth) for each line of `-X importtime` output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def import_profile(env: Dict[str, str], module: str) -> List[Tuple[str, int, int, int]]:
+    """Import `module` in a fresh interpreter with -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def cold_start(env: Dict[str, str]) -> Dict:
+    """Start uvicorn and time the first /health answer, the end of warm-up and the first /chat"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    timings = {"health_ms": None, "warm_ms": None, "first_chat_ms": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            deadline = start + 60
+            while time.perf_counter() < deadline and process.poll() is None:
+                try:
+                    health = client.get("/health")
+                except httpx.HTTPError:
+                    time.sleep(0.005)
+                    continue
+                elapsed = round((time.perf_counter() - start) * 1000, 1)
+                if timings["health_ms"] is None:
+                    timings["health_ms"] = elapsed
+                if health.json().get("warm", True):
+                    timings["warm_ms"] = elapsed
+                    break
+                time.sleep(0.005)
+            if timings["health_ms"] is None:
+                raise RuntimeError("uvicorn did not start")
+
+            chat_start = time.perf_counter()
+            client.post("/chat", json={"message": "We have no food left after the flood"}).raise_for_status()
+            timings["first_chat_ms"] = round((time.perf_counter() - chat_start) * 1000, 1)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return timings
+
+
+def median(values: List[Optional[float]]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Profile import time and cold start of the app")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters / server starts to take the median of")
+    parser.add_argument("--module", default="main", help="module to profile with -X importtime")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--no-server", action="store_true", help="only profile imports, don't start uvicorn")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/<timestamp>-<commit>-startup.json)")
+    args = parser.parse_args(argv)
+
+    spool_dir = tempfile.mkdtemp(prefix="zha-startup-")
+    env = {**os.environ, **APP_ENV, "WEBHOOK_SPOOL_PATH": os.path.join(spool_dir, "webhook_outbox.sqlite3")}
+
+    import_totals, profiles = [], []
+    for _ in range(args.runs):
+        modules = import_profile(env, args.module)
+        profiles.append(modules)
+        import_totals.append(next(cumulative for name, _, cumulative, depth in modules if name == args.module and depth == 0) / 1000)
+
+    # Slowest third-party/top-level imports of the median run, by cumulative time
+    median_run = sorted(zip(import_totals, range(len(profiles))))[len(profiles) // 2][1]
+    top_imports = sorted(
+        (
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(self_us / 1000, 1)}
+            for name, self_us, cumulative, depth in profiles[median_run]
+            if depth <= 1 and name != args.module
+        ),
+        key=lambda entry: -entry["cumulative_ms"]
+    )[:args.top]
+
+    starts = [] if args.no_server else [cold_start(env) for _ in range(args.runs)]
+    report = {
+        "benchmark": "startup",
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"module": args.module, "runs": args.runs},
+        "results": {
+            "import_ms": median(import_totals),
+            "cold_start": {
+                key: median([start[key] for start in starts])
+                for key in ("health_ms", "warm_ms", "first_chat_ms")
+            } if starts else None,
+            "top_imports": top_imports,
+        },
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{report['git_commit'] or 'nogit'}-startup.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    results = report["results"]
+    print(f"import {args.module}: {results['import_ms']}ms (median of {args.runs})")
+    for entry in top_imports:
+        print(f"  {entry['cumulative_ms']:>8}ms  {entry['module']}")
+    if results["cold_start"]:
+        cold = results["cold_start"]
+        print(f"cold start: /health {cold['health_ms']}ms, warm {cold['warm_ms']}ms, first /chat {cold['first_chat_ms']}ms")
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
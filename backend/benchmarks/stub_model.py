@@ -0,0 +1,117 @@
+import asyncio
+import json
+import random
+import re
+from typing import Dict, Optional
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+# Rough stand-ins for what a real model would pick up
+NUTRITION_RE = re.compile(r"\b(baby|babies|infant|child|children|kids?|pregnan\w*|breastfeed\w*|toddler)\b", re.I)
+EMERGENCY_RE = re.compile(r"\b(flood\w*|fire|evicted|hungry|nothing to eat|emergency|stranded)\b", re.I)
+AGE_RE = re.compile(r"\b(\d{1,3})\b")
+NAME_RE = re.compile(r"^[A-Za-z]+(?: [A-Za-z]+){0,2}$")
+NOT_NAMES = {
+    "hi", "hello", "thanks", "thank", "yes", "no", "ok", "okay", "please", "help",
+    "my", "we", "i", "are", "is", "need", "the", "for", "food",
+}
+
+
+def classify(message: str) -> Dict:
+    if EMERGENCY_RE.search(message):
+        return {"program": "emergency_food_aid"}
+    if NUTRITION_RE.search(message):
+        return {"program": "nutrition_support"}
+    return {"program": "general_food_access"}
+
+
+def extract(message: str, fields: str) -> Dict:
+    text = message.strip().rstrip(".!")
+    answer: Dict[str, Optional[object]] = {"name": None, "age": None, "assistance_request": None}
+    age = AGE_RE.search(text)
+    if "age" in fields and age and 0 < int(age.group(1)) <= 130:
+        answer["age"] = int(age.group(1))
+    looks_like_name = bool(NAME_RE.match(text)) and not (set(text.lower().split()) & NOT_NAMES)
+    if "name" in fields and looks_like_name:
+        answer["name"] = text.title()
+    if "assistance_request" in fields and not looks_like_name and not age and len(text) > 8:
+        answer["assistance_request"] = text
+    return answer
+
+
+class StubModel:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0):
+        """
+        Local OpenAI-compatible chat completions endpoint answering the backend's
+        classify/extract prompts with simple rules after `latency` (+ up to `jitter`) seconds.
+
+        A `failure_rate` fraction of requests get a 500.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.received = 0
+        self.failed = 0
+
+    async def handle(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        self.received += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.failed += 1
+            return JSONResponse({"error": {"message": "stub failure"}}, status_code=500)
+
+        messages = body.get("messages", [])
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        if system.startswith("Task: classify"):
+            answer = classify(user)
+        else:
+            wanted = re.search(r"Fields wanted: ([^.]*)\.", system)
+            answer = extract(user, wanted.group(1) if wanted else "")
+
+        return JSONResponse({
+            "id": f"stub-{self.received}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(answer)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    def stats(self) -> Dict:
+        return {"received": self.received, "failed": self.failed}
+
+
+def build_app(model: StubModel) -> Starlette:
+    """Starlette app serving /v1/chat/completions (use http://host:port/v1 as LLM_BASE_URL)"""
+    async def stats(request: Request) -> JSONResponse:
+        return JSONResponse(model.stats())
+
+    return Starlette(routes=[
+        Route("/_stats", stats),
+        Route("/v1/chat/completions", model.handle, methods=["POST"]),
+    ])
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a local stub LLM")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    model = StubModel(args.latency_ms / 1000, args.jitter_ms / 1000, args.failure_rate)
+    uvicorn.run(build_app(model), host="127.0.0.1", port=args.port, log_level="warning")
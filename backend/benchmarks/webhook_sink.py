@@ -0,0 +1,72 @@
+import asyncio
+import json
+import random
+from typing import Dict
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class WebhookSink:
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        """
+        Local webhook endpoint that accepts registrations after `latency` seconds.
+
+        A `failure_rate` fraction of requests get a 503 so retry paths can be exercised.
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.received = 0
+        self.failed = 0
+        self.duplicates = 0
+        self._keys = set()
+
+    async def handle(self, request: Request) -> JSONResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.failed += 1
+            return JSONResponse({"ok": False}, status_code=503)
+
+        try:
+            body = json.loads(await request.body())
+        except ClientDisconnect:
+            # The app shut down its outbox mid-delivery
+            return JSONResponse({"ok": False}, status_code=499)
+        items = body.get("registrations", [body]) if isinstance(body, dict) else body
+        for item in items:
+            key = item.get("idempotency_key") or request.headers.get("idempotency-key")
+            if key is not None and key in self._keys:
+                self.duplicates += 1
+            elif key is not None:
+                self._keys.add(key)
+            self.received += 1
+        return JSONResponse({"ok": True})
+
+    def stats(self) -> Dict:
+        return {"received": self.received, "failed": self.failed, "duplicates": self.duplicates}
+
+
+def build_app(sink: WebhookSink) -> Starlette:
+    """Starlette app accepting webhooks on any POST path"""
+    async def stats(request: Request) -> JSONResponse:
+        return JSONResponse(sink.stats())
+
+    return Starlette(routes=[
+        Route("/_stats", stats),
+        Route("/{path:path}", sink.handle, methods=["POST"]),
+    ])
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a local webhook sink")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    sink = WebhookSink(args.latency_ms / 1000, args.failure_rate)
+    uvicorn.run(build_app(sink), host="127.0.0.1", port=args.port, log_level="warning")
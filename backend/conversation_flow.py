@@ -1,8 +1,29 @@
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Literal
-import re
-from database import Database
+import asyncio
+import copy
+import inspect
+import os
+import random
+import threading
+from typing import TypedDict, Dict, List, Literal, Set, Tuple
+from database import ConcurrentUpdateError, SLOT_FIELDS
+from session_store import SessionStore
+from intent_classifier import IntentClassifier
+from message_catalog import MessageCatalog
+from model_assist import ModelAssistant
+from metrics import timed, ROUTING_DECISIONS, SLOTS_FILLED, REGISTRATIONS_COMPLETED
+from slot_extractor import extract_slots
 from webhook_client import WebhookClient
+from webhook_outbox import WebhookOutbox
+from registration_dedup import RegistrationDedup
+
+# Program keyword classifier, built once per process
+KEYWORD_CLASSIFIER = IntentClassifier.from_file()
+
+
+PROGRAMS = ("emergency_food_aid", "nutrition_support", "general_food_access")
+
+# Replies in every supported language, rendered once per process
+MESSAGE_CATALOG = MessageCatalog.from_file(PROGRAMS)
 
 
 class ConversationState(TypedDict):
@@ -13,58 +34,124 @@ class ConversationState(TypedDict):
     beneficiary_age: int | None
     assistance_request: str | None
     current_node: str
+    saved_message_count: int
+    version: int | None
+    # Slot fields changed since the state was loaded; only these are written on save
+    dirty_slots: Set[str]
+
+
+def set_slot(state: ConversationState, field: str, value):
+    """Set a slot field and mark it for the next save, unless it already has that value"""
+    if state.get(field) != value:
+        state[field] = value
+        state.setdefault("dirty_slots", set()).add(field)
+
+
+def _flow_method(name: str):
+    """Graph node/edge that calls ConversationFlow.<name> on the flow passed in the run config"""
+    # `config` is left unannotated: langgraph resolves node type hints, and RunnableConfig is only imported lazily
+    async def call(state: ConversationState, config):
+        result = getattr(config["configurable"]["flow"], name)(state)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+    call.__name__ = name
+    return call
+
+
+def build_graph():
+    """Build and compile the LangGraph conversation workflow"""
+    # Imported here: langgraph is by far the slowest import, and fast-path turns never need it
+    from langgraph.graph import StateGraph, END
+    
+    workflow = StateGraph(ConversationState)
+    
+    # Add nodes
+    workflow.add_node("start", _flow_method("start_node"))
+    workflow.add_node("router", _flow_method("router_node"))
+    workflow.add_node("emergency_food_aid", _flow_method("emergency_food_aid_node"))
+    workflow.add_node("nutrition_support", _flow_method("nutrition_support_node"))
+    workflow.add_node("general_food_access", _flow_method("general_food_access_node"))
+    
+    # Add edges
+    workflow.set_entry_point("start")
+    
+    # Conditional: skip router if program is already set
+    workflow.add_conditional_edges(
+        "start",
+        _flow_method("_should_skip_router_check"),
+        {
+            "router": "router",
+            "emergency_food_aid": "emergency_food_aid",
+            "nutrition_support": "nutrition_support",
+            "general_food_access": "general_food_access",
+        }
+    )
+    
+    # Conditional routing from router
+    workflow.add_conditional_edges(
+        "router",
+        _flow_method("route_to_program"),
+        {
+            "emergency_food_aid": "emergency_food_aid",
+            "nutrition_support": "nutrition_support",
+            "general_food_access": "general_food_access",
+        }
+    )
+    
+    # All program nodes end after processing one message
+    # The next user message will restart the flow
+    workflow.add_edge("emergency_food_aid", END)
+    workflow.add_edge("nutrition_support", END)
+    workflow.add_edge("general_food_access", END)
+    
+    return workflow.compile()
+
+
+# Compiled once per process, on first use or during startup warm-up, and shared
+# by every ConversationFlow; each run passes its flow in config["configurable"]["flow"]
+_compiled_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """Return the shared compiled graph, building it on first call (safe to call from a thread)"""
+    global _compiled_graph
+    if _compiled_graph is None:
+        with _graph_lock:
+            if _compiled_graph is None:
+                _compiled_graph = build_graph()
+    return _compiled_graph
 
 
 class ConversationFlow:
-    def __init__(self):
-        self.db = Database()
-        self.webhook_client = WebhookClient()
-        self.build_graph()
-    
-    def build_graph(self):
-        """Build the LangGraph conversation workflow"""
-        workflow = StateGraph(ConversationState)
-        
-        # Add nodes
-        workflow.add_node("start", self.start_node)
-        workflow.add_node("router", self.router_node)
-        workflow.add_node("emergency_food_aid", self.emergency_food_aid_node)
-        workflow.add_node("nutrition_support", self.nutrition_support_node)
-        workflow.add_node("general_food_access", self.general_food_access_node)
-        
-        # Add edges
-        workflow.set_entry_point("start")
-        
-        # Conditional: skip router if program is already set
-        workflow.add_conditional_edges(
-            "start",
-            self._should_skip_router_check,
-            {
-                "router": "router",
-                "emergency_food_aid": "emergency_food_aid",
-                "nutrition_support": "nutrition_support",
-                "general_food_access": "general_food_access",
-            }
-        )
-        
-        # Conditional routing from router
-        workflow.add_conditional_edges(
-            "router",
-            self.route_to_program,
-            {
-                "emergency_food_aid": "emergency_food_aid",
-                "nutrition_support": "nutrition_support",
-                "general_food_access": "general_food_access",
-            }
-        )
-        
-        # All program nodes end after processing one message
-        # The next user message will restart the flow
-        workflow.add_edge("emergency_food_aid", END)
-        workflow.add_edge("nutrition_support", END)
-        workflow.add_edge("general_food_access", END)
-        
-        self.graph = workflow.compile()
+    def __init__(
+        self,
+        db: SessionStore | None = None,
+        webhook_client: WebhookClient | None = None,
+        outbox: WebhookOutbox | None = None,
+        classifier: IntentClassifier | None = None,
+        dedup: RegistrationDedup | None = None,
+        assistant: ModelAssistant | None = None,
+        catalog: MessageCatalog | None = None
+    ):
+        self.db = db or SessionStore()
+        self.webhook_client = webhook_client or WebhookClient()
+        # When set, completed registrations are queued instead of sent inline
+        self.outbox = outbox
+        # When set, repeat registrations of a recent beneficiary are not sent again
+        self.dedup = dedup
+        self.classifier = classifier or KEYWORD_CLASSIFIER
+        self.catalog = catalog or MESSAGE_CATALOG
+        # Optional LLM fallback for turns the keywords and slot patterns leave unresolved (LLM_MODEL)
+        self.assistant = assistant if assistant is not None else ModelAssistant.from_env()
+        # Load/run/save attempts per turn when another worker saved the session first (at least one)
+        self.max_save_attempts = max(1, int(os.getenv("MAX_SAVE_ATTEMPTS", "3")))
+        # Slot-only turns (program already set) call the program node directly
+        self.fast_path = os.getenv("GRAPH_FAST_PATH", "true").lower() != "false"
+        self._graph_config = {"configurable": {"flow": self}}
+        # Streamed turns still saving after their client went away
+        self._turn_tasks: Set[asyncio.Task] = set()
     
     def start_node(self, state: ConversationState) -> ConversationState:
         """Initial node that receives user message"""
@@ -84,34 +171,23 @@ class ConversationFlow:
         else:
             return "router"
     
-    def router_node(self, state: ConversationState) -> ConversationState:
+    @timed("router_node")
+    async def router_node(self, state: ConversationState) -> ConversationState:
         """Classify user intent into one of three programs"""
         messages = state.get("messages", [])
         if not messages:
-            state["program"] = "general_food_access"
+            set_slot(state, "program", "general_food_access")
             return state
         
-        last_message = messages[-1].get("content", "").lower()
-        
-        # Emergency Food Aid keywords
-        emergency_keywords = [
-            "no food", "hunger crisis", "starving", "disaster", "displacement",
-            "urgent", "immediate", "emergency", "no food available", "crisis"
-        ]
-        
-        # Nutrition Support keywords
-        nutrition_keywords = [
-            "nutrition", "malnutrition", "child nutrition", "maternal",
-            "pregnant", "lactating", "breastfeeding", "dietary", "pregnancy"
-        ]
-        
-        # Check for emergency first (highest priority)
-        if any(keyword in last_message for keyword in emergency_keywords):
-            state["program"] = "emergency_food_aid"
-        elif any(keyword in last_message for keyword in nutrition_keywords):
-            state["program"] = "nutrition_support"
-        else:
-            state["program"] = "general_food_access"
+        last_message = messages[-1].get("content", "")
+        
+        # Emergency keywords take priority over nutrition keywords (see program_keywords.json)
+        classification = self.classifier.classify(last_message)
+        program = classification["program"]
+        if self.assistant is not None and not classification["matches"] and last_message.strip():
+            # No keyword matched, so the program above is only the default; ask the model
+            program = await self.assistant.classify(last_message, PROGRAMS) or program
+        set_slot(state, "program", program)
         
         state["current_node"] = "router"
         return state
@@ -126,19 +202,20 @@ class ConversationFlow:
         else:
             return "general_food_access"
     
-    def emergency_food_aid_node(self, state: ConversationState) -> ConversationState:
+    async def emergency_food_aid_node(self, state: ConversationState) -> ConversationState:
         """Handle Emergency Food Aid program - collect beneficiary info"""
-        return self._collect_beneficiary_info(state, "emergency_food_aid")
+        return await self._collect_beneficiary_info(state, "emergency_food_aid")
     
-    def nutrition_support_node(self, state: ConversationState) -> ConversationState:
+    async def nutrition_support_node(self, state: ConversationState) -> ConversationState:
         """Handle Nutrition Support program - collect beneficiary info"""
-        return self._collect_beneficiary_info(state, "nutrition_support")
+        return await self._collect_beneficiary_info(state, "nutrition_support")
     
-    def general_food_access_node(self, state: ConversationState) -> ConversationState:
+    async def general_food_access_node(self, state: ConversationState) -> ConversationState:
         """Handle General Food Access program - collect beneficiary info"""
-        return self._collect_beneficiary_info(state, "general_food_access")
+        return await self._collect_beneficiary_info(state, "general_food_access")
     
-    def _collect_beneficiary_info(
+    @timed("_collect_beneficiary_info")
+    async def _collect_beneficiary_info(
         self, 
         state: ConversationState, 
         program: str
@@ -148,7 +225,10 @@ class ConversationFlow:
         last_message = messages[-1].get("content", "") if messages else ""
         
         # Extract information from user message
-        self._extract_info_from_message(state, last_message)
+        filled = self._extract_info_from_message(state, last_message)
+        if self.assistant is not None and not filled and last_message.strip():
+            # The patterns found nothing in this message; the model may read it better
+            await self._extract_info_with_model(state, last_message)
         
         # Check what's missing and ask for one thing at a time
         missing_info = []
@@ -160,29 +240,20 @@ class ConversationFlow:
         if not state.get("assistance_request"):
             missing_info.append("assistance_request")
         
+        # Reply in the language the beneficiary has been writing in
+        locale = self.catalog.session_locale(messages)
+        
         # Generate response based on what's missing
         if missing_info:
             # Ask for the first missing piece of information
             response = self._generate_clarification_question(
                 missing_info[0], 
-                program
+                program,
+                locale
             )
         else:
-            # All information collected - trigger webhook and prepare completion message
-            name = state.get("beneficiary_name")
-            age = state.get("beneficiary_age")
-            request = state.get("assistance_request")
-            
-            if name and age is not None and request:
-                # Trigger webhook
-                self.webhook_client.send_webhook(
-                    beneficiary_name=name,
-                    beneficiary_age=age,
-                    assistance_request=request,
-                    program=program
-                )
-            
-            response = self._generate_completion_message(program)
+            # All information collected - the caller triggers the webhook once the state is saved
+            response = self._generate_completion_message(program, locale)
         
         # Add AI response to messages
         state["messages"].append({
@@ -190,140 +261,420 @@ class ConversationFlow:
             "content": response
         })
         
-        # Update database
-        self.db.save_conversation(
-            session_id=state["session_id"],
-            program=program,
-            beneficiary_name=state.get("beneficiary_name"),
-            beneficiary_age=state.get("beneficiary_age"),
-            assistance_request=state.get("assistance_request"),
-            messages=state["messages"]
-        )
-        
+        # The caller persists the state once the graph has finished
+        set_slot(state, "program", program)
         state["current_node"] = program
         return state
     
-    def _extract_info_from_message(self, state: ConversationState, message: str):
-        """Extract beneficiary information from user message"""
-        message_lower = message.lower()
-        
-        # Try to extract name (simple heuristic: look for "my name is" or "I'm" patterns)
-        if not state.get("beneficiary_name"):
-            name_patterns = [
-                r"my name is ([A-Za-z\s]+)",
-                r"i['']?m ([A-Za-z\s]+)",
-                r"name is ([A-Za-z\s]+)",
-                r"i am ([A-Za-z\s]+)",
-            ]
-            for pattern in name_patterns:
-                match = re.search(pattern, message, re.IGNORECASE)
-                if match:
-                    state["beneficiary_name"] = match.group(1).strip()
-                    break
-        
-        # Try to extract age
-        if state.get("beneficiary_age") is None:
-            age_patterns = [
-                r"i['']?m (\d+) years? old",
-                r"age is (\d+)",
-                r"(\d+) years? old",
-                r"aged (\d+)",
-            ]
-            for pattern in age_patterns:
-                match = re.search(pattern, message, re.IGNORECASE)
-                if match:
-                    try:
-                        state["beneficiary_age"] = int(match.group(1))
-                        break
-                    except ValueError:
-                        pass
+    @timed("_extract_info_from_message")
+    def _extract_info_from_message(self, state: ConversationState, message: str) -> bool:
+        """Extract beneficiary information from user message; returns True if any slot was filled or none was wanted"""
+        want_name = not state.get("beneficiary_name")
+        want_age = state.get("beneficiary_age") is None
+        want_request = not state.get("assistance_request")
+        if not (want_name or want_age or want_request):
+            return True
+        
+        candidates = extract_slots(message, want_name, want_age, want_request)
+        filled = False
+        
+        # Name (simple heuristic: look for "my name is" or "I'm" patterns)
+        if candidates["name"] is not None:
+            set_slot(state, "beneficiary_name", candidates["name"])
+            filled = True
+        
+        # Age
+        if candidates["age"] is not None:
+            set_slot(state, "beneficiary_age", candidates["age"])
+            filled = True
         
         # Extract assistance request (if user provides detailed request)
         # Only extract if message is substantial and doesn't match name/age patterns
+        if want_request and not candidates["is_name_or_age"] and len(message.strip()) > 15:
+            # Substantial message that's not just name/age - treat as assistance request
+            set_slot(state, "assistance_request", message.strip())
+            filled = True
+        
+        return filled
+    
+    async def _extract_info_with_model(self, state: ConversationState, message: str):
+        """Fill still-missing slots from the model's reading of the message"""
+        fields = []
+        if not state.get("beneficiary_name"):
+            fields.append("name")
+        if state.get("beneficiary_age") is None:
+            fields.append("age")
         if not state.get("assistance_request"):
-            name_age_patterns = [
-                r"^(my name is|i['']?m|i am|name is)",
-                r"^(age is|i['']?m \d+|aged \d+)",
-                r"^\d+$",  # Just a number (likely age)
-            ]
-            is_name_or_age = any(re.match(pattern, message_lower) for pattern in name_age_patterns)
-            
-            if not is_name_or_age and len(message.strip()) > 15:
-                # Substantial message that's not just name/age - treat as assistance request
-                state["assistance_request"] = message.strip()
+            fields.append("assistance_request")
+        
+        slots = await self.assistant.extract(message, fields)
+        if "name" in slots:
+            set_slot(state, "beneficiary_name", slots["name"])
+        if "age" in slots:
+            set_slot(state, "beneficiary_age", slots["age"])
+        if "assistance_request" in slots:
+            set_slot(state, "assistance_request", slots["assistance_request"])
     
-    def _generate_clarification_question(self, missing_field: str, program: str) -> str:
+    def _generate_clarification_question(self, missing_field: str, program: str, locale: str = "en") -> str:
         """Generate a clarification question for missing information"""
-        program_names = {
-            "emergency_food_aid": "Emergency Food Aid",
-            "nutrition_support": "Nutrition Support Program",
-            "general_food_access": "General Food Access Program"
-        }
-        
-        program_name = program_names.get(program, "Food Assistance")
-        
-        if missing_field == "name":
-            return f"Thank you for reaching out to the {program_name}. To assist you better, may I please have your name?"
-        
-        elif missing_field == "age":
-            return "Could you please share your age? This helps us provide appropriate assistance."
-        
-        elif missing_field == "assistance_request":
-            return "Please tell me more about your food assistance needs. What specific help are you looking for?"
-        
-        return "I need a bit more information to help you. Could you please provide more details?"
+        return self.catalog.message(locale, program, missing_field)
     
-    def _generate_completion_message(self, program: str) -> str:
+    def _generate_completion_message(self, program: str, locale: str = "en") -> str:
         """Generate completion message when all info is collected"""
-        program_names = {
-            "emergency_food_aid": "Emergency Food Aid",
-            "nutrition_support": "Nutrition Support Program",
-            "general_food_access": "General Food Access Program"
+        return self.catalog.message(locale, program, "completion")
+    
+    
+    @staticmethod
+    def new_state(session_id: str) -> ConversationState:
+        """Initial state for a conversation with no saved history"""
+        return {
+            "messages": [],
+            "session_id": session_id,
+            "program": None,
+            "beneficiary_name": None,
+            "beneficiary_age": None,
+            "assistance_request": None,
+            "current_node": "start",
+            "saved_message_count": 0,
+            "version": None,
+            "dirty_slots": set()
         }
-        
-        program_name = program_names.get(program, "Food Assistance")
-        
-        return (
-            f"Thank you for providing all the necessary information. "
-            f"I've registered your request with the {program_name}. "
-            f"Your information has been submitted and our team will contact you shortly to assist you further."
-        )
     
+    @staticmethod
+    def slot_values(state: ConversationState) -> Dict:
+        """A state's slot fields, taken before a turn to pass to turn_metrics after it"""
+        return {field: state.get(field) for field in SLOT_FIELDS}
     
-    async def process_message(self, message: str, session_id: str) -> dict:
-        """Process a user message through the conversation flow"""
-        # Load existing conversation state from database
-        state = self.db.load_conversation_state(session_id)
-        
-        if not state:
-            # Initialize new conversation
-            state = {
-                "messages": [],
-                "session_id": session_id,
-                "program": None,
-                "beneficiary_name": None,
-                "beneficiary_age": None,
-                "assistance_request": None,
-                "current_node": "start"
-            }
-        
-        # Add user message
+    @staticmethod
+    def turn_metrics(before: Dict, state: ConversationState) -> List[tuple]:
+        """
+        The (counter, label) increments a finished turn earns, given its slot values
+        from before the turn. Callers record them once the turn is saved, so a turn
+        retried after a concurrent update, or never saved, is not counted.
+        """
+        program = state.get("program")
+        increments = []
+        if before["program"] not in PROGRAMS:
+            # Only turns without a program go through router_node
+            increments.append((ROUTING_DECISIONS, program))
+        for field, slot in (
+            ("beneficiary_name", "name"),
+            ("beneficiary_age", "age"),
+            ("assistance_request", "assistance_request")
+        ):
+            # Slots are only filled while empty, so any change is a fill
+            if state.get(field) is not None and state.get(field) != before[field]:
+                increments.append((SLOTS_FILLED, slot))
+        if state.get("beneficiary_name") and state.get("beneficiary_age") is not None and state.get("assistance_request"):
+            # The turn's reply was the completion message
+            increments.append((REGISTRATIONS_COMPLETED, program))
+        return increments
+    
+    @staticmethod
+    def record_metrics(increments: List[tuple]):
+        for counter, label in increments:
+            counter.inc(label)
+    
+    @timed("turn")
+    async def run_turn(self, state: ConversationState, message: str) -> ConversationState:
+        """Append a user message and run it through the graph without persisting"""
         state["messages"].append({
             "role": "user",
             "content": message
         })
         
-        # Run through graph
-        final_state = self.graph.invoke(state)
+        program = state.get("program")
+        if self.fast_path and program in PROGRAMS:
+            # Same result as start -> _should_skip_router_check -> program node
+            return await self._collect_beneficiary_info(state, program)
         
-        # Extract last AI message
-        messages = final_state.get("messages", [])
+        return await get_graph().ainvoke(state, self._graph_config)
+    
+    async def save_state(self, state: ConversationState) -> int | None:
+        """
+        Persist a state returned by run_turn and return its new version (None if
+        the write failed); raises ConcurrentUpdateError if it was saved elsewhere.
+        
+        After a failed write the state is left as it was, so its unsaved messages
+        and slots go out with the next save.
+        """
+        version = await self.db.save_conversation(
+            session_id=state["session_id"],
+            program=state.get("program"),
+            beneficiary_name=state.get("beneficiary_name"),
+            beneficiary_age=state.get("beneficiary_age"),
+            assistance_request=state.get("assistance_request"),
+            messages=state["messages"],
+            saved_message_count=state.get("saved_message_count", 0),
+            expected_version=state.get("version"),
+            changed_slots=state.get("dirty_slots", ())
+        )
+        if version is None:
+            return None
+        # Keep only the recent window in memory, as a fresh load would
+        window = self.db.message_window
+        if len(state["messages"]) > window:
+            state["messages"] = state["messages"][-window:] if window > 0 else []
+        state["saved_message_count"] = len(state["messages"])
+        state["version"] = version
+        state["dirty_slots"] = set()
+        return version
+    
+    async def dispatch_registration(self, state: ConversationState) -> bool | None:
+        """
+        Trigger the webhook for a saved state whose slots are all filled.
+        
+        Returns None if the registration isn't complete, otherwise whether it
+        was queued (or sent, when no outbox is configured). Repeats of a recent
+        registration by another session are suppressed and return False.
+        """
+        name = state.get("beneficiary_name")
+        age = state.get("beneficiary_age")
+        request = state.get("assistance_request")
+        program = state.get("program")
+        if not (name and age is not None and request and program):
+            return None
+        
+        if self.dedup is not None and not await self.dedup.claim(state["session_id"], name, age, program):
+            return False
+        
+        # Queued for background delivery when an outbox is configured
+        if self.outbox is not None:
+            return await self.outbox.enqueue(
+                session_id=state["session_id"],
+                beneficiary_name=name,
+                beneficiary_age=age,
+                assistance_request=request,
+                program=program
+            )
+        return await self.webhook_client.send_webhook(
+            beneficiary_name=name,
+            beneficiary_age=age,
+            assistance_request=request,
+            program=program
+        )
+    
+    @staticmethod
+    def last_reply(state: ConversationState) -> str:
+        """Extract last AI message"""
+        messages = state.get("messages", [])
         ai_messages = [m for m in messages if m.get("role") == "assistant"]
-        last_ai_message = ai_messages[-1]["content"] if ai_messages else "I'm here to help you with food assistance."
+        return ai_messages[-1]["content"] if ai_messages else "I'm here to help you with food assistance."
+    
+    async def process_message(self, message: str, session_id: str) -> dict:
+        """Process a user message through the conversation flow"""
+        # Turns for one session never interleave within this process; the
+        # version check catches turns that ran in another worker meanwhile
+        for attempt in range(self.max_save_attempts):
+            async with self.db.locks.hold(session_id):
+                # Load existing conversation state from database
+                state = await self.db.load_conversation_state(session_id)
+                
+                if not state:
+                    # Initialize new conversation
+                    state = self.new_state(session_id)
+                
+                # Run through graph, then update database
+                before = self.slot_values(state)
+                final_state = await self.run_turn(state, message)
+                try:
+                    version = await self.save_state(final_state)
+                    break
+                except ConcurrentUpdateError:
+                    if attempt == self.max_save_attempts - 1:
+                        raise
+                    print(f"Concurrent update on session {session_id}, retrying turn")
+            # Jittered pause (outside the lock) so competing workers don't retry in lockstep
+            await asyncio.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+        
+        if version is not None:
+            self.record_metrics(self.turn_metrics(before, final_state))
+            # Only a saved registration is sent, so the webhook never gets ahead of the database
+            await self.dispatch_registration(final_state)
         
         return {
-            "message": last_ai_message,
+            "message": self.last_reply(final_state),
             "session_id": session_id,
-            "state": final_state
+            "state": final_state,
+            # None if the write failed: the reply was never stored and nothing was sent
+            "version": version
         }
-
+    
+    async def process_batch(self, items: List[Tuple[str, str]]) -> List[dict]:
+        """
+        Process (session_id, message) pairs with one bulk load and one bulk save.
+        
+        Sessions run concurrently; turns within a session run in the given order.
+        Each session is saved only if nobody else saved it since the load; like
+        process_message, the turns of those that lost the race are run again on
+        their fresh state. Results are returned in input order, with an "error"
+        key for turns that failed or whose session could not be saved.
+        
+        Raises if the bulk load fails, rather than treating every session as new.
+        """
+        session_ids = [session_id for session_id, _ in items]
+        async with self.db.locks.hold_many(session_ids):
+            return await self._process_batch_locked(items)
+    
+    async def _process_batch_locked(self, items: List[Tuple[str, str]]) -> List[dict]:
+        """process_batch body; the caller holds every session's lock"""
+        # Group item indexes by session, keeping arrival order
+        by_session: dict = {}
+        for index, (session_id, _) in enumerate(items):
+            by_session.setdefault(session_id, []).append(index)
+        
+        results: List[dict] = [None] * len(items)
+        saved_states: List[ConversationState] = []
+        # Sessions still to run; those another worker saved first are run again on their fresh state
+        pending = dict(by_session)
+        for attempt in range(self.max_save_attempts):
+            states = await self.db.load_conversation_states(list(pending))
+            final_states: List[ConversationState] = []
+            # session_id -> metric increments of its turns, recorded if the session is saved
+            increments: dict = {}
+            
+            async def run_session(session_id: str, indexes: List[int]):
+                state = states.get(session_id) or self.new_state(session_id)
+                ran = False
+                for index in indexes:
+                    # A failed turn can leave the state half-updated; its later turns start from before it
+                    snapshot = copy.deepcopy(state)
+                    try:
+                        before = self.slot_values(state)
+                        state = await self.run_turn(state, items[index][1])
+                        increments.setdefault(session_id, []).extend(self.turn_metrics(before, state))
+                        ran = True
+                        results[index] = {"message": self.last_reply(state), "session_id": session_id}
+                    except Exception as e:
+                        state = snapshot
+                        results[index] = {"message": None, "session_id": session_id, "error": str(e)}
+                if ran:
+                    final_states.append(state)
+            
+            await asyncio.gather(*(run_session(sid, indexes) for sid, indexes in pending.items()))
+            versions = await self.db.save_conversations(final_states)
+            
+            conflicts = {}
+            for state in final_states:
+                session_id = state["session_id"]
+                if session_id not in versions:
+                    conflicts[session_id] = by_session[session_id]
+                elif versions[session_id] is not None:
+                    saved_states.append(state)
+                    self.record_metrics(increments.get(session_id, ()))
+                else:
+                    # Nothing this session said in the batch was stored, so none of its turns count
+                    self._fail_items(results, by_session[session_id], session_id, "The conversation could not be saved")
+            if not conflicts:
+                break
+            if attempt == self.max_save_attempts - 1:
+                for session_id, indexes in conflicts.items():
+                    self._fail_items(results, indexes, session_id, "Conversation was updated concurrently, please retry")
+                break
+            print(f"Concurrent update on {len(conflicts)} batched sessions, retrying their turns")
+            pending = conflicts
+            await asyncio.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+        
+        # Registrations are only sent for conversations that were saved
+        await asyncio.gather(*(self.dispatch_registration(state) for state in saved_states))
+        return results
+    
+    @staticmethod
+    def _fail_items(results: List[dict], indexes: List[int], session_id: str, error: str):
+        """Replace the results of a session's turns that weren't stored with `error`"""
+        for index in indexes:
+            if "error" not in results[index]:
+                results[index] = {"message": None, "session_id": session_id, "error": error}
+    
+    async def stream_turn(self, state: ConversationState, message: str):
+        """
+        Run one turn on a resident state, yielding (event, data) as each stage finishes:
+        "reply" as soon as the graph has produced the answer, then "saved", then
+        "webhook" if the registration is complete. If the save fails, "error"
+        (status 503) replaces "saved" and no webhook is sent.
+        
+        The turn runs in its own task, so a client that goes away after "reply"
+        doesn't cancel the save or the webhook.
+        
+        `state` is updated in place, so a long-lived connection can keep reusing it.
+        Raises ConcurrentUpdateError if the session was saved elsewhere since `state` was loaded.
+        """
+        async def turn(emit):
+            async with self.db.locks.hold(state["session_id"]):
+                await self._stream_turn_locked(state, message, emit)
+        
+        async for event in self._detached(turn):
+            yield event
+    
+    async def stream_message(self, message: str, session_id: str):
+        """
+        Load a session and stream one turn; see stream_turn. Like process_message,
+        the turn is run again on the fresh state if another worker saved the session
+        first, in which case "reply" is sent again and replaces the earlier one.
+        """
+        async def turn(emit):
+            for attempt in range(self.max_save_attempts):
+                async with self.db.locks.hold(session_id):
+                    state = await self.db.load_conversation_state(session_id) or self.new_state(session_id)
+                    try:
+                        await self._stream_turn_locked(state, message, emit)
+                        return
+                    except ConcurrentUpdateError:
+                        if attempt == self.max_save_attempts - 1:
+                            raise
+                        print(f"Concurrent update on session {session_id}, retrying turn")
+                await asyncio.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+        
+        async for event in self._detached(turn):
+            yield event
+    
+    async def wait_for_turns(self):
+        """Wait for streamed turns whose clients went away to finish saving"""
+        if self._turn_tasks:
+            await asyncio.gather(*self._turn_tasks, return_exceptions=True)
+    
+    async def _detached(self, turn):
+        """
+        Run `turn(emit)` as a task and yield what it emits. Closing the generator
+        (the client disconnected) stops the yielding but not the task.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def run():
+            try:
+                await turn(events.put_nowait)
+            except Exception as e:
+                events.put_nowait(e)
+            finally:
+                events.put_nowait(None)
+        
+        task = asyncio.create_task(run())
+        # The event loop only keeps weak references to tasks
+        self._turn_tasks.add(task)
+        task.add_done_callback(self._turn_tasks.discard)
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    
+    async def _stream_turn_locked(self, state: ConversationState, message: str, emit):
+        """stream_turn body; the caller holds the session's lock"""
+        session_id = state["session_id"]
+        before = self.slot_values(state)
+        final_state = await self.run_turn(state, message)
+        if final_state is not state:
+            state.update(final_state)
+        emit(("reply", {"response": self.last_reply(state), "session_id": session_id}))
+        
+        if await self.save_state(state) is None:
+            emit(("error", {"status": 503, "detail": "The conversation could not be saved, please retry"}))
+            return
+        self.record_metrics(self.turn_metrics(before, state))
+        emit(("saved", {"session_id": session_id, "version": state.get("version")}))
+        
+        queued = await self.dispatch_registration(state)
+        if queued is not None:
+            emit(("webhook", {"session_id": session_id, "queued": queued}))
@@ -1,122 +1,535 @@
-from supabase import create_client, Client
-import os
-from typing import Optional, Dict, List
+import asyncio
 import json
+import os
+from datetime import datetime, timezone
+from typing import Optional, Dict, Iterable, List, AsyncIterator, TYPE_CHECKING
+from http_pool import HttpPool
+from memory_backend import MemorySessionBackend
+from metrics import STATE_WRITE_BYTES
+from redis_backend import RedisSessionBackend, close_redis
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a conversation was saved by someone else since it was loaded"""
+
+
+class UnsupportedBackendError(Exception):
+    """Raised for an operation the configured session backend cannot perform"""
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO 8601 date or timestamp; ones without an offset are taken as UTC, as Postgres does"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+# Conversation fields a turn can change, besides appending messages
+SLOT_FIELDS = ("program", "beneficiary_name", "beneficiary_age", "assistance_request")
+
+
+def slot_patch(slots: Dict, changed_slots: Optional[Iterable[str]], new_row: bool) -> Dict:
+    """
+    The slot fields a save has to write: those in `changed_slots` (all if None),
+    or for a row that doesn't exist yet every field that is set.
+    """
+    if new_row:
+        return {field: value for field, value in slots.items() if value is not None}
+    if changed_slots is None:
+        return slots
+    return {field: slots[field] for field in SLOT_FIELDS if field in changed_slots}
+
+
+def write_size(patch: Dict, new_messages: List[Dict]) -> int:
+    """JSON size of a save's slot patch and new messages, whichever backend writes them"""
+    if not patch and not new_messages:
+        return 0
+    messages = [[m.get("role"), m.get("content", "")] for m in new_messages]
+    return len(json.dumps([patch, messages], ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+# Columns of a completed registration, in export order
+REGISTRATION_COLUMNS = [
+    "session_id",
+    "program",
+    "beneficiary_name",
+    "beneficiary_age",
+    "assistance_request",
+    "created_at",
+    "updated_at",
+]
 
 
 class Database:
-    def __init__(self):
-        """Initialize Supabase client"""
-        supabase_url = os.getenv("SUPABASE_URL", "")
-        supabase_key = os.getenv("SUPABASE_KEY", "")
-        
-        if not supabase_url or not supabase_key:
-            # For development, use placeholder values
-            print("Warning: SUPABASE_URL and SUPABASE_KEY not set. Using mock mode.")
-            self.client = None
-            self.mock_mode = True
-        else:
-            self.client: Client = create_client(supabase_url, supabase_key)
-            self.mock_mode = False
-    
-    def create_session(self) -> str:
-        """Create a new conversation session"""
-        import uuid
-        session_id = str(uuid.uuid4())
+    def __init__(self, http: Optional[HttpPool] = None):
+        """Initialize Supabase client settings (the async client is created lazily on a shared HTTP pool)"""
+        self.supabase_url = os.getenv("SUPABASE_URL", "")
+        self.supabase_key = os.getenv("SUPABASE_KEY", "")
+        self.client: Optional["AsyncClient"] = None
+        self._client_lock = asyncio.Lock()
+        self._owns_http = http is None
+        self.http = http or HttpPool()
+        # How many recent messages are loaded into the conversation state
+        self.message_window = int(os.getenv("MESSAGE_HISTORY_WINDOW", "20"))
         
-        if self.mock_mode:
-            # Store in memory for testing
-            if not hasattr(self, '_sessions'):
-                self._sessions = {}
-            self._sessions[session_id] = {
-                "session_id": session_id,
-                "program": None,
-                "beneficiary_name": None,
-                "beneficiary_age": None,
-                "assistance_request": None,
-                "messages": []
-            }
-            return session_id
+        # For development, state is kept locally (or in Redis) without Supabase
+        self.mock_mode = not self.supabase_url or not self.supabase_key
         
-        try:
-            # Insert new session into Supabase
-            result = self.client.table("conversations").insert({
-                "session_id": session_id,
-                "program": None,
-                "beneficiary_name": None,
-                "beneficiary_age": None,
-                "assistance_request": None,
-                "messages": []
-            }).execute()
-            return session_id
-        except Exception as e:
-            print(f"Error creating session: {e}")
-            return session_id
+        # Shared state for running several workers (see SessionStore and WebhookOutbox)
+        self.redis_url = os.getenv("REDIS_URL", "")
+        # Without Supabase, state lives in Redis if configured, else in bounded local memory
+        self.redis: Optional[RedisSessionBackend] = None
+        self.memory: Optional[MemorySessionBackend] = None
+        if self.mock_mode and self.redis_url:
+            self.redis = RedisSessionBackend(self.redis_url)
+        elif self.mock_mode:
+            self.memory = MemorySessionBackend()
     
-    def save_conversation(
+    async def start(self):
+        """Create the Supabase client, or restore and start snapshotting the in-memory store in mock mode"""
+        if not self.mock_mode:
+            await self._get_client()
+            return
+        print("Warning: SUPABASE_URL and SUPABASE_KEY not set. Using mock mode.")
+        if self.memory is not None:
+            await self.memory.start()
+    
+    async def stop(self):
+        """Write a final snapshot of the in-memory store and close Redis and (if this created it) HTTP connections"""
+        if self.memory is not None:
+            await self.memory.stop()
+        if self.redis_url:
+            await close_redis()
+        if self._owns_http:
+            await self.http.aclose()
+            self.client = None
+    
+    async def _get_client(self) -> "AsyncClient":
+        """Return the shared async Supabase client, creating it on first use"""
+        if self.client is None:
+            async with self._client_lock:
+                if self.client is None:
+                    # Imported here so startup and mock mode don't pay for the Supabase SDK
+                    from supabase import AsyncClientOptions, acreate_client
+                    self.client = await acreate_client(
+                        self.supabase_url,
+                        self.supabase_key,
+                        options=AsyncClientOptions(httpx_client=self.http.get())
+                    )
+        return self.client
+    
+    async def save_conversation(
         self,
         session_id: str,
         program: Optional[str],
         beneficiary_name: Optional[str],
         beneficiary_age: Optional[int],
         assistance_request: Optional[str],
-        messages: List[Dict]
-    ):
-        """Save conversation state to database"""
+        new_messages: List[Dict],
+        expected_version: Optional[int] = None,
+        changed_slots: Optional[Iterable[str]] = None
+    ) -> Optional[int]:
+        """
+        Save changed slot fields and append only this turn's messages to the message log.
+        
+        Only the fields in `changed_slots` are written (all of them if None). A
+        saved conversation with nothing changed and no new messages is not
+        written at all, and keeps its version.
+        
+        The row is only updated if its version still equals `expected_version`
+        (None means the conversation has never been saved, so it is inserted).
+        Returns the new version, or raises ConcurrentUpdateError on a conflict.
+        """
+        slots = {
+            "program": program,
+            "beneficiary_name": beneficiary_name,
+            "beneficiary_age": beneficiary_age,
+            "assistance_request": assistance_request
+        }
+        patch = slot_patch(slots, changed_slots, new_row=expected_version is None)
+        STATE_WRITE_BYTES.observe(write_size(patch, new_messages))
+        if expected_version is not None and not patch and not new_messages:
+            return expected_version
+        new_version = (expected_version or 0) + 1
+        
+        if self.redis is not None:
+            version = await self.redis.save(session_id, patch, new_messages, expected_version)
+            if version is None:
+                raise ConcurrentUpdateError(session_id)
+            return version
+        
         if self.mock_mode:
-            if hasattr(self, '_sessions') and session_id in self._sessions:
-                self._sessions[session_id].update({
-                    "program": program,
-                    "beneficiary_name": beneficiary_name,
-                    "beneficiary_age": beneficiary_age,
-                    "assistance_request": assistance_request,
-                    "messages": messages
-                })
-            return
+            record = self.memory.get(session_id)
+            if expected_version is None:
+                if record is not None:
+                    raise ConcurrentUpdateError(session_id)
+                record = self.memory.create(session_id)
+            elif record is None or record.version != expected_version:
+                raise ConcurrentUpdateError(session_id)
+            self.memory.update(record, patch, new_messages=new_messages, version=new_version)
+            return new_version
         
+        # Deferred like the rest of the Supabase SDK, which the client below loads anyway
+        from postgrest.exceptions import APIError
         try:
-            # Update conversation in Supabase
-            self.client.table("conversations").update({
-                "program": program,
-                "beneficiary_name": beneficiary_name,
-                "beneficiary_age": beneficiary_age,
-                "assistance_request": assistance_request,
-                "messages": json.dumps(messages)
-            }).eq("session_id", session_id).execute()
+            client = await self._get_client()
+            if expected_version is None:
+                # First save creates the row; if it already exists someone else saved first
+                result = await client.table("conversations").upsert({
+                    "session_id": session_id,
+                    **patch,
+                    "version": new_version
+                }, on_conflict="session_id", ignore_duplicates=True).execute()
+                if not result.data:
+                    raise ConcurrentUpdateError(session_id)
+            else:
+                # Update changed slot fields only if nobody saved in between; the
+                # version is bumped even when only messages were added
+                result = await client.table("conversations").update({
+                    **patch,
+                    "version": new_version
+                }).eq("session_id", session_id).eq("version", expected_version).execute()
+                if not result.data:
+                    raise ConcurrentUpdateError(session_id)
+            
+            # Append the new messages as individual rows
+            if new_messages:
+                await client.table("conversation_messages").insert([
+                    {
+                        "session_id": session_id,
+                        "role": m.get("role"),
+                        "content": m.get("content", "")
+                    }
+                    for m in new_messages
+                ]).execute()
+            return new_version
+        except APIError as e:
+            if e.code == "23505":
+                # Unique violation: another request created the row first
+                raise ConcurrentUpdateError(session_id)
+            print(f"Error saving conversation: {e}")
+        except ConcurrentUpdateError:
+            raise
         except Exception as e:
             print(f"Error saving conversation: {e}")
+        
+        return None
     
-    def load_conversation_state(self, session_id: str) -> Optional[Dict]:
-        """Load conversation state from database"""
+    async def load_conversation_state(
+        self,
+        session_id: str,
+        message_limit: Optional[int] = None
+    ) -> Optional[Dict]:
+        """Load slot fields and the last `message_limit` messages from database"""
+        if message_limit is None:
+            message_limit = self.message_window
+        
+        if self.redis is not None:
+            return await self.redis.load(session_id, message_limit)
+        
         if self.mock_mode:
-            if hasattr(self, '_sessions') and session_id in self._sessions:
-                return self._sessions[session_id]
+            record = self.memory.get(session_id)
+            if record is not None:
+                messages = record.messages(message_limit)
+                return {
+                    "messages": messages,
+                    "session_id": session_id,
+                    "program": record.program,
+                    "beneficiary_name": record.beneficiary_name,
+                    "beneficiary_age": record.beneficiary_age,
+                    "assistance_request": record.assistance_request,
+                    "current_node": "start",
+                    "saved_message_count": len(messages),
+                    "version": record.version
+                }
             return None
         
         try:
-            result = self.client.table("conversations").select("*").eq(
+            # Fetch slot fields plus only the newest message rows in one request
+            client = await self._get_client()
+            result = await client.table("conversations").select(
+                "program,beneficiary_name,beneficiary_age,assistance_request,version,"
+                "conversation_messages(id,role,content)"
+            ).eq(
                 "session_id", session_id
+            ).order(
+                "id", desc=True, foreign_table="conversation_messages"
+            ).limit(
+                message_limit, foreign_table="conversation_messages"
             ).execute()
             
             if result.data:
-                row = result.data[0]
-                messages = row.get("messages", [])
-                if isinstance(messages, str):
-                    messages = json.loads(messages)
-                
-                return {
-                    "messages": messages,
-                    "session_id": session_id,
-                    "program": row.get("program"),
-                    "beneficiary_name": row.get("beneficiary_name"),
-                    "beneficiary_age": row.get("beneficiary_age"),
-                    "assistance_request": row.get("assistance_request"),
-                    "current_node": "start"
-                }
+                return self._row_to_state(session_id, result.data[0])
         except Exception as e:
             print(f"Error loading conversation state: {e}")
         
         return None
+    
+    async def load_conversation_states(
+        self,
+        session_ids: List[str],
+        message_limit: Optional[int] = None
+    ) -> Dict[str, Dict]:
+        """Load several conversation states in one query; unknown sessions are omitted, errors are raised"""
+        if message_limit is None:
+            message_limit = self.message_window
+        if not session_ids:
+            return {}
+        
+        if self.redis is not None:
+            return await self.redis.load_many(list(session_ids), message_limit)
+        
+        if self.mock_mode:
+            states = {}
+            for session_id in session_ids:
+                state = await self.load_conversation_state(session_id, message_limit)
+                if state is not None:
+                    states[session_id] = state
+            return states
+        
+        try:
+            # The embedded limit applies to each conversation's messages separately
+            client = await self._get_client()
+            result = await client.table("conversations").select(
+                "session_id,program,beneficiary_name,beneficiary_age,assistance_request,version,"
+                "conversation_messages(id,role,content)"
+            ).in_(
+                "session_id", list(session_ids)
+            ).order(
+                "id", desc=True, foreign_table="conversation_messages"
+            ).limit(
+                message_limit, foreign_table="conversation_messages"
+            ).execute()
+            
+            return {
+                row["session_id"]: self._row_to_state(row["session_id"], row)
+                for row in result.data or []
+            }
+        except Exception as e:
+            # Unlike a missing row, this must not look like a batch of new conversations
+            print(f"Error loading conversation states: {e}")
+            raise
+    
+    async def save_conversations(self, conversations: List[Dict]) -> Dict[str, Optional[int]]:
+        """
+        Save several conversations at once, each only if its version still equals
+        its expected_version, as save_conversation does.
+        
+        Each item has session_id, program, beneficiary_name, beneficiary_age,
+        assistance_request, new_messages, expected_version and optionally
+        changed_slots (see save_conversation). With Supabase, conversations that
+        have never been saved are created with one insert of their rows and one
+        of their messages; saved ones are updated concurrently, one conditional
+        update each.
+        
+        Returns each session's new version, or None for those whose write failed.
+        Sessions saved elsewhere since they were loaded are left out.
+        """
+        if not conversations:
+            return {}
+        
+        if self.redis is not None:
+            patches = [self._bulk_patch(item) for item in conversations]
+            try:
+                return await self.redis.save_many(conversations, patches)
+            except Exception as e:
+                print(f"Error saving conversations: {e}")
+                return dict.fromkeys(item["session_id"] for item in conversations)
+        
+        # Supabase creates new rows in bulk; everything else goes through save_conversation's version check
+        new_items = [] if self.mock_mode else [item for item in conversations if item.get("expected_version") is None]
+        versions = await self._insert_conversations(new_items) if new_items else {}
+        inserted = {item["session_id"] for item in new_items}
+        
+        async def update(item: Dict):
+            try:
+                versions[item["session_id"]] = await self.save_conversation(
+                    session_id=item["session_id"],
+                    program=item["program"],
+                    beneficiary_name=item["beneficiary_name"],
+                    beneficiary_age=item["beneficiary_age"],
+                    assistance_request=item["assistance_request"],
+                    new_messages=item["new_messages"],
+                    expected_version=item.get("expected_version"),
+                    changed_slots=item.get("changed_slots")
+                )
+            except ConcurrentUpdateError:
+                pass
+        
+        await asyncio.gather(*(update(item) for item in conversations if item["session_id"] not in inserted))
+        return versions
+    
+    @staticmethod
+    def _bulk_patch(item: Dict) -> Dict:
+        """The slot patch of a save_conversations item, recorded in the write size histogram"""
+        patch = slot_patch(
+            {field: item[field] for field in SLOT_FIELDS},
+            item.get("changed_slots"),
+            new_row=item.get("expected_version") is None
+        )
+        STATE_WRITE_BYTES.observe(write_size(patch, item["new_messages"]))
+        return patch
+    
+    async def _insert_conversations(self, items: List[Dict]) -> Dict[str, Optional[int]]:
+        """Create never-saved conversations in Supabase; rows someone else created first are left out"""
+        for item in items:
+            self._bulk_patch(item)
+        try:
+            client = await self._get_client()
+            # Existing rows are skipped, not overwritten, and only the inserted ones come back
+            result = await client.table("conversations").upsert([
+                {
+                    "session_id": item["session_id"],
+                    **{field: item[field] for field in SLOT_FIELDS},
+                    "version": 1
+                }
+                for item in items
+            ], on_conflict="session_id", ignore_duplicates=True).execute()
+            created = {row["session_id"] for row in result.data or []}
+            
+            message_rows = [
+                {
+                    "session_id": item["session_id"],
+                    "role": m.get("role"),
+                    "content": m.get("content", "")
+                }
+                for item in items
+                if item["session_id"] in created
+                for m in item["new_messages"]
+            ]
+            if message_rows:
+                await client.table("conversation_messages").insert(message_rows).execute()
+            return dict.fromkeys(created, 1)
+        except Exception as e:
+            # One request for every row, so none of them can be counted as saved
+            print(f"Error saving conversations: {e}")
+        
+        return dict.fromkeys(item["session_id"] for item in items)
+    
+    def iter_registrations(
+        self,
+        program: Optional[str] = None,
+        created_from: Optional[str] = None,
+        created_to: Optional[str] = None,
+        page_size: int = 500
+    ) -> AsyncIterator[Dict]:
+        """
+        Iterate over completed registrations (name, age and request all set) oldest first.
+        
+        `created_from` is inclusive and `created_to` exclusive (ISO 8601 timestamps).
+        Supabase is read in pages of `page_size` rows using keyset pagination on
+        (created_at, id), selecting only REGISTRATION_COLUMNS, so memory stays flat
+        however many rows match.
+        
+        Raises UnsupportedBackendError right away, before anything is streamed, with
+        the Redis session backend: it keeps no creation times to order or filter by.
+        """
+        if self.redis is not None:
+            raise UnsupportedBackendError("Exporting registrations is not supported with the Redis session backend")
+        return self._iter_registrations(program, created_from, created_to, page_size)
+    
+    async def _iter_registrations(
+        self,
+        program: Optional[str],
+        created_from: Optional[str],
+        created_to: Optional[str],
+        page_size: int
+    ) -> AsyncIterator[Dict]:
+        if self.mock_mode:
+            for row in self._memory_registrations(program, created_from, created_to):
+                yield row
+            return
+        
+        client = await self._get_client()
+        last_created_at, last_id = None, None
+        while True:
+            query = client.table("conversations").select(
+                "id," + ",".join(REGISTRATION_COLUMNS)
+            ).not_.is_(
+                "beneficiary_name", "null"
+            ).not_.is_(
+                "beneficiary_age", "null"
+            ).not_.is_(
+                "assistance_request", "null"
+            )
+            if program:
+                query = query.eq("program", program)
+            if created_from:
+                query = query.gte("created_at", created_from)
+            if created_to:
+                query = query.lt("created_at", created_to)
+            if last_id is not None:
+                # Rows after the last one seen; timestamps are quoted for their ':' and '+'
+                query = query.or_(
+                    f'created_at.gt."{last_created_at}",'
+                    f'and(created_at.eq."{last_created_at}",id.gt.{last_id})'
+                )
+            result = await query.order("created_at").order("id").limit(page_size).execute()
+            
+            rows = result.data or []
+            for row in rows:
+                yield {column: row.get(column) for column in REGISTRATION_COLUMNS}
+            if len(rows) < page_size:
+                return
+            last_created_at, last_id = rows[-1]["created_at"], rows[-1]["id"]
+    
+    def _memory_registrations(
+        self,
+        program: Optional[str],
+        created_from: Optional[str],
+        created_to: Optional[str]
+    ) -> List[Dict]:
+        """Completed registrations from the in-memory store, which MEMORY_MAX_MB already bounds"""
+        start = parse_timestamp(created_from).timestamp() if created_from else None
+        end = parse_timestamp(created_to).timestamp() if created_to else None
+        records = sorted(
+            (
+                record for record in self.memory._records.values()
+                if record.beneficiary_name is not None
+                and record.beneficiary_age is not None
+                and record.assistance_request is not None
+                and (not program or record.program == program)
+                and (start is None or record.created_at >= start)
+                and (end is None or record.created_at < end)
+            ),
+            key=lambda record: record.created_at
+        )
+        return [
+            {
+                "session_id": record.session_id,
+                "program": record.program,
+                "beneficiary_name": record.beneficiary_name,
+                "beneficiary_age": record.beneficiary_age,
+                "assistance_request": record.assistance_request,
+                "created_at": datetime.fromtimestamp(record.created_at, timezone.utc).isoformat(),
+                "updated_at": datetime.fromtimestamp(record.updated_at, timezone.utc).isoformat(),
+            }
+            for record in records
+        ]
+    
+    @staticmethod
+    def _row_to_state(session_id: str, row: Dict) -> Dict:
+        """Build a conversation state from a conversations row with embedded messages"""
+        messages = [
+            {"role": m.get("role"), "content": m.get("content", "")}
+            for m in reversed(row.get("conversation_messages") or [])
+        ]
+        
+        return {
+            "messages": messages,
+            "session_id": session_id,
+            "program": row.get("program"),
+            "beneficiary_name": row.get("beneficiary_name"),
+            "beneficiary_age": row.get("beneficiary_age"),
+            "assistance_request": row.get("assistance_request"),
+            "current_node": "start",
+            "saved_message_count": len(messages),
+            "version": row.get("version") or 0
+        }
 
 
 
@@ -0,0 +1,82 @@
+import os
+from typing import Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class HttpPool:
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        http2: Optional[bool] = None
+    ):
+        """
+        One long-lived HTTP client shared by Supabase and the webhook.
+
+        Connections are kept alive between requests (HTTP_KEEPALIVE_CONNECTIONS idle
+        per pool for HTTP_KEEPALIVE_EXPIRY seconds, HTTP_MAX_CONNECTIONS in total) so
+        only the first request to a host pays for the TCP and TLS handshakes. HTTP/2
+        (HTTP2, on by default) is negotiated with servers that offer it, multiplexing
+        concurrent requests over one connection. Requests time out after HTTP_TIMEOUT
+        seconds, connecting after HTTP_CONNECT_TIMEOUT; waiting for a free connection
+        counts against HTTP_TIMEOUT.
+        """
+        self.max_connections = (
+            max_connections if max_connections is not None else int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        )
+        self.max_keepalive = (
+            max_keepalive if max_keepalive is not None else int(os.getenv("HTTP_KEEPALIVE_CONNECTIONS", "20"))
+        )
+        self.keepalive_expiry = (
+            keepalive_expiry if keepalive_expiry is not None else float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        )
+        self.timeout = timeout if timeout is not None else float(os.getenv("HTTP_TIMEOUT", "10"))
+        self.connect_timeout = (
+            connect_timeout if connect_timeout is not None else float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+        )
+        self.http2 = http2 if http2 is not None else os.getenv("HTTP2", "1").lower() not in ("0", "false", "no")
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    def get(self) -> "httpx.AsyncClient":
+        """Return the shared async client, creating it on first use"""
+        if self._client is None:
+            # Imported here, like the Supabase SDK, so importing the app stays cheap
+            import httpx
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("Warning: HTTP2 is on but the h2 package is not installed (pip install httpx[http2]); using HTTP/1.1.")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout)
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close every pooled connection"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict:
+        return {
+            "open": self._client is not None,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "keepalive_expiry_seconds": self.keepalive_expiry,
+            "timeout_seconds": self.timeout,
+        }
@@ -0,0 +1,120 @@
+import json
+import os
+from collections import deque
+from typing import TypedDict, List, Dict, Tuple, Optional
+
+
+DEFAULT_KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "program_keywords.json")
+
+
+class KeywordMatch(TypedDict):
+    program: str
+    keyword: str
+    start: int
+    end: int
+
+
+class Classification(TypedDict):
+    program: str
+    scores: Dict[str, int]
+    matches: List[KeywordMatch]
+
+
+class KeywordAutomaton:
+    def __init__(self, keywords: List[Tuple[str, str]]):
+        """
+        Aho-Corasick automaton over (keyword, label) pairs.
+
+        Finds every occurrence of every keyword in one left-to-right pass.
+        """
+        # Node 0 is the root; goto[node] maps a character to the next node
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Keywords (keyword, label) ending at each node, including those reached via fail links
+        self._output: List[List[Tuple[str, str]]] = [[]]
+
+        for keyword, label in keywords:
+            if not keyword:
+                continue
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[node][char] = next_node
+                node = next_node
+            if (keyword, label) not in self._output[node]:
+                self._output[node].append((keyword, label))
+
+        # Breadth-first pass to set fail links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def finditer(self, text: str):
+        """Yield (start, end, keyword, label) for every keyword occurrence in text"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                end = index + 1
+                for keyword, label in output[node]:
+                    yield end - len(keyword), end, keyword, label
+
+
+class IntentClassifier:
+    def __init__(self, programs: List[Tuple[str, List[str]]], default_program: str):
+        """
+        Keyword classifier over programs given in priority order.
+
+        The first program with any keyword in the message wins; otherwise default_program.
+        """
+        self.priority = [program for program, _ in programs]
+        self.default_program = default_program
+        self.automaton = KeywordAutomaton([
+            (keyword.lower(), program)
+            for program, keywords in programs
+            for keyword in keywords
+        ])
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "IntentClassifier":
+        """Build a classifier from a JSON keyword config (PROGRAM_KEYWORDS_PATH by default)"""
+        path = path or os.getenv("PROGRAM_KEYWORDS_PATH", DEFAULT_KEYWORDS_PATH)
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(
+            [(entry["program"], entry["keywords"]) for entry in config["programs"]],
+            config.get("default_program", "general_food_access")
+        )
+
+    def classify(self, message: str) -> Classification:
+        """
+        Return the winning program plus per-program match counts and every match.
+
+        Match positions index into message.lower().
+        """
+        scores = {program: 0 for program in self.priority}
+        matches: List[KeywordMatch] = []
+        for start, end, keyword, program in self.automaton.finditer(message.lower()):
+            scores[program] += 1
+            matches.append({"program": program, "keyword": keyword, "start": start, "end": end})
+
+        program = next((p for p in self.priority if scores[p]), self.default_program)
+        return {"program": program, "scores": scores, "matches": matches}
@@ -1,12 +1,94 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
-from conversation_flow import ConversationFlow
-from database import Database
+from pydantic import BaseModel, Field
+from typing import Optional, List
+import asyncio
+import inspect
+import json
+import secrets
+import tempfile
+import uuid
+from conversation_flow import ConversationFlow, PROGRAMS, get_graph
+from database import Database, ConcurrentUpdateError, UnsupportedBackendError, parse_timestamp
+from http_pool import HttpPool
+from metrics import MULTIPROC_DIR, RequestProfiler, clear_snapshots, export_snapshots, render_latest, write_snapshot
+from registration_dedup import RegistrationDedup
+from registrations_export import FORMATS, MEDIA_TYPES, export_chunks
+from session_store import SessionStore
+from webhook_client import WebhookClient
+from webhook_outbox import WebhookOutbox
 import os
 
-app = FastAPI(title="Zero Hunger Assistant API")
+# Initialize one shared session store and the conversation flow that uses it,
+# with Supabase and the webhook sharing one pool of keep-alive connections
+http_pool = HttpPool()
+database = Database(http_pool)
+session_store = SessionStore(database)
+webhook_client = WebhookClient(http_pool)
+webhook_outbox = WebhookOutbox(webhook_client, database)
+registration_dedup = RegistrationDedup(database)
+conversation_flow = ConversationFlow(
+    db=session_store,
+    webhook_client=webhook_client,
+    outbox=webhook_outbox,
+    dedup=registration_dedup
+)
+request_profiler = RequestProfiler()
+
+# Largest burst /chat/batch accepts; every session in it is locked until the bulk save
+BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "500"))
+
+# Startup work runs in the background so /health answers as soon as the server is up
+warmup_task: Optional[asyncio.Task] = None
+
+async def warm_up():
+    """Connect or restore state, load recent registrations and compile the graph, then start the outbox worker"""
+    steps = [
+        ("webhook client", webhook_client.start),
+        ("database", database.start),
+        ("registration dedup", registration_dedup.start),
+        # Compiling imports langgraph; keep that off the event loop
+        ("conversation graph", lambda: asyncio.to_thread(get_graph)),
+        ("webhook outbox", webhook_outbox.start),
+    ]
+    # Each step on its own, so one failure doesn't keep the outbox worker or snapshots from starting
+    for name, step in steps:
+        try:
+            result = step()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            # The client, graph and Supabase connection are otherwise set up on first use; keep serving
+            print(f"Error during startup warm-up ({name}): {e}")
+
+async def wait_until_warm():
+    """Hold a request that touches conversation state until warm-up has finished"""
+    if warmup_task is not None and not warmup_task.done():
+        await asyncio.shield(warmup_task)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up in the background; on shutdown stop the outbox worker and release connections"""
+    global warmup_task
+    warmup_task = asyncio.create_task(warm_up())
+    # Other workers read this worker's counters from its snapshot when they answer /metrics
+    metrics_task = asyncio.create_task(export_snapshots()) if MULTIPROC_DIR else None
+    yield
+    # Let warm-up finish rather than cancel it, so a half-restored store is never snapshotted
+    await warmup_task
+    # Streamed turns can outlive their request; let them save before the stores close
+    await conversation_flow.wait_for_turns()
+    await webhook_outbox.stop()
+    await webhook_client.aclose()
+    await database.stop()
+    await http_pool.aclose()
+    if metrics_task is not None:
+        metrics_task.cancel()
+        write_snapshot()
+
+app = FastAPI(title="Zero Hunger Assistant API", lifespan=lifespan)
 
 # Define explicitly allowed origins
 # REPLACE the render URL with your actual frontend URL from your Render dashboard
@@ -25,9 +107,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize conversation flow and database
-conversation_flow = ConversationFlow()
-db = Database()
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Capture a cProfile dump for requests sent with "X-Profile: 1" (or sampled) when profiling is enabled"""
+    if not request_profiler.should_profile(request.headers.get("x-profile")):
+        return await call_next(request)
+    with request_profiler.capture(request.url.path) as capture:
+        response = await call_next(request)
+    response.headers["X-Profile-File"] = capture["path"]
+    return response
 
 class ChatMessage(BaseModel):
     message: str
@@ -37,40 +125,246 @@ class ChatResponse(BaseModel):
     response: str
     session_id: str
 
+class BatchChatRequest(BaseModel):
+    items: List[ChatMessage] = Field(max_length=BATCH_MAX_ITEMS)
+
+class BatchChatItemResponse(BaseModel):
+    response: Optional[str] = None
+    session_id: str
+    error: Optional[str] = None
+
+class BatchChatResponse(BaseModel):
+    responses: List[BatchChatItemResponse]
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(chat_message: ChatMessage):
     """
     Main chat endpoint that processes user messages and returns AI responses.
     """
+    await wait_until_warm()
     try:
         # Get or create session ID
         session_id = chat_message.session_id
         if not session_id:
-            session_id = db.create_session()
+            session_id = await session_store.create_session()
         
         # Process message through LangGraph conversation flow
         response = await conversation_flow.process_message(
             message=chat_message.message,
             session_id=session_id
         )
+        if response["version"] is None:
+            # Answering would tell the beneficiary a turn (or registration) went through that wasn't stored
+            raise HTTPException(status_code=503, detail="The conversation could not be saved, please retry")
         
         return ChatResponse(
             response=response["message"],
             session_id=session_id
         )
     
+    except HTTPException:
+        raise
+    except ConcurrentUpdateError:
+        # Another worker kept winning the race for this session; the client may resend
+        raise HTTPException(status_code=409, detail="Conversation was updated concurrently, please retry")
     except Exception as e:
         # Note: If an internal 500 error occurs, CORS headers might not be sent.
         # Ensure your API key and DB connection are working correctly.
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(batch: BatchChatRequest):
+    """
+    Process a burst of messages (e.g. from an SMS/IVR gateway) with one bulk
+    state load and one bulk save. Responses are returned in request order;
+    items whose conversation could not be saved carry an error instead.
+    """
+    await wait_until_warm()
+    try:
+        # Items without a session start a new conversation; the bulk save creates its row
+        items = [
+            (item.session_id or str(uuid.uuid4()), item.message)
+            for item in batch.items
+        ]
+        
+        results = await conversation_flow.process_batch(items)
+        
+        return BatchChatResponse(responses=[
+            BatchChatItemResponse(
+                response=result["message"],
+                session_id=result["session_id"],
+                error=result.get("error")
+            )
+            for result in results
+        ])
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat_message: ChatMessage):
+    """
+    Same as /chat, but streamed as Server-Sent Events: "reply" is sent as soon
+    as the answer is ready, followed by "saved", "webhook" (once registration is
+    complete) and finally "done".
+    """
+    await wait_until_warm()
+    session_id = chat_message.session_id
+    if not session_id:
+        session_id = await session_store.create_session()
+    
+    async def events():
+        try:
+            async for event, data in conversation_flow.stream_message(chat_message.message, session_id):
+                yield sse_event(event, data)
+        except ConcurrentUpdateError:
+            yield sse_event("error", {"status": 409, "detail": "Conversation was updated concurrently, please retry"})
+        except Exception as e:
+            yield sse_event("error", {"status": 500, "detail": str(e)})
+        yield sse_event("done", {"session_id": session_id})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Chat over a WebSocket. The session state stays in memory for the life of the
+    connection, so turns skip the state load. Send {"message": "..."}; receive
+    {"event": ..., ...} objects with the same events as /chat/stream. A frame
+    that isn't valid, or a turn that fails, gets an "error" event and the
+    connection stays open.
+    """
+    await websocket.accept()
+    await wait_until_warm()
+    if not session_id:
+        session_id = await session_store.create_session()
+    state = await session_store.load_conversation_state(session_id) or conversation_flow.new_state(session_id)
+    await websocket.send_json({"event": "session", "session_id": session_id})
+    
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            # A bad frame gets an error reply; the connection stays open for the next one
+            try:
+                data = json.loads(frame.get("text") or frame.get("bytes") or "")
+            except ValueError:
+                await websocket.send_json({"event": "error", "status": 400, "detail": "Frames must be JSON"})
+                continue
+            message = data.get("message") if isinstance(data, dict) else None
+            if not isinstance(message, str) or not message.strip():
+                await websocket.send_json({"event": "error", "status": 422, "detail": "message must be a non-empty string"})
+                continue
+            
+            try:
+                async for event, payload in conversation_flow.stream_turn(state, message):
+                    await websocket.send_json({"event": event, **payload})
+            except ConcurrentUpdateError:
+                # Someone else saved this session; pick up their state before the next turn
+                state = await session_store.load_conversation_state(session_id) or conversation_flow.new_state(session_id)
+                await websocket.send_json({"event": "error", "status": 409, "detail": "Conversation was updated concurrently, please retry"})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"Error in WebSocket turn for session {session_id}: {e}")
+                # The turn may have left the resident state half-updated; start again from what was saved
+                state = await session_store.load_conversation_state(session_id) or conversation_flow.new_state(session_id)
+                await websocket.send_json({"event": "error", "status": 500, "detail": str(e)})
+            await websocket.send_json({"event": "done", "session_id": session_id})
+    except WebSocketDisconnect:
+        pass
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    health = {
+        "status": "healthy",
+        # Caches and pools below belong to the worker process that answered
+        "worker_pid": os.getpid(),
+        # False while startup warm-up is still running; chat requests wait for it
+        "warm": warmup_task is not None and warmup_task.done(),
+        "session_cache": session_store.stats(),
+        "registration_dedup": registration_dedup.stats(),
+        "http_pool": http_pool.stats()
+    }
+    if database.memory is not None:
+        health["memory_store"] = database.memory.stats()
+    if conversation_flow.assistant is not None:
+        health["model"] = conversation_flow.assistant.stats()
+    return health
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/registrations")
+async def export_registrations(
+    format: str = "ndjson",
+    program: Optional[str] = None,
+    created_from: Optional[str] = Query(None, alias="from"),
+    created_to: Optional[str] = Query(None, alias="to"),
+    page_size: int = Query(500, ge=1, le=5000),
+    x_admin_key: Optional[str] = Header(None)
+):
+    """
+    Stream completed registrations as NDJSON or CSV, oldest first.
+    
+    Requires the X-Admin-Key header to match ADMIN_API_KEY; the endpoint is off
+    while ADMIN_API_KEY is unset. `from` is inclusive and `to` exclusive.
+    """
+    admin_key = os.getenv("ADMIN_API_KEY", "")
+    if not admin_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, admin_key):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    if program and program not in PROGRAMS:
+        raise HTTPException(status_code=400, detail=f"program must be one of: {', '.join(PROGRAMS)}")
+    for value in (created_from, created_to):
+        if value:
+            try:
+                parse_timestamp(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Not an ISO 8601 date/time: {value}")
+    await wait_until_warm()
+    try:
+        rows = database.iter_registrations(
+            program=program,
+            created_from=created_from,
+            created_to=created_to,
+            page_size=page_size
+        )
+    except UnsupportedBackendError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    headers = {"Cache-Control": "no-store"}
+    if format == "csv":
+        headers["Content-Disposition"] = 'attachment; filename="registrations.csv"'
+    return StreamingResponse(export_chunks(rows, format), media_type=MEDIA_TYPES[format], headers=headers)
 
 if __name__ == "__main__":
     import uvicorn
     # Render uses the PORT environment variable; default to 10000 for Render
     port = int(os.environ.get("PORT", 10000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # One worker process per core needs state every worker can see: Supabase or REDIS_URL
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        if database.mock_mode and not database.redis_url:
+            print("Warning: running several workers in mock mode without REDIS_URL; each worker keeps its own sessions.")
+        # Workers inherit the directory and /metrics sums their snapshots
+        metrics_dir = os.environ.get("METRICS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="zha-metrics-")
+        os.environ["METRICS_MULTIPROC_DIR"] = metrics_dir
+        clear_snapshots(metrics_dir)
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
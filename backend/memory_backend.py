@@ -0,0 +1,348 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+
+
+# Roles are stored as one byte per message; unknown roles get the next free code
+ROLE_NAMES: List[str] = ["user", "assistant", "system"]
+ROLE_CODES: Dict[str, int] = {role: code for code, role in enumerate(ROLE_NAMES)}
+
+# Rough fixed cost of a record, its slots and its two message containers
+RECORD_OVERHEAD = 400
+# Cost of one message besides its text: a list slot and a role byte
+MESSAGE_OVERHEAD = 9
+# Assistant replies are mostly templates; up to this many distinct ones are shared across sessions
+SHARED_TEXT_LIMIT = 4096
+
+
+def _role_code(role: Optional[str]) -> int:
+    role = role or "user"
+    code = ROLE_CODES.get(role)
+    if code is None:
+        if len(ROLE_NAMES) >= 256:
+            raise ValueError(f"Too many distinct message roles to store {role!r}")
+        code = ROLE_CODES[role] = len(ROLE_NAMES)
+        ROLE_NAMES.append(role)
+    return code
+
+
+def _str_size(value) -> int:
+    return sys.getsizeof(value) if isinstance(value, str) else 0
+
+
+class SessionRecord:
+    """One conversation kept in memory; messages are a role byte string plus a parallel list of texts"""
+
+    __slots__ = (
+        "session_id",
+        "program",
+        "beneficiary_name",
+        "beneficiary_age",
+        "assistance_request",
+        "version",
+        "roles",
+        "texts",
+        "last_access",
+        "created_at",
+        "updated_at",
+        "size",
+    )
+
+    def __init__(self, session_id: str, last_access: float):
+        self.session_id = session_id
+        self.program: Optional[str] = None
+        self.beneficiary_name: Optional[str] = None
+        self.beneficiary_age: Optional[int] = None
+        self.assistance_request: Optional[str] = None
+        self.version = 0
+        self.roles = bytearray()
+        self.texts: List[str] = []
+        self.last_access = last_access
+        # Wall-clock times, like the created_at/updated_at columns in Supabase
+        self.created_at = self.updated_at = time.time()
+        self.size = 0
+
+    def slot_size(self) -> int:
+        return (
+            _str_size(self.program)
+            + _str_size(self.beneficiary_name)
+            + _str_size(self.assistance_request)
+        )
+
+    def messages(self, limit: Optional[int] = None) -> List[Dict]:
+        """Materialize the last `limit` messages (all if None) as message dicts"""
+        start = 0 if limit is None else max(0, len(self.texts) - limit)
+        if limit is not None and limit <= 0:
+            return []
+        return [
+            {"role": ROLE_NAMES[code], "content": text}
+            for code, text in zip(self.roles[start:], self.texts[start:])
+        ]
+
+
+class MemorySessionBackend:
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: Optional[float] = None
+    ):
+        """
+        Bounded in-memory conversation storage for running without Supabase.
+
+        Sessions idle for longer than MEMORY_SESSION_TTL are expired and, once the
+        estimated size passes MEMORY_MAX_MB, the least recently used sessions are
+        evicted. With MEMORY_SNAPSHOT_PATH set, the store is written to that file
+        every MEMORY_SNAPSHOT_INTERVAL seconds and on shutdown, and restored on start.
+        """
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("MEMORY_MAX_MB", "256")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("MEMORY_SESSION_TTL", "86400"))
+        self.snapshot_path = snapshot_path if snapshot_path is not None else os.getenv("MEMORY_SNAPSHOT_PATH", "")
+        self.snapshot_interval = (
+            snapshot_interval if snapshot_interval is not None
+            else float(os.getenv("MEMORY_SNAPSHOT_INTERVAL", "60"))
+        )
+
+        # Least recently used first
+        self._records: "OrderedDict[str, SessionRecord]" = OrderedDict()
+        self._shared_texts: Dict[str, str] = {}
+        self.bytes_used = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _share(self, text: str) -> str:
+        """Return the shared copy of a repeated text, registering it if there is room"""
+        shared = self._shared_texts.get(text)
+        if shared is not None:
+            return shared
+        if len(self._shared_texts) < SHARED_TEXT_LIMIT:
+            self._shared_texts[text] = text
+        return text
+
+    def _expire(self, now: float):
+        """Drop sessions idle past the TTL; the LRU end holds the longest idle ones"""
+        if self.ttl_seconds <= 0:
+            return
+        records = self._records
+        while records:
+            session_id, record = next(iter(records.items()))
+            if record.last_access + self.ttl_seconds >= now:
+                break
+            del records[session_id]
+            self.bytes_used -= record.size
+            self.expirations += 1
+            self._dirty = True
+
+    def _evict(self):
+        """Evict least recently used sessions until the store fits in max_bytes"""
+        records = self._records
+        while self.bytes_used > self.max_bytes and len(records) > 1:
+            _, record = records.popitem(last=False)
+            self.bytes_used -= record.size
+            self.evictions += 1
+            self._dirty = True
+
+    def get(self, session_id: str, touch: bool = True) -> Optional[SessionRecord]:
+        """Return a live session record, marking it as recently used"""
+        now = time.monotonic()
+        self._expire(now)
+        record = self._records.get(session_id)
+        if record is not None and touch:
+            record.last_access = now
+            self._records.move_to_end(session_id)
+        return record
+
+    def create(self, session_id: str) -> SessionRecord:
+        """Add an empty session, replacing any existing one with the same id"""
+        now = time.monotonic()
+        self._expire(now)
+        old = self._records.pop(session_id, None)
+        if old is not None:
+            self.bytes_used -= old.size
+        record = SessionRecord(session_id, now)
+        record.size = RECORD_OVERHEAD
+        self.bytes_used += record.size
+        self._records[session_id] = record
+        self._dirty = True
+        self._evict()
+        return record
+
+    def update(
+        self,
+        record: SessionRecord,
+        slots: Dict,
+        new_messages: List[Dict],
+        version: int
+    ):
+        """Set the given slot fields and version, and append messages; other slots are left as they are"""
+        old_slot_bytes = record.slot_size()
+        for field, value in slots.items():
+            setattr(record, field, value)
+        record.version = version
+
+        added = 0
+        for message in new_messages:
+            role = message.get("role")
+            text = message.get("content", "") or ""
+            if role == "assistant":
+                text = self._share(text)
+            if self._shared_texts.get(text) is text:
+                # Shared texts live in the bounded pool, not in this session
+                added += MESSAGE_OVERHEAD
+            else:
+                added += MESSAGE_OVERHEAD + sys.getsizeof(text)
+            record.roles.append(_role_code(role))
+            record.texts.append(text)
+
+        delta = added + record.slot_size() - old_slot_bytes
+        record.size += delta
+        self.bytes_used += delta
+        record.last_access = time.monotonic()
+        record.updated_at = time.time()
+        if record.session_id in self._records:
+            self._records.move_to_end(record.session_id)
+        self._dirty = True
+        self._evict()
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._records),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared_texts": len(self._shared_texts)
+        }
+
+    def _snapshot_rows(self) -> Tuple[float, List[list]]:
+        """Copy everything a snapshot needs, so it can be serialized off the event loop"""
+        now = time.monotonic()
+        rows = [
+            [
+                record.session_id,
+                record.program,
+                record.beneficiary_name,
+                record.beneficiary_age,
+                record.assistance_request,
+                record.version,
+                now - record.last_access,
+                bytes(record.roles).hex(),
+                list(record.texts),
+                record.created_at,
+                record.updated_at,
+            ]
+            for record in self._records.values()
+        ]
+        return time.time(), rows
+
+    def _write_snapshot(self, saved_at: float, rows: List[list]):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": saved_at, "roles": ROLE_NAMES, "sessions": rows}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def snapshot(self):
+        """Write all sessions to the snapshot file if anything changed since the last one"""
+        if not self.snapshot_path or not self._dirty:
+            return
+        self._dirty = False
+        saved_at, rows = self._snapshot_rows()
+        try:
+            await asyncio.to_thread(self._write_snapshot, saved_at, rows)
+        except OSError as e:
+            self._dirty = True
+            print(f"Error writing session snapshot: {e}")
+
+    def _read_snapshot(self) -> Optional[Dict]:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError as e:
+            # Truncated or corrupt: keep it rather than overwrite it with the next snapshot
+            self._set_aside(e)
+        except OSError as e:
+            print(f"Error reading session snapshot: {e}")
+        return None
+
+    def _set_aside(self, error: Exception):
+        """Move a snapshot that can't be restored to `<path>.bad`"""
+        print(f"Error restoring session snapshot, moved to {self.snapshot_path}.bad: {error}")
+        os.replace(self.snapshot_path, f"{self.snapshot_path}.bad")
+
+    def restore(self, data: Dict) -> int:
+        """Load sessions from snapshot data; returns how many are still live"""
+        roles = data.get("roles", ROLE_NAMES)
+        downtime = max(0.0, time.time() - data.get("saved_at", time.time()))
+        now = time.monotonic()
+        # Oldest first so the LRU order survives the restart
+        rows = sorted(data.get("sessions", []), key=lambda row: -row[6])
+        for row in rows:
+            session_id, program, name, age, request, version, idle, role_hex, texts = row[:9]
+            idle += downtime
+            if self.ttl_seconds > 0 and idle > self.ttl_seconds:
+                continue
+            record = self.create(session_id)
+            self.update(
+                record,
+                {
+                    "program": program,
+                    "beneficiary_name": name,
+                    "beneficiary_age": age,
+                    "assistance_request": request,
+                },
+                [
+                    {"role": roles[code], "content": text}
+                    for code, text in zip(bytes.fromhex(role_hex), texts)
+                ],
+                version
+            )
+            record.last_access = now - idle
+            if len(row) > 9:
+                record.created_at, record.updated_at = row[9], row[10]
+        self._dirty = False
+        return len(self._records)
+
+    async def run(self):
+        """Background loop writing periodic snapshots"""
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            await self.snapshot()
+
+    async def start(self):
+        """Restore the last snapshot and start periodic snapshots (no-op without MEMORY_SNAPSHOT_PATH)"""
+        if not self.snapshot_path or self._task is not None:
+            return
+        data = await asyncio.to_thread(self._read_snapshot)
+        try:
+            restored = self.restore(data) if data else 0
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            await asyncio.to_thread(self._set_aside, e)
+            restored = len(self._records)
+        if restored:
+            print(f"Restored {restored} sessions from {self.snapshot_path}")
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop periodic snapshots and write a final one"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.snapshot()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "messages.json")
+
+# Every reply the flow sends; "completion" and "name" mention the program by name
+MESSAGE_KEYS = ("name", "age", "assistance_request", "more_info", "completion")
+
+# Stripped from the ends of a word before it is looked up as a language marker
+_PUNCTUATION = ".,!?;:()[]\"'¿¡।॥"
+# Letters that only turn up in Spanish among the supported locales
+_SPANISH_LETTERS = frozenset("ñáéíóú¿¡")
+
+
+def _is_devanagari(char: str) -> bool:
+    return "\u0900" <= char <= "\u097f"
+
+
+class MessageCatalog:
+    def __init__(
+        self,
+        locales: Dict[str, Dict],
+        default_locale: str,
+        programs: Iterable[str],
+        markers: Optional[Dict[str, List[str]]] = None,
+        weak_markers: Optional[Dict[str, List[str]]] = None
+    ):
+        """
+        Replies for every (locale, program, message) rendered once up front.
+
+        A message or program name missing from a locale falls back to the default
+        locale's, so every combination resolves; a program outside `programs` gets
+        the "default" program name. Lookups are plain dict reads.
+
+        `weak_markers` are words that also turn up inside names ("de", "la"); like
+        accented letters, they add to a language's votes but never decide one alone.
+        """
+        if default_locale not in locales:
+            raise ValueError(f"default locale {default_locale!r} has no messages")
+        self.default_locale = default_locale
+        self.locales = tuple(locales)
+        default = locales[default_locale]
+        # (locale, "programs" or "messages", key) entries that fell back to the default locale
+        self.fallbacks: List[Tuple[str, str, str]] = []
+
+        # locale -> program (None for unknown ones) -> message key -> text
+        self._rendered: Dict[str, Dict[Optional[str], Dict[str, str]]] = {}
+        for locale, entries in locales.items():
+            by_program = {}
+            self.fallbacks.extend(
+                (locale, "messages", key) for key in MESSAGE_KEYS if not entries["messages"].get(key)
+            )
+            for program in (*programs, None):
+                program_key = program if program is not None else "default"
+                if not entries.get("programs", {}).get(program_key):
+                    self.fallbacks.append((locale, "programs", program_key))
+                program_name = (
+                    entries.get("programs", {}).get(program_key)
+                    or default["programs"].get(program_key)
+                    or default["programs"]["default"]
+                )
+                by_program[program] = {
+                    key: (entries["messages"].get(key) or default["messages"][key]).format(program_name=program_name)
+                    for key in MESSAGE_KEYS
+                }
+            self._rendered[locale] = by_program
+        self._default = self._rendered[default_locale]
+
+        # word -> locales it marks
+        self._markers = self._index(markers)
+        self._weak_markers = self._index(weak_markers)
+
+    @staticmethod
+    def _index(markers: Optional[Dict[str, List[str]]]) -> Dict[str, Tuple[str, ...]]:
+        index: Dict[str, Tuple[str, ...]] = {}
+        for locale, words in (markers or {}).items():
+            for word in words:
+                index[word] = index.get(word, ()) + (locale,)
+        return index
+
+    @classmethod
+    def from_file(cls, programs: Iterable[str], path: Optional[str] = None) -> "MessageCatalog":
+        """Build a catalog from a JSON message file (MESSAGE_CATALOG_PATH by default)"""
+        path = path or os.getenv("MESSAGE_CATALOG_PATH", DEFAULT_CATALOG_PATH)
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(
+            config["locales"],
+            config.get("default_locale", "en"),
+            programs,
+            config.get("detection"),
+            config.get("weak_detection")
+        )
+
+    def message(self, locale: str, program: Optional[str], key: str) -> str:
+        """Rendered reply; unknown locales use the default one and unknown programs the generic name"""
+        by_program = self._rendered.get(locale) or self._default
+        messages = by_program.get(program) or by_program[None]
+        return messages.get(key) or messages["more_info"]
+
+    def detect(self, text: str) -> Optional[str]:
+        """
+        Locale a message is written in, or None if it gives no clear sign: just a
+        number, or a name, even one like "María de la Cruz".
+        """
+        votes: Dict[str, int] = {}
+        weak_votes: Dict[str, int] = {}
+        for word in text.casefold().split():
+            word = word.strip(_PUNCTUATION)
+            for locale in self._markers.get(word, ()):
+                votes[locale] = votes.get(locale, 0) + 1
+            for locale in self._weak_markers.get(word, ()):
+                weak_votes[locale] = weak_votes.get(locale, 0) + 1
+        if not votes:
+            return None
+        if not _SPANISH_LETTERS.isdisjoint(text.casefold()) and "es" in self._rendered:
+            weak_votes["es"] = weak_votes.get("es", 0) + 1
+        for locale, count in weak_votes.items():
+            votes[locale] = votes.get(locale, 0) + count
+        ranked = sorted(votes.items(), key=lambda item: -item[1])
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            return None
+        return ranked[0][0] if ranked[0][0] in self._rendered else None
+
+    def session_locale(self, messages: List[Dict]) -> str:
+        """
+        Locale of the newest user message that has a clear one, so a reply like
+        "34" keeps the session's language; the default locale if none does.
+
+        Devanagari text without marker words is taken as Hindi.
+        """
+        script_hint = None
+        for message in reversed(messages):
+            if message.get("role") != "user":
+                continue
+            content = message.get("content", "")
+            locale = self.detect(content)
+            if locale is not None:
+                return locale
+            if script_hint is None and "hi" in self._rendered and any(_is_devanagari(char) for char in content):
+                script_hint = "hi"
+        return script_hint or self.default_locale
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Render a catalog and list every reply that is missing a translation"""
+    parser = argparse.ArgumentParser(description="Check that every locale translates every program and message")
+    parser.add_argument("path", nargs="?", help="message catalog JSON (default: MESSAGE_CATALOG_PATH or messages.json)")
+    parser.add_argument("--show", metavar="LOCALE", help="print every rendered reply in this locale")
+    args = parser.parse_args(argv)
+
+    # Imported here: conversation_flow builds its own catalog from this module on import
+    from conversation_flow import PROGRAMS
+    catalog = MessageCatalog.from_file(PROGRAMS, args.path)
+    for locale, section, key in catalog.fallbacks:
+        print(f"{locale}: {section}.{key} is missing, falls back to {catalog.default_locale}")
+    if args.show:
+        for program in (*PROGRAMS, None):
+            for key in MESSAGE_KEYS:
+                print(f"{program or 'default'}.{key}: {catalog.message(args.show, program, key)}")
+    print(f"{len(catalog.locales)} locales x {len(PROGRAMS) + 1} programs x {len(MESSAGE_KEYS)} messages, "
+          f"{len(catalog.fallbacks)} missing")
+    return 1 if catalog.fallbacks else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
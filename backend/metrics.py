@@ -0,0 +1,321 @@
+import asyncio
+import cProfile
+import functools
+import glob
+import inspect
+import json
+import os
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+
+# Instrumentation is on unless METRICS_ENABLED=false; when off every helper
+# below returns after a single flag check
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+# With several worker processes each one writes its series to this directory
+# and /metrics serves the sum, whichever worker answers the scrape
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or None
+EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "5"))
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        """Monotonic counter, one series per label-value tuple"""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        if not ENABLED:
+            return
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def snapshot(self) -> list:
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    @staticmethod
+    def merge(into: Dict, snapshot: list):
+        """Add a snapshot() from another worker to a labels -> value dict"""
+        for labels, value in snapshot:
+            into[tuple(labels)] = into.get(tuple(labels), 0.0) + value
+
+    def render(self, values: Dict | None = None) -> List[str]:
+        values = self._values if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        """Cumulative-bucket histogram, one series per label-value tuple"""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels: str):
+        if not ENABLED:
+            return
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the duration of the block"""
+        if not ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self) -> list:
+        return [[list(labels), counts, total, count] for labels, (counts, total, count) in self._series.items()]
+
+    @staticmethod
+    def merge(into: Dict, snapshot: list):
+        """Add a snapshot() from another worker to a labels -> series dict"""
+        for labels, counts, total, count in snapshot:
+            series = into.get(tuple(labels))
+            if series is None:
+                into[tuple(labels)] = [list(counts), total, count]
+                continue
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+    def render(self, series: Dict | None = None) -> List[str]:
+        series = self._series if series is None else series
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+REGISTRY: List = []
+
+STAGE_SECONDS = Histogram(
+    "zha_stage_duration_seconds",
+    "Time spent in each stage of the chat pipeline",
+    ("stage",)
+)
+ROUTING_DECISIONS = Counter(
+    "zha_routing_decisions_total",
+    "Programs chosen by router_node",
+    ("program",)
+)
+SLOTS_FILLED = Counter(
+    "zha_slots_filled_total",
+    "Beneficiary slots filled from a user message",
+    ("slot",)
+)
+REGISTRATIONS_COMPLETED = Counter(
+    "zha_registrations_completed_total",
+    "Turns that ended with all beneficiary slots filled",
+    ("program",)
+)
+SESSION_INSERTS_AVOIDED = Counter(
+    "zha_session_inserts_avoided_total",
+    "Sessions minted locally instead of inserting an empty conversations row"
+)
+REGISTRATION_DUPLICATES = Counter(
+    "zha_registration_duplicates_total",
+    "Completed registrations not sent because they repeat a recent one",
+    ("program",)
+)
+MODEL_REQUESTS = Counter(
+    "zha_model_requests_total",
+    "LLM classify/extract lookups by outcome (cache_hit, coalesced, model_call, over_budget, error)",
+    ("task", "outcome")
+)
+STATE_WRITE_BYTES = Histogram(
+    "zha_state_write_bytes",
+    "JSON size of the changed slot fields and new messages written per saved turn (0 when the write is skipped)",
+    buckets=(0, 64, 256, 1024, 4096, 16384, 65536)
+)
+WEBHOOK_OUTCOMES = Counter(
+    "zha_webhook_outcomes_total",
+    "Webhook deliveries and outbox enqueues by outcome",
+    ("outcome",)
+)
+
+
+def timed(stage: str):
+    """
+    Decorator recording a function's (or coroutine's) duration under STAGE_SECONDS{stage}.
+
+    With metrics disabled the function is returned unwrapped.
+    """
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+        return wrapper
+    return decorator
+
+
+def _snapshot_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"metrics-{pid}.json")
+
+
+def write_snapshot():
+    """Write this worker's series to MULTIPROC_DIR, replacing its previous snapshot"""
+    if MULTIPROC_DIR is None:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    path = _snapshot_path(MULTIPROC_DIR, os.getpid())
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({metric.name: metric.snapshot() for metric in REGISTRY}, f)
+    os.replace(path + ".tmp", path)
+
+
+def clear_snapshots(directory: str):
+    """Remove snapshots left by a previous run; call before the workers start"""
+    for path in glob.glob(_snapshot_path(directory, "*")):
+        os.remove(path)
+
+
+async def export_snapshots():
+    """Rewrite this worker's snapshot every EXPORT_INTERVAL seconds until cancelled"""
+    while True:
+        await asyncio.sleep(EXPORT_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(f"Error writing metrics snapshot: {e}")
+
+
+def _read_snapshots() -> List[Dict]:
+    snapshots = []
+    for path in sorted(glob.glob(_snapshot_path(MULTIPROC_DIR, "*"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Skipping metrics snapshot {path}: {e}")
+    return snapshots
+
+
+def render_latest() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+
+    With MULTIPROC_DIR set, the series are summed over every worker's latest
+    snapshot, this worker's written just now. Snapshots of workers that have
+    exited are kept, so counters never go down between scrapes.
+    """
+    lines = []
+    if MULTIPROC_DIR is None:
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+    write_snapshot()
+    snapshots = _read_snapshots()
+    for metric in REGISTRY:
+        merged: Dict = {}
+        for snapshot in snapshots:
+            metric.merge(merged, snapshot.get(metric.name, []))
+        lines.extend(metric.render(merged))
+    return "\n".join(lines) + "\n"
+
+
+class RequestProfiler:
+    def __init__(self):
+        """
+        Capture cProfile stats for single requests.
+
+        A request is profiled when PROFILING_ENABLED=true and it either carries
+        an "X-Profile: 1" header or is picked by PROFILE_SAMPLE_RATE. Stats are
+        written to PROFILE_DIR. cProfile sees the whole event loop, so other
+        requests running at the same time show up in the capture too; only one
+        capture runs at once.
+        """
+        self.enabled = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.directory = os.getenv("PROFILE_DIR", "profiles")
+        self._active = False
+
+    def should_profile(self, header_value: str | None) -> bool:
+        if not self.enabled or self._active:
+            return False
+        if header_value == "1":
+            return True
+        if self.sample_rate > 0:
+            return random.random() < self.sample_rate
+        return False
+
+    @contextmanager
+    def capture(self, label: str):
+        """Profile the block; yields a dict whose "path" is set to the stats file afterwards"""
+        result = {"path": None}
+        profiler = cProfile.Profile()
+        self._active = True
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            self._active = False
+            os.makedirs(self.directory, exist_ok=True)
+            safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+            path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{os.getpid()}.prof")
+            profiler.dump_stats(path)
+            result["path"] = path
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from metrics import timed, MODEL_REQUESTS
+
+
+CLASSIFY_PROMPT = (
+    "Task: classify. You route messages for a food assistance service. "
+    "Programs: emergency_food_aid (no food now, disaster, urgent hunger), "
+    "nutrition_support (infants, children, pregnancy, malnutrition), "
+    "general_food_access (groceries, regular food support, anything else). "
+    'Reply with JSON only: {"program": "<one of the programs>"}'
+)
+
+EXTRACT_PROMPT = (
+    "Task: extract. Read a beneficiary's message to a food assistance service. "
+    "Fields wanted: {fields}. name is the person's name, age is their age in years, "
+    "assistance_request is what help they are asking for. "
+    "Reply with JSON only, using null for anything the message does not say: "
+    '{{"name": ..., "age": ..., "assistance_request": ...}}'
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Cache key form of a message: casefolded, whitespace collapsed, edge punctuation stripped"""
+    return _WHITESPACE_RE.sub(" ", message.casefold()).strip(" .,!?;:'\"")
+
+
+class ModelAssistant:
+    def __init__(
+        self,
+        model: str,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        budget_seconds: Optional[float] = None,
+        timeout_seconds: Optional[float] = None,
+        cache_size: Optional[int] = None,
+        cache_ttl: Optional[float] = None
+    ):
+        """
+        LLM fallback for turns the keyword classifier and slot patterns can't resolve.
+
+        Answers are cached by task and normalized message (LRU, LLM_CACHE_SIZE entries
+        for LLM_CACHE_TTL seconds), and identical prompts already in flight share one
+        model call. A caller waits at most LLM_BUDGET_MS and then falls back to the
+        heuristic result; the call keeps running so its answer still lands in the cache.
+        """
+        # Imported here so the chat path doesn't load the OpenAI client unless a model is configured
+        from langchain_openai import ChatOpenAI
+
+        self.budget_seconds = (
+            budget_seconds if budget_seconds is not None
+            else float(os.getenv("LLM_BUDGET_MS", "800")) / 1000
+        )
+        timeout_seconds = timeout_seconds if timeout_seconds is not None else float(os.getenv("LLM_TIMEOUT", "10"))
+        self.capacity = cache_size if cache_size is not None else int(os.getenv("LLM_CACHE_SIZE", "4096"))
+        self.ttl_seconds = cache_ttl if cache_ttl is not None else float(os.getenv("LLM_CACHE_TTL", "3600"))
+        self.model = ChatOpenAI(
+            model=model,
+            base_url=base_url or None,
+            api_key=api_key or "unused",
+            timeout=timeout_seconds,
+            max_retries=0,
+            temperature=0
+        )
+
+        # (task, normalized message) -> (expires_at, answer)
+        self._cache: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.requests: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional["ModelAssistant"]:
+        """Build an assistant from LLM_MODEL / LLM_BASE_URL / LLM_API_KEY, or None if no model is configured"""
+        model = os.getenv("LLM_MODEL", "")
+        if not model:
+            return None
+        try:
+            return cls(
+                model,
+                base_url=os.getenv("LLM_BASE_URL", ""),
+                api_key=os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY", "")
+            )
+        except ImportError as e:
+            print(f"Warning: LLM_MODEL is set but the model client is unavailable ({e}); using keyword routing only.")
+            return None
+
+    def _count(self, outcome: str, task: str):
+        self.requests[outcome] = self.requests.get(outcome, 0) + 1
+        # Extract tasks are keyed per wanted-field set; the metric only needs the kind
+        MODEL_REQUESTS.inc(task.split(":")[0], outcome)
+
+    def _get_cached(self, key: Tuple[str, str]):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _put_cached(self, key: Tuple[str, str], answer: Optional[Dict]):
+        if self.capacity <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, answer)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    async def _call(self, key: Tuple[str, str], system_prompt: str, message: str) -> Optional[Dict]:
+        """One model request; the parsed JSON answer is cached, errors are not"""
+        try:
+            response = await self.model.ainvoke([("system", system_prompt), ("human", message)])
+            content = response.content if isinstance(response.content, str) else ""
+            # Tolerate a fenced or chatty reply around the JSON object
+            start, end = content.find("{"), content.rfind("}")
+            answer = json.loads(content[start:end + 1]) if start != -1 and end > start else None
+            if not isinstance(answer, dict):
+                answer = None
+        except Exception as e:
+            print(f"Error calling model: {e}")
+            self._count("error", key[0])
+            return None
+        finally:
+            self._inflight.pop(key, None)
+        self._put_cached(key, answer)
+        return answer
+
+    async def _ask(self, task: str, system_prompt: str, message: str) -> Optional[Dict]:
+        """Cached, coalesced and time-boxed model answer; None if there is none within the budget"""
+        key = (task, normalize_message(message))
+        cached = self._get_cached(key)
+        if cached is not None:
+            self._count("cache_hit", task)
+            return cached[1]
+
+        call = self._inflight.get(key)
+        if call is None:
+            self._count("model_call", task)
+            call = self._inflight[key] = asyncio.create_task(self._call(key, system_prompt, message))
+        else:
+            self._count("coalesced", task)
+
+        try:
+            # Shielded so a caller running out of budget doesn't cancel the call for everyone else
+            return await asyncio.wait_for(asyncio.shield(call), self.budget_seconds)
+        except asyncio.TimeoutError:
+            self._count("over_budget", task)
+            return None
+
+    @timed("model_classify")
+    async def classify(self, message: str, programs: Tuple[str, ...]) -> Optional[str]:
+        """Program the model picks for a message, or None"""
+        answer = await self._ask("classify", CLASSIFY_PROMPT, message)
+        program = answer.get("program") if answer else None
+        return program if program in programs else None
+
+    @timed("model_extract")
+    async def extract(self, message: str, fields: List[str]) -> Dict:
+        """Slots the model finds in a message, limited to `fields` and validated; missing ones are omitted"""
+        # Cached per set of wanted fields, since the prompt differs
+        answer = await self._ask(
+            "extract:" + ",".join(fields),
+            EXTRACT_PROMPT.format(fields=", ".join(fields)),
+            message
+        ) or {}
+
+        slots = {}
+        name = answer.get("name")
+        if "name" in fields and isinstance(name, str) and name.strip():
+            slots["name"] = name.strip()
+        age = answer.get("age")
+        if "age" in fields and isinstance(age, (int, float, str)) and not isinstance(age, bool):
+            try:
+                age = int(float(age))
+            except (ValueError, OverflowError):
+                # Not a number, NaN, or infinite ("Infinity", "1e400")
+                age = None
+            if age is not None and 0 <= age <= 130:
+                slots["age"] = age
+        request = answer.get("assistance_request")
+        if "assistance_request" in fields and isinstance(request, str) and request.strip():
+            slots["assistance_request"] = request.strip()
+        return slots
+
+    def stats(self) -> Dict:
+        lookups = sum(self.requests.get(outcome, 0) for outcome in ("cache_hit", "coalesced", "model_call"))
+        return {
+            "requests": dict(self.requests),
+            "cache_size": len(self._cache),
+            "cache_hit_ratio": round(self.requests.get("cache_hit", 0) / lookups, 4) if lookups else None
+        }
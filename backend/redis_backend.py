@@ -0,0 +1,377 @@
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Optional, Dict, List
+
+
+_clients: Dict[str, "Redis"] = {}
+
+
+def get_redis(url: str) -> "Redis":
+    """Return the shared connection pool for a Redis URL"""
+    client = _clients.get(url)
+    if client is None:
+        try:
+            # Optional dependency, only imported when REDIS_URL is set
+            from redis.asyncio import Redis
+        except ImportError:
+            raise RuntimeError("REDIS_URL is set but the redis package is not installed (pip install redis)")
+        client = _clients[url] = Redis.from_url(url, decode_responses=True)
+    return client
+
+
+async def close_redis():
+    """Close every shared Redis connection pool"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+# Keys for one session share a hash tag so scripts touching several of them work on Redis Cluster
+def _session_key(session_id: str) -> str:
+    return f"zha:{{{session_id}}}:session"
+
+
+def _messages_key(session_id: str) -> str:
+    return f"zha:{{{session_id}}}:messages"
+
+
+def _cache_key(session_id: str) -> str:
+    return f"zha:{{{session_id}}}:cache"
+
+
+def _lock_key(session_id: str) -> str:
+    return f"zha:{{{session_id}}}:lock"
+
+
+# KEYS: session, messages. ARGV: expected version ('' if new), new version, changed slots JSON ('' if none), ttl, messages...
+# Changed slots are merged into the stored ones. Returns the new version, or -1 if the stored version does not match.
+_SAVE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'v')
+if ARGV[1] == '' then
+    if current then return -1 end
+elseif current ~= ARGV[1] then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'v', ARGV[2])
+if ARGV[3] ~= '' then
+    local slots = cjson.decode(redis.call('HGET', KEYS[1], 's') or '{}')
+    for field, value in pairs(cjson.decode(ARGV[3])) do
+        slots[field] = value
+    end
+    redis.call('HSET', KEYS[1], 's', cjson.encode(slots))
+end
+for i = 5, #ARGV do
+    redis.call('RPUSH', KEYS[2], ARGV[i])
+end
+local ttl = tonumber(ARGV[4])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+    redis.call('EXPIRE', KEYS[2], ttl)
+end
+return tonumber(ARGV[2])
+"""
+
+# KEYS: cache. ARGV: version, state JSON, ttl. Only replaces an entry with an older version.
+_CACHE_PUT_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'v')
+if current and tonumber(current) > tonumber(ARGV[1]) then return 0 end
+redis.call('HSET', KEYS[1], 'v', ARGV[1], 'state', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+# KEYS: lock. ARGV: token. Deletes the lock only if we still own it.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _encode_message(message: Dict) -> str:
+    return json.dumps([message.get("role"), message.get("content", "")], separators=(",", ":"))
+
+
+def _decode_messages(raw: List[str]) -> List[Dict]:
+    messages = []
+    for item in raw:
+        role, content = json.loads(item)
+        messages.append({"role": role, "content": content})
+    return messages
+
+
+class RedisSessionBackend:
+    def __init__(self, url: str, ttl_seconds: Optional[float] = None):
+        """
+        Conversation state in Redis, shared by every worker, for running without Supabase.
+
+        Each session is a hash (version and slot fields) plus a list of messages,
+        both expiring after REDIS_SESSION_TTL seconds without a save.
+        """
+        self.client = get_redis(url)
+        self.ttl_seconds = int(ttl_seconds if ttl_seconds is not None else float(os.getenv("REDIS_SESSION_TTL", "86400")))
+        self._save = self.client.register_script(_SAVE_SCRIPT)
+
+    async def save(
+        self,
+        session_id: str,
+        slots: Dict,
+        new_messages: List[Dict],
+        expected_version: Optional[int]
+    ) -> Optional[int]:
+        """Check the version, merge changed slots and append messages atomically; None on a version conflict"""
+        new_version = (expected_version or 0) + 1
+        result = await self._save(
+            keys=[_session_key(session_id), _messages_key(session_id)],
+            args=[
+                "" if expected_version is None else str(expected_version),
+                new_version,
+                json.dumps(slots) if slots else "",
+                self.ttl_seconds,
+                *(_encode_message(m) for m in new_messages)
+            ]
+        )
+        return None if int(result) < 0 else new_version
+
+    async def save_many(self, conversations: List[Dict], patches: List[Dict]) -> Dict[str, Optional[int]]:
+        """
+        Save several conversations in one round trip, each with the version check
+        of save; `patches` holds each one's slot fields to write.
+
+        Returns each session's new version, or None if its script failed; sessions
+        whose stored version no longer matches are left out.
+        """
+        async with self.client.pipeline(transaction=False) as pipe:
+            for item, patch in zip(conversations, patches):
+                expected_version = item.get("expected_version")
+                await self._save(
+                    keys=[_session_key(item["session_id"]), _messages_key(item["session_id"])],
+                    args=[
+                        "" if expected_version is None else str(expected_version),
+                        (expected_version or 0) + 1,
+                        json.dumps(patch) if patch else "",
+                        self.ttl_seconds,
+                        *(_encode_message(m) for m in item["new_messages"])
+                    ],
+                    client=pipe
+                )
+            results = await pipe.execute(raise_on_error=False)
+
+        versions = {}
+        for item, result in zip(conversations, results):
+            if isinstance(result, Exception):
+                versions[item["session_id"]] = None
+            elif int(result) >= 0:
+                versions[item["session_id"]] = int(result)
+        return versions
+
+    @staticmethod
+    def _to_state(session_id: str, version, slots, raw_messages: List[str]) -> Optional[Dict]:
+        if version is None:
+            return None
+        slots = json.loads(slots) if slots else {}
+        messages = _decode_messages(raw_messages)
+        return {
+            "messages": messages,
+            "session_id": session_id,
+            "program": slots.get("program"),
+            "beneficiary_name": slots.get("beneficiary_name"),
+            "beneficiary_age": slots.get("beneficiary_age"),
+            "assistance_request": slots.get("assistance_request"),
+            "current_node": "start",
+            "saved_message_count": len(messages),
+            "version": int(version)
+        }
+
+    async def load(self, session_id: str, message_limit: int) -> Optional[Dict]:
+        states = await self.load_many([session_id], message_limit)
+        return states.get(session_id)
+
+    async def load_many(self, session_ids: List[str], message_limit: int) -> Dict[str, Dict]:
+        """Load slot fields and the last `message_limit` messages of several sessions in one round trip"""
+        async with self.client.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.hmget(_session_key(session_id), ["v", "s"])
+                if message_limit > 0:
+                    pipe.lrange(_messages_key(session_id), -message_limit, -1)
+            results = await pipe.execute()
+
+        states = {}
+        step = 2 if message_limit > 0 else 1
+        for index, session_id in enumerate(session_ids):
+            version, slots = results[index * step]
+            raw_messages = results[index * step + 1] if message_limit > 0 else []
+            state = self._to_state(session_id, version, slots, raw_messages)
+            if state is not None:
+                states[session_id] = state
+        return states
+
+
+class RedisSessionCache:
+    def __init__(self, url: str, ttl_seconds: float):
+        """Session-state cache in Redis, shared by all workers, in front of Supabase"""
+        self.client = get_redis(url)
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._put = self.client.register_script(_CACHE_PUT_SCRIPT)
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        raw = await self.client.hget(_cache_key(session_id), "state")
+        return json.loads(raw) if raw else None
+
+    async def put(self, session_id: str, state: Dict):
+        await self._put(
+            keys=[_cache_key(session_id)],
+            args=[state.get("version") or 0, json.dumps(state), self.ttl_seconds]
+        )
+
+    async def pop(self, session_id: str):
+        await self.client.delete(_cache_key(session_id))
+
+
+class RedisSessionLock:
+    def __init__(self, url: str, lease_seconds: Optional[float] = None, wait_seconds: Optional[float] = None):
+        """
+        Per-session mutual exclusion across workers: SET NX PX to acquire, compare-and-delete to release.
+
+        A lock expires after REDIS_LOCK_LEASE seconds in case its holder dies;
+        waiters give up after REDIS_LOCK_WAIT seconds.
+        """
+        self.client = get_redis(url)
+        lease_seconds = lease_seconds if lease_seconds is not None else float(os.getenv("REDIS_LOCK_LEASE", "30"))
+        self.lease_ms = int(lease_seconds * 1000)
+        self.wait_seconds = wait_seconds if wait_seconds is not None else float(os.getenv("REDIS_LOCK_WAIT", "10"))
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+
+    async def acquire(self, session_id: str) -> Optional[str]:
+        """Return a token once the lock is held, or None if it could not be taken within wait_seconds"""
+        key = _lock_key(session_id)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_seconds
+        delay = 0.005
+        while True:
+            if await self.client.set(key, token, nx=True, px=self.lease_ms):
+                return token
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, 0.1)
+
+    async def release(self, session_id: str, token: str):
+        await self._release(keys=[_lock_key(session_id)], args=[token])
+
+
+class RedisOutboxStore:
+    """Webhook outbox in Redis: a hash per entry plus a sorted set of entries by next attempt time"""
+
+    # Every outbox key shares one hash tag so the scripts below work on Redis Cluster
+    DUE_KEY = "zha:{outbox}:due"
+
+    _INSERT_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+    redis.call('HSET', KEYS[1], 'payload', ARGV[2], 'status', 'pending', 'attempts', 0, 'next_attempt_at', ARGV[3])
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    return 1
+    """
+
+    _CLAIM_SCRIPT = """
+    if redis.call('HGET', KEYS[1], 'attempts') ~= ARGV[2] then return 0 end
+    redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+    redis.call('HSET', KEYS[1], 'status', 'sending', 'next_attempt_at', ARGV[3])
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    return 1
+    """
+
+    _UPDATE_SCRIPT = """
+    redis.call('HSET', KEYS[1], 'status', ARGV[2], 'next_attempt_at', ARGV[3], 'last_error', ARGV[4])
+    if ARGV[2] == 'pending' or ARGV[2] == 'sending' then
+        redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    else
+        redis.call('ZREM', KEYS[2], ARGV[1])
+        local retention = tonumber(ARGV[5])
+        if retention > 0 then redis.call('EXPIRE', KEYS[1], retention) end
+    end
+    return 1
+    """
+
+    def __init__(self, url: str):
+        self.client = get_redis(url)
+        # Finished entries are kept this long so a repeat enqueue is still recognised
+        self.retention_seconds = int(float(os.getenv("REDIS_OUTBOX_RETENTION", str(7 * 86400))))
+        self._insert_script = self.client.register_script(self._INSERT_SCRIPT)
+        self._claim_script = self.client.register_script(self._CLAIM_SCRIPT)
+        self._update_script = self.client.register_script(self._UPDATE_SCRIPT)
+
+    @staticmethod
+    def _entry_key(key: str) -> str:
+        return f"zha:{{outbox}}:entry:{key}"
+
+    async def insert(self, key: str, payload: Dict) -> bool:
+        result = await self._insert_script(
+            keys=[self._entry_key(key), self.DUE_KEY],
+            args=[key, json.dumps(payload), time.time()]
+        )
+        return bool(result)
+
+    async def fetch_due(self, limit: int) -> List[Dict]:
+        keys = await self.client.zrangebyscore(self.DUE_KEY, "-inf", time.time(), start=0, num=limit)
+        if not keys:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hmget(self._entry_key(key), ["payload", "attempts"])
+            rows = await pipe.execute()
+        return [
+            {"idempotency_key": key, "payload": json.loads(payload), "attempts": int(attempts)}
+            for key, (payload, attempts) in zip(keys, rows)
+            if payload is not None
+        ]
+
+    async def claim(self, key: str, attempts: int, lease_until: float) -> bool:
+        result = await self._claim_script(
+            keys=[self._entry_key(key), self.DUE_KEY],
+            args=[key, str(attempts), lease_until]
+        )
+        return bool(result)
+
+    async def update(self, key: str, status: str, next_attempt_at: float, last_error: Optional[str] = None):
+        await self._update_script(
+            keys=[self._entry_key(key), self.DUE_KEY],
+            args=[key, status, next_attempt_at, last_error or "", self.retention_seconds]
+        )
+
+
+class RedisRegistrationStore:
+    """Registration dedup keys in Redis; each key holds the owning session and expires with the window"""
+
+    # KEYS: registration. ARGV: session id, window in ms. Returns 1 if the session owns the registration.
+    _CLAIM_SCRIPT = """
+    local owner = redis.call('GET', KEYS[1])
+    if owner and owner ~= ARGV[1] then return 0 end
+    if not owner then redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2]) end
+    return 1
+    """
+
+    def __init__(self, url: str):
+        self.client = get_redis(url)
+        self._claim_script = self.client.register_script(self._CLAIM_SCRIPT)
+
+    @staticmethod
+    def _registration_key(key: str) -> str:
+        return f"zha:{{{key}}}:registration"
+
+    async def claim(self, key: str, session_id: str, now: float, window: float) -> bool:
+        result = await self._claim_script(
+            keys=[self._registration_key(key)],
+            args=[session_id, max(1, int(window * 1000))]
+        )
+        return bool(result)
+
+    async def recent(self, since: float, limit: int) -> List[Dict]:
+        # Every check goes to Redis anyway, so there is nothing worth scanning for at startup
+        return []
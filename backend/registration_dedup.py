@@ -0,0 +1,190 @@
+import hashlib
+import os
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+from database import Database
+from metrics import timed, REGISTRATION_DUPLICATES
+from redis_backend import RedisRegistrationStore
+
+
+def normalize_name(name: str) -> str:
+    """Casefold, drop accents from Latin letters and punctuation, and collapse whitespace"""
+    kept = []
+    for char in unicodedata.normalize("NFKD", name):
+        # Only accents on ASCII letters; marks in other scripts are part of the spelling
+        if unicodedata.combining(char) and kept and kept[-1].isascii():
+            continue
+        kept.append(char)
+    text = unicodedata.normalize("NFKC", "".join(kept)).casefold()
+    # Vowel signs and viramas are marks, not word characters, so keep them explicitly
+    cleaned = "".join(
+        char if char.isalnum() or unicodedata.category(char).startswith("M") else " "
+        for char in text
+    )
+    return " ".join(cleaned.split())
+
+
+def registration_key(beneficiary_name: str, beneficiary_age: int, program: str) -> str:
+    """Fixed-size key for a normalized (name, age, program), so names are not stored in the index"""
+    raw = f"{normalize_name(beneficiary_name)}|{int(beneficiary_age)}|{program}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SupabaseRegistrationStore:
+    """Registration dedup keys in the registration_dedup table"""
+
+    def __init__(self, db: Database, page_size: int = 1000):
+        self.db = db
+        self.page_size = page_size
+
+    async def claim(self, key: str, session_id: str, now: float, window: float) -> bool:
+        client = await self.db._get_client()
+        result = await client.table("registration_dedup").upsert(
+            {"dedup_key": key, "session_id": session_id, "registered_at": now},
+            on_conflict="dedup_key",
+            ignore_duplicates=True
+        ).execute()
+        if result.data:
+            return True
+
+        # Already registered: still ours if it was this session, or if that registration left the window
+        quoted = session_id.replace("\\", "\\\\").replace('"', '\\"')
+        result = await client.table("registration_dedup").update({
+            "session_id": session_id,
+            "registered_at": now
+        }).eq(
+            "dedup_key", key
+        ).or_(
+            f'session_id.eq."{quoted}",registered_at.lt.{now - window}'
+        ).execute()
+        return bool(result.data)
+
+    async def recent(self, since: float, limit: int) -> List[Dict]:
+        """Newest registrations since `since`, at most `limit`, paged with a (registered_at, dedup_key) keyset"""
+        client = await self.db._get_client()
+        rows: List[Dict] = []
+        last = None
+        while len(rows) < limit:
+            query = client.table("registration_dedup").select(
+                "dedup_key,session_id,registered_at"
+            ).gte("registered_at", since)
+            if last is not None:
+                query = query.or_(
+                    f"registered_at.lt.{last['registered_at']},"
+                    f"and(registered_at.eq.{last['registered_at']},dedup_key.gt.{last['dedup_key']})"
+                )
+            page_size = min(self.page_size, limit - len(rows))
+            result = await query.order("registered_at", desc=True).order("dedup_key").limit(page_size).execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+            last = page[-1]
+        return rows
+
+
+class RegistrationDedup:
+    def __init__(self, db: Optional[Database] = None):
+        """
+        Suppresses repeat registrations of the same beneficiary before the webhook.
+
+        Registrations are keyed by normalized (name, age, program); a key registered
+        by another session within REGISTRATION_DEDUP_WINDOW seconds is a duplicate.
+        Recent keys are kept in memory, warmed from the database on start, so repeats
+        are caught without a round trip. New keys are claimed in the registration_dedup
+        table or, in mock mode, in Redis (REDIS_URL), so workers agree on which session
+        registered first. Without either, the in-memory index is the only record.
+        """
+        db = db or Database()
+        if db.mock_mode and db.redis_url:
+            self.store = RedisRegistrationStore(db.redis_url)
+        elif db.mock_mode:
+            self.store = None
+        else:
+            self.store = SupabaseRegistrationStore(db)
+
+        self.window = float(os.getenv("REGISTRATION_DEDUP_WINDOW", str(7 * 86400)))
+        self.max_keys = int(os.getenv("REGISTRATION_DEDUP_MAX_KEYS", "100000"))
+        # key -> (registered_at, session_id), oldest first
+        self._seen: Dict[str, Tuple[float, str]] = {}
+        # (key, session_id) pairs already suppressed, so later turns are neither recounted nor re-checked
+        self._suppressed: Dict[Tuple[str, str], None] = {}
+        self.duplicates = 0
+
+    def _expire(self, now: float):
+        seen = self._seen
+        while seen:
+            key, (registered_at, _) = next(iter(seen.items()))
+            if registered_at + self.window >= now:
+                break
+            del seen[key]
+
+    def _remember(self, key: str, registered_at: float, session_id: str):
+        self._seen.pop(key, None)
+        self._seen[key] = (registered_at, session_id)
+        while len(self._seen) > self.max_keys:
+            del self._seen[next(iter(self._seen))]
+
+    def _duplicate(self, key: str, session_id: str, program: str) -> bool:
+        self._suppressed[(key, session_id)] = None
+        while len(self._suppressed) > self.max_keys:
+            del self._suppressed[next(iter(self._suppressed))]
+        self.duplicates += 1
+        REGISTRATION_DUPLICATES.inc(program)
+        return False
+
+    @timed("registration_dedup")
+    async def claim(
+        self,
+        session_id: str,
+        beneficiary_name: str,
+        beneficiary_age: int,
+        program: str
+    ) -> bool:
+        """
+        Return True if this session's registration should be sent, False if it
+        repeats one registered by another session within the window.
+
+        Later turns of the registering session keep returning True; the outbox
+        already drops those by idempotency key.
+        """
+        if self.window <= 0:
+            return True
+        key = registration_key(beneficiary_name, beneficiary_age, program)
+        now = time.time()
+        self._expire(now)
+
+        if (key, session_id) in self._suppressed:
+            return False
+        seen = self._seen.get(key)
+        if seen is not None:
+            return True if seen[1] == session_id else self._duplicate(key, session_id, program)
+
+        if self.store is not None:
+            try:
+                owned = await self.store.claim(key, session_id, now, self.window)
+            except Exception as e:
+                # Let it through; a missed duplicate is better than a lost registration
+                print(f"Error checking for duplicate registration: {e}")
+                return True
+            if not owned:
+                return self._duplicate(key, session_id, program)
+
+        self._remember(key, now, session_id)
+        return True
+
+    async def start(self):
+        """Load keys registered within the window into the in-memory index"""
+        if self.store is None or self.window <= 0:
+            return
+        try:
+            rows = await self.store.recent(time.time() - self.window, self.max_keys)
+        except Exception as e:
+            print(f"Error loading recent registrations: {e}")
+            return
+        for row in sorted(rows, key=lambda row: row["registered_at"]):
+            self._remember(row["dedup_key"], row["registered_at"], row["session_id"])
+
+    def stats(self) -> Dict:
+        return {"keys": len(self._seen), "duplicates": self.duplicates, "window_seconds": self.window}
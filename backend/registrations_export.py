@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+from typing import AsyncIterator, Dict, List, Optional
+from database import Database, REGISTRATION_COLUMNS, UnsupportedBackendError, parse_timestamp
+
+# Rows written per chunk, so streaming does not cost one send per row
+CHUNK_ROWS = 200
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def ndjson_chunks(rows: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    """One JSON object per line"""
+    lines: List[str] = []
+    async for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False) + "\n")
+        if len(lines) >= CHUNK_ROWS:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+async def csv_chunks(rows: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    """A header line followed by one line per registration"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REGISTRATION_COLUMNS)
+    count = 0
+    async for row in rows:
+        writer.writerow([_csv_cell(row.get(column)) for column in REGISTRATION_COLUMNS])
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_chunks(rows: AsyncIterator[Dict], output_format: str) -> AsyncIterator[str]:
+    return csv_chunks(rows) if output_format == "csv" else ndjson_chunks(rows)
+
+
+async def export(args) -> int:
+    database = Database()
+    await database.start()
+    try:
+        rows = database.iter_registrations(
+            program=args.program,
+            created_from=args.created_from,
+            created_to=args.created_to,
+            page_size=args.page_size
+        )
+    except UnsupportedBackendError as e:
+        await database.stop()
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for chunk in export_chunks(rows, args.format):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await database.stop()
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export completed registrations as NDJSON or CSV")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--program", help="only this program")
+    parser.add_argument("--from", dest="created_from", help="created at or after this ISO 8601 date/time")
+    parser.add_argument("--to", dest="created_to", help="created before this ISO 8601 date/time")
+    parser.add_argument("--page-size", type=int, default=500, help="rows fetched per database request")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+    for value in (args.created_from, args.created_to):
+        if value:
+            try:
+                parse_timestamp(value)
+            except ValueError:
+                parser.error(f"not an ISO 8601 date/time: {value}")
+    return asyncio.run(export(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
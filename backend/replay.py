@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+from database import SLOT_FIELDS
+
+# Set in every worker before the flow is built: no database, webhook or model
+OFFLINE_ENV = {
+    "SUPABASE_URL": "",
+    "SUPABASE_KEY": "",
+    "REDIS_URL": "",
+    "WEBHOOK_URL": "",
+    "LLM_MODEL": "",
+}
+
+# Set per worker process by _init_worker
+_flow = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _init_worker(keywords_path: Optional[str], worker_process: bool = True):
+    """Build one flow and event loop per process"""
+    global _flow, _loop
+    if worker_process:
+        # Stage timers and counters would only measure the replay; turning them off
+        # before the flow is imported leaves its methods undecorated. Not when
+        # replaying in the caller's process, whose metrics they are.
+        import metrics
+        metrics.ENABLED = False
+    from conversation_flow import ConversationFlow
+    from intent_classifier import IntentClassifier
+    # Offline only while the flow is built, so the caller's settings are left as they were
+    saved = {name: os.environ.get(name) for name in OFFLINE_ENV}
+    os.environ.update(OFFLINE_ENV)
+    try:
+        _flow = ConversationFlow(classifier=IntentClassifier.from_file(keywords_path) if keywords_path else None)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    _loop = asyncio.new_event_loop()
+
+
+async def _replay(row: Dict) -> Tuple[Dict, int]:
+    """Run a conversation's user messages through routing and slot extraction; returns (slots, messages)"""
+    state = _flow.new_state(str(row.get("session_id", "")))
+    count = 0
+    for message in row.get("messages") or ():
+        if message.get("role") != "user":
+            continue
+        content = message.get("content") or ""
+        # The router and the patterns only look at the newest message
+        state["messages"] = [{"role": "user", "content": content}]
+        if state["program"] is None:
+            await _flow.router_node(state)
+        _flow._extract_info_from_message(state, content)
+        count += 1
+    return {field: state.get(field) for field in SLOT_FIELDS}, count
+
+
+def _compare(row: Dict, replayed: Dict) -> Dict[str, str]:
+    """How each field moved from the recorded row to the replay: changed, gained or lost (same ones omitted)"""
+    changes = {}
+    for field in SLOT_FIELDS:
+        old, new = row.get(field), replayed[field]
+        if old == new:
+            continue
+        changes[field] = "gained" if old is None else "lost" if new is None else "changed"
+    return changes
+
+
+def replay_chunk(lines: List[str], samples: int) -> Dict:
+    """Replay a chunk of NDJSON conversation rows and summarize it"""
+    return _loop.run_until_complete(_replay_chunk(lines, samples))
+
+
+async def _replay_chunk(lines: List[str], samples: int) -> Dict:
+    summary = {
+        "conversations": 0,
+        "messages": 0,
+        "changed": 0,
+        "invalid": 0,
+        "fields": Counter(),
+        "programs": Counter(),
+        "diffs": [],
+    }
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+            replayed, count = await _replay(row)
+        except (ValueError, TypeError, AttributeError):
+            summary["invalid"] += 1
+            continue
+        summary["conversations"] += 1
+        summary["messages"] += count
+        changes = _compare(row, replayed)
+        if not changes:
+            continue
+        summary["changed"] += 1
+        for field, kind in changes.items():
+            summary["fields"][(field, kind)] += 1
+        if "program" in changes:
+            summary["programs"][(row.get("program"), replayed["program"])] += 1
+        summary["diffs"].append({
+            "session_id": row.get("session_id"),
+            "changes": {field: {"before": row.get(field), "after": replayed[field]} for field in changes},
+        })
+    if samples >= 0:
+        # All diffs only go back to the parent when it writes them to a file
+        summary["diffs"] = summary["diffs"][:samples]
+    return summary
+
+
+def _chunks(lines: Iterator[str], size: int) -> Iterator[List[str]]:
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def replay(
+    lines: Iterator[str],
+    workers: int,
+    chunk_size: int,
+    keywords_path: Optional[str] = None,
+    samples: int = 20,
+    diffs_out=None
+) -> Dict:
+    """
+    Replay NDJSON conversation rows with `workers` processes (0 runs in this one).
+
+    At most two chunks per worker are read ahead, so memory stays flat however
+    long the input is. Diffs are written to `diffs_out` as they arrive, if given,
+    and up to `samples` of them are kept for the report.
+    """
+    totals = {"conversations": 0, "messages": 0, "changed": 0, "invalid": 0}
+    fields, programs, kept = Counter(), Counter(), []
+    # With a diff file every diff comes back from the workers; otherwise only the samples
+    chunk_samples = -1 if diffs_out is not None else samples
+
+    def merge(summary: Dict):
+        for key in totals:
+            totals[key] += summary[key]
+        fields.update(summary["fields"])
+        programs.update(summary["programs"])
+        for diff in summary["diffs"]:
+            if diffs_out is not None:
+                diffs_out.write(json.dumps(diff, ensure_ascii=False) + "\n")
+            if len(kept) < samples:
+                kept.append(diff)
+
+    start = time.perf_counter()
+    if workers <= 0:
+        _init_worker(keywords_path, worker_process=False)
+        for chunk in _chunks(lines, chunk_size):
+            merge(replay_chunk(chunk, chunk_samples))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(keywords_path,)) as pool:
+            pending = set()
+            for chunk in _chunks(lines, chunk_size):
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge(future.result())
+                pending.add(pool.submit(replay_chunk, chunk, chunk_samples))
+            for future in pending:
+                merge(future.result())
+    elapsed = time.perf_counter() - start
+
+    return {
+        **totals,
+        "seconds": round(elapsed, 3),
+        "messages_per_sec": round(totals["messages"] / elapsed, 1) if elapsed else None,
+        "fields": {
+            field: {kind: fields[(field, kind)] for kind in ("changed", "gained", "lost") if fields[(field, kind)]}
+            for field in SLOT_FIELDS
+            if any(fields[(field, kind)] for kind in ("changed", "gained", "lost"))
+        },
+        "program_moves": [
+            {"before": before, "after": after, "conversations": count}
+            for (before, after), count in programs.most_common()
+        ],
+        "samples": kept,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Replay exported conversations through routing and slot extraction and report what changes"
+    )
+    parser.add_argument("input", help="NDJSON file of conversation rows with a messages list, or - for stdin")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (0: replay in this process)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="conversations sent to a worker at a time")
+    parser.add_argument("--keywords", help="routing keyword file to replay with (default: PROGRAM_KEYWORDS_PATH)")
+    parser.add_argument("--samples", type=int, default=20, help="changed conversations to include in the report")
+    parser.add_argument("--diffs", help="write every changed conversation to this NDJSON file")
+    parser.add_argument("--output", help="JSON report path (default: stdout)")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    diffs_out = open(args.diffs, "w", encoding="utf-8") if args.diffs else None
+    try:
+        report = replay(source, args.workers, args.chunk_size, args.keywords, args.samples, diffs_out)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if diffs_out is not None:
+            diffs_out.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+    print(
+        f"{report['conversations']} conversations, {report['messages']} messages in {report['seconds']}s "
+        f"({report['messages_per_sec']} msgs/sec); {report['changed']} changed, {report['invalid']} invalid",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
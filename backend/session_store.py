@@ -0,0 +1,323 @@
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager, AsyncExitStack
+import os
+import time
+import uuid
+from typing import Optional, Dict, Iterable, List
+from database import Database, ConcurrentUpdateError
+from metrics import timed, SESSION_INSERTS_AVOIDED
+from redis_backend import RedisSessionCache, RedisSessionLock
+
+
+class SessionLocks:
+    """In-process async locks keyed by session id; a lock exists only while someone holds or waits for it"""
+
+    def __init__(self):
+        # session_id -> [lock, holders and waiters]
+        self._locks: Dict[str, list] = {}
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        """Serialize everything inside the block for one session"""
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    @asynccontextmanager
+    async def hold_many(self, session_ids: List[str]):
+        """Hold several session locks, acquired in sorted order to avoid deadlocks"""
+        async with AsyncExitStack() as stack:
+            for session_id in sorted(set(session_ids)):
+                await stack.enter_async_context(self.hold(session_id))
+            yield
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class RedisSessionLocks(SessionLocks):
+    """Session locks shared by all workers: the in-process lock first, then a Redis lease"""
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.redis_lock = RedisSessionLock(url)
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        async with super().hold(session_id):
+            token = await self.redis_lock.acquire(session_id)
+            if token is None:
+                # The version check on save still stops lost updates
+                print(f"Timed out waiting for the lock on session {session_id}, continuing without it")
+            try:
+                yield
+            finally:
+                if token is not None:
+                    await self.redis_lock.release(session_id, token)
+
+
+class SessionStore:
+    def __init__(
+        self,
+        db: Optional[Database] = None,
+        capacity: Optional[int] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        """
+        Session store with a bounded write-through LRU/TTL cache in front of the database.
+
+        Capacity and TTL default to SESSION_CACHE_SIZE and SESSION_CACHE_TTL.
+        With REDIS_URL set, locks are shared by all workers and so is the cache
+        in front of Supabase; when Redis itself holds the state there is no cache.
+        """
+        self.db = db or Database()
+        self.capacity = capacity if capacity is not None else int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SESSION_CACHE_TTL", "1800"))
+        self.shared_cache: Optional[RedisSessionCache] = None
+        if self.db.redis_url:
+            self.locks: SessionLocks = RedisSessionLocks(self.db.redis_url)
+            # A per-worker copy would go stale as soon as another worker saves the session
+            self.capacity = 0
+            if self.db.redis is None:
+                self.shared_cache = RedisSessionCache(self.db.redis_url, self.ttl_seconds)
+        else:
+            self.locks = SessionLocks()
+
+        # session_id -> (expires_at, state)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_cached(self, session_id: str) -> Optional[Dict]:
+        """Return the cached state for a session, dropping it if expired"""
+        entry = self._cache.get(session_id)
+        if entry is None:
+            return None
+
+        expires_at, state = entry
+        if expires_at < time.monotonic():
+            del self._cache[session_id]
+            return None
+
+        self._cache.move_to_end(session_id)
+        return state
+
+    def _put_cached(self, session_id: str, state: Dict):
+        """Insert or refresh a session in the cache, evicting the least recently used"""
+        if self.capacity <= 0:
+            return
+
+        self._cache[session_id] = (time.monotonic() + self.ttl_seconds, state)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def message_window(self) -> int:
+        """How many recent messages a loaded state carries"""
+        return self.db.message_window
+
+    async def _lookup(self, session_id: str) -> Optional[Dict]:
+        """Cached state from the shared cache or the local one"""
+        if self.shared_cache is not None:
+            return await self.shared_cache.get(session_id)
+        return self._get_cached(session_id)
+
+    async def _store(self, session_id: str, state: Dict):
+        """Cache a state in the shared cache or the local one"""
+        if self.shared_cache is not None:
+            await self.shared_cache.put(session_id, state)
+        else:
+            self._put_cached(session_id, state)
+
+    async def invalidate(self, session_id: str):
+        """Drop a session from the cache"""
+        self._cache.pop(session_id, None)
+        if self.shared_cache is not None:
+            await self.shared_cache.pop(session_id)
+
+    def stats(self) -> Dict:
+        """Return cache counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._cache),
+            "capacity": self.capacity,
+            "shared": self.shared_cache is not None
+        }
+
+    @timed("session_create")
+    async def create_session(self) -> str:
+        """
+        Mint a new session id and cache its empty state.
+
+        Nothing is written until the first save inserts the row, so visitors
+        who never finish a turn leave no empty rows behind.
+        """
+        session_id = str(uuid.uuid4())
+        SESSION_INSERTS_AVOIDED.inc()
+        await self._store(session_id, {
+            "messages": [],
+            "session_id": session_id,
+            "program": None,
+            "beneficiary_name": None,
+            "beneficiary_age": None,
+            "assistance_request": None,
+            "current_node": "start",
+            "saved_message_count": 0,
+            "version": None
+        })
+        return session_id
+
+    @timed("save")
+    async def save_conversation(
+        self,
+        session_id: str,
+        program: Optional[str],
+        beneficiary_name: Optional[str],
+        beneficiary_age: Optional[int],
+        assistance_request: Optional[str],
+        messages: List[Dict],
+        saved_message_count: int = 0,
+        expected_version: Optional[int] = None,
+        changed_slots: Optional[Iterable[str]] = None
+    ) -> Optional[int]:
+        """
+        Write conversation state through to the database and the cache.
+
+        Only `messages[saved_message_count:]` are appended to the message log,
+        and only `changed_slots` (all if None) are written to the row; the
+        cache keeps the last `message_window` messages. Returns the new
+        version; on ConcurrentUpdateError the cached copy is dropped.
+        """
+        try:
+            version = await self.db.save_conversation(
+                session_id=session_id,
+                program=program,
+                beneficiary_name=beneficiary_name,
+                beneficiary_age=beneficiary_age,
+                assistance_request=assistance_request,
+                new_messages=messages[saved_message_count:],
+                expected_version=expected_version,
+                changed_slots=changed_slots
+            )
+        except ConcurrentUpdateError:
+            await self.invalidate(session_id)
+            raise
+
+        if version is None:
+            # The write failed; don't cache state the database doesn't have
+            await self.invalidate(session_id)
+        else:
+            await self._cache_saved(session_id, program, beneficiary_name, beneficiary_age, assistance_request, messages, version)
+        return version
+
+    async def _cache_saved(
+        self,
+        session_id: str,
+        program: Optional[str],
+        beneficiary_name: Optional[str],
+        beneficiary_age: Optional[int],
+        assistance_request: Optional[str],
+        messages: List[Dict],
+        version: int
+    ):
+        """Cache a just-saved state, keeping the last `message_window` messages"""
+        window = messages[-self.db.message_window:] if self.db.message_window > 0 else []
+        await self._store(session_id, {
+            "messages": window,
+            "session_id": session_id,
+            "program": program,
+            "beneficiary_name": beneficiary_name,
+            "beneficiary_age": beneficiary_age,
+            "assistance_request": assistance_request,
+            "current_node": "start",
+            "saved_message_count": len(window),
+            "version": version
+        })
+
+    @timed("save_bulk")
+    async def save_conversations(self, states: List[Dict]) -> Dict[str, Optional[int]]:
+        """
+        Write several conversation states through in one bulk database write.
+
+        Returns each session's new version, or None if its write failed; sessions
+        saved elsewhere since they were loaded are left out. Both kinds are dropped
+        from the cache, so they are loaded afresh next time.
+        """
+        versions = await self.db.save_conversations([
+            {
+                "session_id": state["session_id"],
+                "program": state.get("program"),
+                "beneficiary_name": state.get("beneficiary_name"),
+                "beneficiary_age": state.get("beneficiary_age"),
+                "assistance_request": state.get("assistance_request"),
+                "new_messages": state["messages"][state.get("saved_message_count", 0):],
+                "expected_version": state.get("version"),
+                "changed_slots": state.get("dirty_slots", ())
+            }
+            for state in states
+        ])
+        for state in states:
+            version = versions.get(state["session_id"])
+            if version is None:
+                await self.invalidate(state["session_id"])
+                continue
+            await self._cache_saved(
+                state["session_id"],
+                state.get("program"),
+                state.get("beneficiary_name"),
+                state.get("beneficiary_age"),
+                state.get("assistance_request"),
+                state["messages"],
+                version
+            )
+        return versions
+
+    @timed("state_load")
+    async def load_conversation_state(self, session_id: str) -> Optional[Dict]:
+        """Load conversation state, skipping the database round trip on a cache hit"""
+        state = await self._lookup(session_id)
+        if state is not None:
+            self.hits += 1
+            # Hand out a copy so in-flight mutations don't leak into the cache
+            return {**state, "messages": list(state["messages"])}
+
+        self.misses += 1
+        state = await self.db.load_conversation_state(session_id)
+        if state is not None:
+            await self._store(session_id, {**state, "messages": list(state["messages"])})
+        return state
+
+    @timed("state_load_bulk")
+    async def load_conversation_states(self, session_ids: List[str]) -> Dict[str, Dict]:
+        """Load several states, fetching only the cache misses in one bulk query"""
+        states = {}
+        missing = []
+        for session_id in dict.fromkeys(session_ids):
+            state = await self._lookup(session_id)
+            if state is not None:
+                self.hits += 1
+                states[session_id] = {**state, "messages": list(state["messages"])}
+            else:
+                self.misses += 1
+                missing.append(session_id)
+
+        if missing:
+            loaded = await self.db.load_conversation_states(missing)
+            for session_id, state in loaded.items():
+                await self._store(session_id, {**state, "messages": list(state["messages"])})
+                states[session_id] = state
+        return states
@@ -0,0 +1,83 @@
+import re
+from typing import TypedDict, Optional
+
+
+# Patterns in priority order: the first pattern that matches anywhere in the message wins
+NAME_PATTERNS = (
+    r"my name is ([A-Za-z\s]+)",
+    r"i['']?m ([A-Za-z\s]+)",
+    r"name is ([A-Za-z\s]+)",
+    r"i am ([A-Za-z\s]+)",
+    # Spanish, Hindi and Marathi (see messages.json); names here may have accents or be in Devanagari
+    r"me llamo ([^\W\d_]+(?:[ ][^\W\d_]+)*)",
+    r"mi nombre es ([^\W\d_]+(?:[ ][^\W\d_]+)*)",
+    r"मेरा नाम ([\u0900-\u0963\u0970-\u097f ]+?)\s*(?:है|$)",
+    r"(?:माझे|माझं) नाव ([\u0900-\u0963\u0970-\u097f ]+?)\s*(?:आहे|$)",
+)
+
+AGE_PATTERNS = (
+    r"i['']?m (\d+) years? old",
+    r"age is (\d+)",
+    r"(\d+) years? old",
+    r"aged (\d+)",
+    r"(\d+) (?:años|साल|वर्ष)",
+)
+
+# Messages starting like this are name/age answers, not assistance requests.
+# Letters are matched ASCII-case-insensitively against the original message,
+# which gives the same result as matching message.lower() for these patterns.
+NAME_AGE_GUARD_PATTERNS = (
+    r"(?a:my name is|i['']?m|i am|name is)",
+    r"(?a:age is)|(?a:i['']?m )\d+|(?a:aged )\d+",
+    r"\d+$",  # Just a number (likely age)
+    r"me llamo|mi nombre es|tengo \d+|मेरा नाम|मेरी उम्र|मैं \d+|माझे नाव|माझं नाव|माझे वय|मी \d+",
+)
+
+# Compiled once at import time
+_NAME_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in NAME_PATTERNS)
+_AGE_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in AGE_PATTERNS)
+_NAME_AGE_GUARD_RE = re.compile(
+    "|".join(f"(?:{pattern})" for pattern in NAME_AGE_GUARD_PATTERNS),
+    re.IGNORECASE
+)
+
+
+class SlotCandidates(TypedDict):
+    name: Optional[str]
+    age: Optional[int]
+    is_name_or_age: bool
+
+
+def extract_slots(
+    message: str,
+    want_name: bool = True,
+    want_age: bool = True,
+    want_request: bool = True
+) -> SlotCandidates:
+    """
+    Return every slot candidate found in a message.
+
+    Slots that aren't wanted are not searched for and come back as None/False.
+    """
+    name = None
+    if want_name:
+        for name_re in _NAME_RES:
+            match = name_re.search(message)
+            if match:
+                name = match.group(1).strip()
+                break
+
+    age = None
+    if want_age:
+        for age_re in _AGE_RES:
+            match = age_re.search(message)
+            if match:
+                try:
+                    age = int(match.group(1))
+                    break
+                except ValueError:
+                    pass
+
+    is_name_or_age = bool(want_request and _NAME_AGE_GUARD_RE.match(message))
+
+    return {"name": name, "age": age, "is_name_or_age": is_name_or_age}
@@ -0,0 +1,29 @@
+-- Migration: move transcripts out of conversations.messages into an append-only log
+-- Run once in the Supabase SQL editor on databases created from an older supabase_schema.sql
+
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    id BIGSERIAL PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES conversations(session_id) ON DELETE CASCADE,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL DEFAULT '',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Create index for fetching the newest messages of a session
+CREATE INDEX IF NOT EXISTS idx_conversation_messages_session_id_id ON conversation_messages(session_id, id);
+
+-- Copy existing transcripts, preserving message order
+INSERT INTO conversation_messages (session_id, role, content, created_at)
+SELECT c.session_id, m.value->>'role', COALESCE(m.value->>'content', ''), c.created_at
+FROM conversations c
+CROSS JOIN LATERAL jsonb_array_elements(
+    CASE jsonb_typeof(c.messages)
+        WHEN 'array' THEN c.messages
+        WHEN 'string' THEN (c.messages #>> '{}')::jsonb
+        ELSE '[]'::jsonb
+    END
+) WITH ORDINALITY AS m(value, position)
+WHERE NOT EXISTS (
+    SELECT 1 FROM conversation_messages cm WHERE cm.session_id = c.session_id
+)
+ORDER BY c.id, m.position;
@@ -0,0 +1,15 @@
+-- Migration: durable outbox for beneficiary webhooks
+-- Completed registrations are queued here and delivered by the backend worker with retries
+
+CREATE TABLE IF NOT EXISTS webhook_outbox (
+    idempotency_key TEXT PRIMARY KEY,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DOUBLE PRECISION NOT NULL,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Create index for the worker's due-entry scan
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_status_next_attempt ON webhook_outbox(status, next_attempt_at);
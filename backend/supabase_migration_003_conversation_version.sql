@@ -0,0 +1,4 @@
+-- Migration: optimistic versioning for conversations
+-- The backend only updates a row whose version matches the one it loaded, then bumps it
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,19 @@
+-- Migration: indexes for the registrations export
+-- Completed registrations are read in (created_at, id) keyset order, optionally filtered by program
+
+CREATE INDEX IF NOT EXISTS idx_conversations_registrations_created_at_id ON conversations(created_at, id)
+    WHERE beneficiary_name IS NOT NULL AND beneficiary_age IS NOT NULL AND assistance_request IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_conversations_registrations_program_created_at_id ON conversations(program, created_at, id)
+    WHERE beneficiary_name IS NOT NULL AND beneficiary_age IS NOT NULL AND assistance_request IS NOT NULL;
+
+-- Keep updated_at current; the backend only sends slot fields
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_conversations_updated_at ON conversations;
+CREATE TRIGGER trg_conversations_updated_at BEFORE UPDATE ON conversations
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
@@ -0,0 +1,12 @@
+-- Migration: registration dedup index
+-- A completed registration is only sent if no other session registered the same beneficiary within the window
+
+-- Beneficiaries already registered, by a hash of normalized (name, age, program); registered_at is a Unix timestamp
+CREATE TABLE IF NOT EXISTS registration_dedup (
+    dedup_key TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    registered_at DOUBLE PRECISION NOT NULL
+);
+
+-- Create index for loading the registrations still inside the dedup window at startup
+CREATE INDEX IF NOT EXISTS idx_registration_dedup_registered_at ON registration_dedup(registered_at);
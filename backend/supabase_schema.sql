@@ -8,6 +8,7 @@ CREATE TABLE IF NOT EXISTS conversations (
     beneficiary_age INTEGER,
     assistance_request TEXT,
     messages JSONB DEFAULT '[]'::jsonb,
+    version INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -18,3 +19,56 @@ CREATE INDEX IF NOT EXISTS idx_conversations_session_id ON conversations(session
 -- Create index on created_at for sorting
 CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at);
 
+-- Create indexes for exporting completed registrations in (created_at, id) order, optionally per program
+CREATE INDEX IF NOT EXISTS idx_conversations_registrations_created_at_id ON conversations(created_at, id)
+    WHERE beneficiary_name IS NOT NULL AND beneficiary_age IS NOT NULL AND assistance_request IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_conversations_registrations_program_created_at_id ON conversations(program, created_at, id)
+    WHERE beneficiary_name IS NOT NULL AND beneficiary_age IS NOT NULL AND assistance_request IS NOT NULL;
+
+-- Keep updated_at current; the backend only sends slot fields
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_conversations_updated_at ON conversations;
+CREATE TRIGGER trg_conversations_updated_at BEFORE UPDATE ON conversations
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Append-only message log; conversations.messages is kept only for legacy rows
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    id BIGSERIAL PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES conversations(session_id) ON DELETE CASCADE,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL DEFAULT '',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Create index for fetching the newest messages of a session
+CREATE INDEX IF NOT EXISTS idx_conversation_messages_session_id_id ON conversation_messages(session_id, id);
+
+-- Durable outbox for beneficiary webhooks (next_attempt_at is a Unix timestamp)
+CREATE TABLE IF NOT EXISTS webhook_outbox (
+    idempotency_key TEXT PRIMARY KEY,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DOUBLE PRECISION NOT NULL,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Create index for the worker's due-entry scan
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_status_next_attempt ON webhook_outbox(status, next_attempt_at);
+
+-- Beneficiaries already registered, by a hash of normalized (name, age, program); registered_at is a Unix timestamp
+CREATE TABLE IF NOT EXISTS registration_dedup (
+    dedup_key TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    registered_at DOUBLE PRECISION NOT NULL
+);
+
+-- Create index for loading the registrations still inside the dedup window at startup
+CREATE INDEX IF NOT EXISTS idx_registration_dedup_registered_at ON registration_dedup(registered_at);
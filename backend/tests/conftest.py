@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Offline before any backend module is imported: mock database, no Redis, webhook or model
+os.environ.update({
+    "SUPABASE_URL": "",
+    "SUPABASE_KEY": "",
+    "REDIS_URL": "",
+    "WEBHOOK_URL": "",
+    "LLM_MODEL": "",
+    "MEMORY_SNAPSHOT_PATH": "",
+    "WEBHOOK_SPOOL_PATH": os.path.join(tempfile.mkdtemp(prefix="zha-tests-"), "webhook_outbox.sqlite3"),
+})
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """REDIS_URL pointing at an in-process fakeredis server, for Database and SessionStore built in the test"""
+    # Optional: tests that need Redis are skipped without it (see requirements-dev.txt)
+    pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa", reason="the session scripts need fakeredis[lua]")
+    from fakeredis import FakeServer
+    from fakeredis.aioredis import FakeRedis
+    import redis_backend
+    url = "redis://fake-redis:6379/0"
+    monkeypatch.setenv("REDIS_URL", url)
+    monkeypatch.setitem(redis_backend._clients, url, FakeRedis(server=FakeServer(), decode_responses=True))
@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from conversation_flow import ConversationFlow
+from database import Database
+from session_store import SessionStore
+from webhook_client import WebhookClient
+
+REGISTRATION = [
+    "There is no food left in our village after the flood",
+    "My name is Amina Yusuf",
+    "I'm 34 years old",
+]
+
+
+class RecordingOutbox:
+    def __init__(self):
+        self.sessions = []
+
+    async def enqueue(self, session_id, **payload):
+        self.sessions.append(session_id)
+        return True
+
+
+def make_flow(outbox=None) -> ConversationFlow:
+    return ConversationFlow(db=SessionStore(Database()), webhook_client=WebhookClient(), outbox=outbox)
+
+
+def test_failed_bulk_save_is_reported_and_not_cached():
+    outbox = RecordingOutbox()
+    flow = make_flow(outbox)
+    store = flow.db
+    save_conversations = store.db.save_conversations
+
+    async def fail_one(conversations):
+        # The database loses "lost"'s write but stores the rest
+        versions = await save_conversations([item for item in conversations if item["session_id"] != "lost"])
+        return {**versions, "lost": None}
+
+    store.db.save_conversations = fail_one
+    items = [(session_id, message) for message in REGISTRATION for session_id in ("kept", "lost")]
+    results = asyncio.run(flow.process_batch(items))
+
+    for (session_id, _), result in zip(items, results):
+        if session_id == "kept":
+            assert result["message"] and "error" not in result
+        else:
+            assert result["message"] is None and result["error"]
+    assert store._get_cached("kept")["version"] == 1
+    assert store._get_cached("lost") is None
+    assert outbox.sessions == ["kept"]
+
+
+def stale_cache_race(database_factory):
+    """Two workers over one store: the second moves a session on behind the first one's cache"""
+    database = database_factory()
+    first, second = (
+        ConversationFlow(db=SessionStore(database), webhook_client=WebhookClient(), outbox=RecordingOutbox())
+        for _ in range(2)
+    )
+
+    async def run():
+        await first.process_batch([("race", REGISTRATION[0])])
+        await second.process_message(REGISTRATION[1], "race")
+        results = await first.process_batch([("race", REGISTRATION[2]), ("fresh", REGISTRATION[0])])
+        return results, await database.load_conversation_state("race")
+
+    results, saved = asyncio.run(run())
+    assert all("error" not in result for result in results)
+    assert saved["version"] == 3
+    assert saved["beneficiary_name"] == "Amina Yusuf" and saved["beneficiary_age"] == 34
+    # The retried turn saw the name the other worker stored, so it didn't ask for it again
+    assert [m["role"] for m in saved["messages"]] == ["user", "assistant"] * 3
+    assert first.outbox.sessions == ["race"]
+
+
+def test_batch_retries_sessions_saved_by_another_worker():
+    stale_cache_race(Database)
+
+
+def test_batch_retries_sessions_saved_by_another_worker_on_redis(fake_redis):
+    stale_cache_race(Database)
+
+
+def test_failed_bulk_load_fails_the_batch():
+    flow = make_flow()
+
+    database = flow.db.db
+
+    async def unreachable():
+        raise ConnectionError("database unreachable")
+
+    async def run():
+        await flow.process_message(REGISTRATION[0], "existing")
+        # Not cached, so the batch has to load it, from a Supabase that can't be reached
+        await flow.db.invalidate("existing")
+        database.mock_mode, database._get_client = False, unreachable
+        with pytest.raises(ConnectionError):
+            await flow.process_batch([("existing", REGISTRATION[1])])
+        database.mock_mode = True
+        return await database.load_conversation_state("existing")
+
+    saved = asyncio.run(run())
+    # Not reset to a new conversation
+    assert saved["version"] == 1 and saved["program"] == "emergency_food_aid"
+
+
+def test_failed_turn_leaves_no_trace_in_the_session():
+    flow = make_flow()
+    run_turn = flow.run_turn
+
+    async def flaky_run_turn(state, message):
+        if message == "boom":
+            state["messages"].append({"role": "user", "content": message})
+            state["beneficiary_name"] = "Half Written"
+            raise RuntimeError("model exploded")
+        return await run_turn(state, message)
+
+    flow.run_turn = flaky_run_turn
+    items = [("flaky", REGISTRATION[0]), ("flaky", "boom"), ("flaky", REGISTRATION[1])]
+    results = asyncio.run(flow.process_batch(items))
+    assert [result.get("error") for result in results] == [None, "model exploded", None]
+
+    saved = asyncio.run(flow.db.db.load_conversation_state("flaky"))
+    assert [m["content"] for m in saved["messages"] if m["role"] == "user"] == [REGISTRATION[0], REGISTRATION[1]]
+    assert [m["role"] for m in saved["messages"]] == ["user", "assistant"] * 2
+    assert saved["beneficiary_name"] == "Amina Yusuf"
+
+
+def test_batch_size_is_capped():
+    import main
+    client = TestClient(main.app)
+    items = [{"session_id": f"s{i}", "message": "hello"} for i in range(main.BATCH_MAX_ITEMS + 1)]
+    assert client.post("/chat/batch", json={"items": items}).status_code == 422
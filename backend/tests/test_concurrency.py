@@ -0,0 +1,67 @@
+import asyncio
+from conversation_flow import ConversationFlow
+from database import Database
+from metrics import ROUTING_DECISIONS
+from session_store import SessionStore
+from webhook_client import WebhookClient
+
+TURNS = 40
+
+
+def make_workers(database_factory, count: int):
+    """`count` flows that share conversation state but have their own locks and caches, like uvicorn workers"""
+    flows = []
+    for _ in range(count):
+        flow = ConversationFlow(db=SessionStore(database_factory()), webhook_client=WebhookClient())
+        # Under this much contention a turn can lose the version race many times in a row
+        flow.max_save_attempts = 1000
+        flows.append(flow)
+    return flows
+
+
+async def hammer(flows, session_id: str):
+    """Send TURNS messages for one session at once, spread over the workers"""
+    await asyncio.gather(*(
+        flows[turn % len(flows)].process_message(f"message {turn}", session_id)
+        for turn in range(TURNS)
+    ))
+    return await flows[0].db.db.load_conversation_state(session_id, message_limit=10 * TURNS)
+
+
+def check(state):
+    """Every turn was saved exactly once, with its reply right after it"""
+    assert state["version"] == TURNS
+    messages = state["messages"]
+    assert len(messages) == 2 * TURNS
+    assert [m["role"] for m in messages] == ["user", "assistant"] * TURNS
+    assert sorted(m["content"] for m in messages[::2]) == sorted(f"message {turn}" for turn in range(TURNS))
+
+
+def test_one_worker_serializes_turns():
+    flows = make_workers(Database, 1)
+    check(asyncio.run(hammer(flows, "one-worker")))
+
+
+def test_workers_sharing_the_store_lose_no_updates():
+    database = Database()
+    routed = ROUTING_DECISIONS.value("general_food_access")
+    flows = make_workers(lambda: database, 4)
+    check(asyncio.run(hammer(flows, "shared-store")))
+    # Turns retried after losing the version race are only counted once
+    assert ROUTING_DECISIONS.value("general_food_access") == routed + 1
+
+
+def test_workers_sharing_redis_lose_no_updates(fake_redis):
+    flows = make_workers(Database, 4)
+    assert flows[0].db.db.redis is not None
+    check(asyncio.run(hammer(flows, "redis")))
+
+
+def test_save_attempts_setting_is_at_least_one(monkeypatch):
+    monkeypatch.setenv("MAX_SAVE_ATTEMPTS", "0")
+    flow = ConversationFlow(db=SessionStore(Database()), webhook_client=WebhookClient())
+    assert flow.max_save_attempts == 1
+    result = asyncio.run(flow.process_message("hello", "no-attempts"))
+    assert result["version"] == 1
+    [batched] = asyncio.run(flow.process_batch([("no-attempts", "I need food")]))
+    assert batched["message"] and "error" not in batched
@@ -0,0 +1,87 @@
+import asyncio
+import json
+from database import Database
+from memory_backend import MemorySessionBackend
+
+TURNS = [
+    [{"role": "user", "content": "There is no food left in our village"},
+     {"role": "assistant", "content": "To assist you better, may I please have your name?"}],
+    [{"role": "user", "content": "My name is Amina Yusuf"},
+     {"role": "assistant", "content": "Thank you. May I please know your age?"}],
+]
+
+
+async def fill(database: Database, sessions: int):
+    for index in range(sessions):
+        version = None
+        for turn, messages in enumerate(TURNS):
+            version = await database.save_conversation(
+                session_id=f"session-{index}",
+                program="emergency_food_aid",
+                beneficiary_name="Amina Yusuf" if turn else None,
+                beneficiary_age=30 + index if turn else None,
+                assistance_request=None,
+                new_messages=messages,
+                expected_version=version,
+                changed_slots=["program"] if turn == 0 else ["beneficiary_name", "beneficiary_age"]
+            )
+
+
+def test_sessions_survive_a_restart(tmp_path, monkeypatch):
+    path = tmp_path / "sessions.json"
+    monkeypatch.setenv("MEMORY_SNAPSHOT_PATH", str(path))
+
+    async def first_run():
+        database = Database()
+        await database.start()
+        await fill(database, 3)
+        states = [await database.load_conversation_state(f"session-{i}") for i in range(3)]
+        await database.stop()
+        return states
+
+    async def second_run():
+        database = Database()
+        await database.start()
+        states = [await database.load_conversation_state(f"session-{i}") for i in range(3)]
+        await database.stop()
+        return states
+
+    before = asyncio.run(first_run())
+    assert len(json.loads(path.read_text(encoding="utf-8"))["sessions"]) == 3
+    after = asyncio.run(second_run())
+    assert after == before
+    assert after[2]["beneficiary_age"] == 32 and after[2]["version"] == 2
+    assert [message["content"] for message in after[0]["messages"]] == [
+        message["content"] for turn in TURNS for message in turn
+    ]
+    # The restored sessions are written back unchanged on the next shutdown
+    assert len(json.loads(path.read_text(encoding="utf-8"))["sessions"]) == 3
+
+
+def test_unreadable_snapshot_is_kept(tmp_path):
+    path = tmp_path / "sessions.json"
+    path.write_text(json.dumps({"saved_at": 0, "sessions": [["only-an-id"]]}), encoding="utf-8")
+
+    async def run():
+        backend = MemorySessionBackend(snapshot_path=str(path))
+        await backend.start()
+        await backend.stop()
+
+    asyncio.run(run())
+    assert json.loads((tmp_path / "sessions.json.bad").read_text(encoding="utf-8"))["sessions"] == [["only-an-id"]]
+
+
+def test_truncated_snapshot_is_kept(tmp_path):
+    path = tmp_path / "sessions.json"
+    path.write_text('{"saved_at": 0, "sessions": [["session-0", "emergency_food_aid", nu', encoding="utf-8")
+
+    async def run():
+        backend = MemorySessionBackend(snapshot_path=str(path))
+        await backend.start()
+        backend.update(backend.create("after-restart"), {"program": "nutrition_support"}, [], 1)
+        await backend.stop()
+
+    asyncio.run(run())
+    assert (tmp_path / "sessions.json.bad").read_text(encoding="utf-8").endswith("nu")
+    # The store carries on with a fresh snapshot
+    assert json.loads(path.read_text(encoding="utf-8"))["sessions"][0][0] == "after-restart"
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import pytest
+from conversation_flow import MESSAGE_CATALOG, PROGRAMS, ConversationFlow
+from intent_classifier import IntentClassifier
+from message_catalog import DEFAULT_CATALOG_PATH, MESSAGE_KEYS, MessageCatalog
+
+
+def load_config():
+    with open(DEFAULT_CATALOG_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_shipped_catalog_translates_everything():
+    catalog = MessageCatalog.from_file(PROGRAMS)
+    assert catalog.fallbacks == []
+    for locale in catalog.locales:
+        for program in (*PROGRAMS, None):
+            for key in MESSAGE_KEYS:
+                text = catalog.message(locale, program, key)
+                assert text.strip() and "{" not in text, (locale, program, key)
+
+
+def test_missing_translations_fall_back_to_default_locale():
+    config = load_config()
+    hindi = config["locales"]["hi"]
+    del hindi["messages"]["age"]
+    del hindi["programs"]["nutrition_support"]
+    catalog = MessageCatalog(config["locales"], config["default_locale"], PROGRAMS, config["detection"])
+
+    assert ("hi", "messages", "age") in catalog.fallbacks
+    assert ("hi", "programs", "nutrition_support") in catalog.fallbacks
+    for program in (*PROGRAMS, None):
+        assert catalog.message("hi", program, "age") == catalog.message("en", program, "age")
+    english_name = config["locales"]["en"]["programs"]["nutrition_support"]
+    assert english_name in catalog.message("hi", "nutrition_support", "completion")
+    # Unknown locales and programs still resolve
+    assert catalog.message("fr", None, "name") == catalog.message("en", None, "name")
+    assert catalog.message("mr", "unknown_program", "name") == catalog.message("mr", None, "name")
+
+
+@pytest.mark.parametrize("opening, locale", [
+    ("मुझे खाना चाहिए, मेरा परिवार भूखा है", "hi"),
+    ("आम्हाला अन्न हवे आहे, माझे कुटुंब उपाशी आहे", "mr"),
+    ("Hola, necesito comida para mi familia", "es"),
+    ("We need food for my family", "en"),
+])
+@pytest.mark.parametrize("slot_reply", [
+    "Amina Yusuf", "34", "  19  ", "Priya",
+    # Accents and Spanish particles inside a name are not a change of language
+    "Maria de la Cruz", "José Luis", "Ana María", "Juan y María de los Santos",
+])
+def test_slot_only_turns_keep_the_session_locale(opening, locale, slot_reply):
+    assert MESSAGE_CATALOG.detect(slot_reply) is None
+    messages = [
+        {"role": "user", "content": opening},
+        {"role": "assistant", "content": "..."},
+        {"role": "user", "content": slot_reply},
+    ]
+    assert MESSAGE_CATALOG.session_locale(messages) == locale
+
+
+@pytest.mark.parametrize("slot_reply", ["Sunita Patil", "34"])
+def test_slot_only_turn_is_answered_in_the_session_locale(slot_reply):
+    flow = ConversationFlow()
+    state = ConversationFlow.new_state("marathi-session")
+    state["program"] = "emergency_food_aid"
+    state["messages"] = [
+        {"role": "user", "content": "आमच्या गावात पूर आला आहे, अन्न नाही"},
+        {"role": "assistant", "content": MESSAGE_CATALOG.message("mr", "emergency_food_aid", "name")},
+    ]
+    state = asyncio.run(flow.run_turn(state, slot_reply))
+    marathi = {MESSAGE_CATALOG.message("mr", "emergency_food_aid", key) for key in MESSAGE_KEYS}
+    assert state["messages"][-1]["content"] in marathi
+
+
+@pytest.mark.parametrize("name", ["Maria de la Cruz", "José Luis"])
+def test_spanish_looking_name_keeps_an_english_session_in_english(name):
+    flow = ConversationFlow()
+    state = ConversationFlow.new_state("english-session")
+    state["program"] = "nutrition_support"
+    state["messages"] = [
+        {"role": "user", "content": "I need nutrition help for my baby"},
+        {"role": "assistant", "content": MESSAGE_CATALOG.message("en", "nutrition_support", "name")},
+    ]
+    state = asyncio.run(flow.run_turn(state, name))
+    english = {MESSAGE_CATALOG.message("en", "nutrition_support", key) for key in MESSAGE_KEYS}
+    assert state["messages"][-1]["content"] in english
+
+
+@pytest.mark.parametrize("message, locale", [
+    ("Hola", "es"),
+    ("Me llamo José", "es"),
+    ("Tengo 34 años", "es"),
+    ("necesito ayuda de la comunidad", "es"),
+    ("My name is José", "en"),
+])
+def test_clear_language_still_switches(message, locale):
+    assert MESSAGE_CATALOG.detect(message) == locale
+
+
+@pytest.mark.parametrize("message, program", [
+    # पूर (flood) used to match inside पूरा / पूरी / पूरे / पूर्ण ("whole", "complete")
+    ("मला पूर्ण माहिती हवी आहे", "general_food_access"),
+    ("आमचे पूरे कुटुंब उपाशी आहे", "general_food_access"),
+    ("पूरा परिवार राशन के लिए मदद चाहता है", "general_food_access"),
+    ("मुझे पूरी जानकारी चाहिए", "general_food_access"),
+    ("आमच्या गावात पूर आला आहे", "emergency_food_aid"),
+    ("आम्ही पूरग्रस्त आहोत", "emergency_food_aid"),
+    ("गाँव में बाढ़ आई है", "emergency_food_aid"),
+])
+def test_devanagari_routing(message, program):
+    assert IntentClassifier.from_file().classify(message)["program"] == program
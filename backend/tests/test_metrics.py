@@ -0,0 +1,63 @@
+import json
+import os
+import metrics
+from metrics import ROUTING_DECISIONS, STATE_WRITE_BYTES
+
+
+def other_worker(directory, pid, routed, write_sizes):
+    """Snapshot as written by another worker process"""
+    snapshot = {
+        ROUTING_DECISIONS.name: [[["emergency_food_aid"], routed]],
+        STATE_WRITE_BYTES.name: [[[], counts, total, sum(counts)] for counts, total in write_sizes],
+    }
+    with open(os.path.join(directory, f"metrics-{pid}.json"), "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+
+
+def series(text, name):
+    return [line for line in text.splitlines() if line.startswith(name + "{") or line.startswith(name + " ")]
+
+
+def test_single_process_renders_its_own_series(monkeypatch):
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", None)
+    monkeypatch.setattr(ROUTING_DECISIONS, "_values", {("emergency_food_aid",): 2.0})
+    text = metrics.render_latest()
+    assert series(text, ROUTING_DECISIONS.name) == ['zha_routing_decisions_total{program="emergency_food_aid"} 2.0']
+
+
+def test_workers_are_summed_whichever_one_answers(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(ROUTING_DECISIONS, "_values", {("emergency_food_aid",): 2.0, ("nutrition_support",): 1.0})
+    monkeypatch.setattr(STATE_WRITE_BYTES, "_series", {(): [[1, 0, 0, 0, 0, 0, 0, 0], 0.0, 1]})
+    other_worker(tmp_path, 1, 3.0, [([0, 1, 0, 0, 0, 0, 0, 0], 50.0)])
+
+    text = metrics.render_latest()
+
+    assert series(text, ROUTING_DECISIONS.name) == [
+        'zha_routing_decisions_total{program="emergency_food_aid"} 5.0',
+        'zha_routing_decisions_total{program="nutrition_support"} 1.0',
+    ]
+    assert 'zha_state_write_bytes_bucket{le="0"} 1' in text
+    assert 'zha_state_write_bytes_bucket{le="64"} 2' in text
+    assert "zha_state_write_bytes_count 2" in text
+    assert "zha_state_write_bytes_sum 50.0" in text
+    # This worker's own snapshot was written for the others to read
+    assert (tmp_path / f"metrics-{os.getpid()}.json").exists()
+
+
+def test_exited_workers_still_count_and_bad_snapshots_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(ROUTING_DECISIONS, "_values", {})
+    other_worker(tmp_path, 1, 4.0, [])
+    (tmp_path / "metrics-2.json").write_text('{"zha_routing', encoding="utf-8")
+
+    text = metrics.render_latest()
+
+    assert series(text, ROUTING_DECISIONS.name) == ['zha_routing_decisions_total{program="emergency_food_aid"} 4.0']
+
+
+def test_clear_snapshots_empties_the_directory_before_a_run(tmp_path):
+    other_worker(tmp_path, 1, 4.0, [])
+    other_worker(tmp_path, 2, 1.0, [])
+    metrics.clear_snapshots(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import pytest
+from benchmarks import stub_model
+from benchmarks.run import BackgroundServer, free_port
+from conversation_flow import ConversationFlow
+from database import Database
+from model_assist import ModelAssistant
+from session_store import SessionStore
+from webhook_client import WebhookClient
+
+# No keyword matches it, so routing falls to the model; the stub model says nutrition_support
+UNMATCHED = "My toddler is always tired"
+
+
+@pytest.fixture(scope="module")
+def stub_server():
+    model = stub_model.StubModel()
+    # The OpenAI client's connection pool is shared by every assistant and stays bound
+    # to the event loop that first used it, so these tests share one loop too
+    with BackgroundServer(stub_model.build_app(model), free_port()) as server, asyncio.Runner() as runner:
+        yield model, f"{server.url}/v1", runner.run
+
+
+@pytest.fixture
+def stub(stub_server):
+    """The local stub model (reset), a factory for assistants that use it, and the loop to run them on"""
+    model, base_url, run = stub_server
+    model.latency = 0.0
+    model.received = 0
+
+    def make(**options) -> ModelAssistant:
+        return ModelAssistant("stub", base_url=base_url, **options)
+
+    return model, make, run
+
+
+@pytest.fixture
+def assistant(monkeypatch):
+    assistant = ModelAssistant("stub", base_url="http://127.0.0.1:9/v1")
+    answers = {}
+
+    async def ask(task, prompt, message):
+        return answers[message]
+
+    monkeypatch.setattr(assistant, "_ask", ask)
+    return assistant, answers
+
+
+@pytest.mark.parametrize("reply, age", [
+    ('{"age": 34}', 34),
+    ('{"age": "34"}', 34),
+    ('{"age": 34.9}', 34),
+    ('{"age": Infinity}', None),
+    ('{"age": -Infinity}', None),
+    ('{"age": NaN}', None),
+    ('{"age": "inf"}', None),
+    ('{"age": "1e400"}', None),
+    ('{"age": 1e400}', None),
+    ('{"age": 131}', None),
+    ('{"age": -1}', None),
+    ('{"age": "thirty"}', None),
+    ('{"age": true}', None),
+])
+def test_extract_age_is_validated(assistant, reply, age):
+    assistant, answers = assistant
+    # Parsed the way the model's JSON reply is, which accepts Infinity and NaN
+    answers["message"] = json.loads(reply)
+    slots = asyncio.run(assistant.extract("message", ["age"]))
+    assert slots.get("age") == age
+
+
+def test_repeated_prompts_are_answered_from_the_cache(stub):
+    model, make, run_on_loop = stub
+    assistant = make()
+
+    async def run():
+        first = await assistant.classify(UNMATCHED, ("nutrition_support", "general_food_access"))
+        # Same message once normalized
+        second = await assistant.classify(f"  {UNMATCHED.upper()}! ", ("nutrition_support", "general_food_access"))
+        return first, second
+
+    assert run_on_loop(run()) == ("nutrition_support", "nutrition_support")
+    assert model.received == 1
+    assert assistant.requests == {"model_call": 1, "cache_hit": 1}
+
+
+def test_identical_prompts_in_flight_share_one_call(stub):
+    model, make, run_on_loop = stub
+    model.latency = 0.2
+    assistant = make(budget_seconds=5.0)
+
+    async def run():
+        return await asyncio.gather(*(assistant.extract("Amina Yusuf", ["name"]) for _ in range(5)))
+
+    assert run_on_loop(run()) == [{"name": "Amina Yusuf"}] * 5
+    assert model.received == 1
+    assert assistant.requests == {"model_call": 1, "coalesced": 4}
+
+
+def test_slow_model_falls_back_to_the_keyword_route(stub):
+    model, make, run_on_loop = stub
+    model.latency = 0.3
+    assistant = make(budget_seconds=0.05)
+    flow = ConversationFlow(db=SessionStore(Database()), webhook_client=WebhookClient(), assistant=assistant)
+
+    async def run():
+        state = await flow.run_turn(flow.new_state("slow-model"), UNMATCHED)
+        # The call carries on past the budget, so its answer is there for the next turn
+        await asyncio.sleep(0.5)
+        again = await flow.run_turn(flow.new_state("slow-model-again"), UNMATCHED)
+        return state, again
+
+    state, again = run_on_loop(run())
+    assert state["program"] == "general_food_access"
+    assert again["program"] == "nutrition_support"
+    assert assistant.requests["over_budget"] == 1 and assistant.requests["cache_hit"] >= 1
+    assert model.received == 1
@@ -0,0 +1,136 @@
+import asyncio
+import pytest
+import registration_dedup
+from database import Database
+from registration_dedup import RegistrationDedup, normalize_name, registration_key
+
+WINDOW = 3600.0
+
+
+class Clock:
+    """Stands in for the time module"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+class SharedStore:
+    """The registration_dedup table's claim rules, in memory; shared by several workers' dedups"""
+
+    def __init__(self):
+        self.rows = {}
+        self.claims = 0
+
+    async def claim(self, key, session_id, now, window):
+        self.claims += 1
+        row = self.rows.get(key)
+        if row is None or row["session_id"] == session_id or row["registered_at"] < now - window:
+            self.rows[key] = {"dedup_key": key, "session_id": session_id, "registered_at": now}
+            return True
+        return False
+
+    async def recent(self, since, limit):
+        rows = [row for row in self.rows.values() if row["registered_at"] >= since]
+        return sorted(rows, key=lambda row: -row["registered_at"])[:limit]
+
+
+class BrokenStore:
+    async def claim(self, key, session_id, now, window):
+        raise ConnectionError("database unreachable")
+
+    async def recent(self, since, limit):
+        raise ConnectionError("database unreachable")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(registration_dedup, "time", clock)
+    return clock
+
+
+def make_dedup(store) -> RegistrationDedup:
+    dedup = RegistrationDedup(Database())
+    dedup.store = store
+    dedup.window = WINDOW
+    return dedup
+
+
+def claim(dedup: RegistrationDedup, session_id: str, name: str = "Amina Yusuf") -> bool:
+    return asyncio.run(dedup.claim(session_id, name, 34, "emergency_food_aid"))
+
+
+@pytest.mark.parametrize("name, normalized", [
+    ("  José   NÚÑEZ ", "jose nunez"),
+    ("Zoë O'Brien-Smith", "zoe o brien smith"),
+    ("François", "francois"),
+    # Vowel signs and viramas are part of a Devanagari name
+    ("सुनीता पाटील", "सुनीता पाटील"),
+    ("लक्ष्मी", "लक्ष्मी"),
+])
+def test_normalize_name(name, normalized):
+    assert normalize_name(name) == normalized
+
+
+def test_devanagari_marks_tell_names_apart():
+    assert normalize_name("सुनीता") != normalize_name("सुनता")
+    assert registration_key("JOSÉ Núñez", 34, "emergency_food_aid") == registration_key("jose nunez", 34, "emergency_food_aid")
+    assert registration_key("Jose Nunez", 34, "emergency_food_aid") != registration_key("Jose Nunez", 35, "emergency_food_aid")
+
+
+def test_same_session_can_repeat_its_registration(clock):
+    dedup = make_dedup(SharedStore())
+    assert claim(dedup, "first") and claim(dedup, "first")
+    assert dedup.duplicates == 0
+
+
+def test_other_session_within_the_window_is_suppressed(clock):
+    store = SharedStore()
+    worker_a, worker_b = make_dedup(store), make_dedup(store)
+    assert claim(worker_a, "first")
+    clock.now += WINDOW / 2
+    # Another worker, with nothing in its own index, asks the shared store
+    assert not claim(worker_b, "second", "  amina YUSUF ")
+    assert not claim(worker_b, "second")
+    # Suppressed once, not once per turn
+    assert worker_b.duplicates == 1
+    assert not claim(worker_a, "third")
+
+
+def test_registration_can_be_taken_over_after_the_window(clock):
+    store = SharedStore()
+    dedup = make_dedup(store)
+    assert claim(dedup, "first")
+    clock.now += WINDOW + 1
+    assert claim(dedup, "second")
+    assert store.rows[registration_key("Amina Yusuf", 34, "emergency_food_aid")]["session_id"] == "second"
+    assert not claim(dedup, "first")
+
+
+def test_fails_open_when_the_store_is_down(clock, capsys):
+    dedup = make_dedup(BrokenStore())
+    assert claim(dedup, "first") and claim(dedup, "second")
+    assert dedup.duplicates == 0
+    assert "Error checking for duplicate registration" in capsys.readouterr().out
+    # Startup carries on with an empty index
+    asyncio.run(dedup.start())
+    assert dedup.stats()["keys"] == 0
+
+
+def test_start_warms_the_index(clock):
+    store = SharedStore()
+    assert claim(make_dedup(store), "first")
+    clock.now += 60
+    assert claim(make_dedup(store), "other", "Priya Sharma")
+
+    restarted = make_dedup(store)
+    asyncio.run(restarted.start())
+    assert restarted.stats()["keys"] == 2
+    claims = store.claims
+    # Answered from the warmed index, without asking the store
+    assert not claim(restarted, "second")
+    assert claim(restarted, "other", "Priya Sharma")
+    assert store.claims == claims
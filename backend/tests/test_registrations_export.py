@@ -0,0 +1,18 @@
+import pytest
+from fastapi.testclient import TestClient
+from database import Database, UnsupportedBackendError
+
+
+def test_redis_backend_refuses_before_streaming(fake_redis):
+    database = Database()
+    with pytest.raises(UnsupportedBackendError):
+        database.iter_registrations()
+
+
+def test_endpoint_maps_unsupported_backend_to_501(fake_redis, monkeypatch):
+    import main
+    monkeypatch.setenv("ADMIN_API_KEY", "secret")
+    monkeypatch.setattr(main, "database", Database())
+    response = TestClient(main.app).get("/admin/registrations", headers={"X-Admin-Key": "secret"})
+    assert response.status_code == 501
+    assert "Redis" in response.json()["detail"]
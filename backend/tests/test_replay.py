@@ -0,0 +1,79 @@
+import json
+import os
+import metrics
+import replay
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "conversations.ndjson")
+
+SAMPLES = [
+    {"session_id": "rerouted", "changes": {"program": {"before": "general_food_access", "after": "nutrition_support"}}},
+    {"session_id": "gained", "changes": {"beneficiary_name": {"before": None, "after": "Priya Sharma"}}},
+    {"session_id": "lost", "changes": {"beneficiary_age": {"before": 40, "after": None}}},
+]
+
+
+def run(workers: int, **options) -> dict:
+    with open(FIXTURE, encoding="utf-8") as f:
+        report = replay.replay(f, workers, options.pop("chunk_size", 2), **options)
+    # Only the timings differ from run to run
+    del report["seconds"], report["messages_per_sec"]
+    return report
+
+
+def test_compare_names_how_each_field_moved():
+    row = {"program": "general_food_access", "beneficiary_name": None, "beneficiary_age": 40, "assistance_request": "rice"}
+    replayed = {"program": "nutrition_support", "beneficiary_name": "Priya", "beneficiary_age": None, "assistance_request": "rice"}
+    assert replay._compare(row, replayed) == {
+        "program": "changed",
+        "beneficiary_name": "gained",
+        "beneficiary_age": "lost",
+    }
+
+
+def test_replay_reports_changes_and_invalid_rows():
+    assert run(0) == {
+        "conversations": 4,
+        # Assistant messages are skipped
+        "messages": 8,
+        "changed": 3,
+        # Not JSON, messages not a list, a message not an object
+        "invalid": 3,
+        "fields": {
+            "program": {"changed": 1},
+            "beneficiary_name": {"gained": 1},
+            "beneficiary_age": {"lost": 1},
+        },
+        "program_moves": [{"before": "general_food_access", "after": "nutrition_support", "conversations": 1}],
+        "samples": SAMPLES,
+    }
+
+
+def test_worker_processes_report_the_same_as_in_process():
+    # Chunks can finish in any order across processes, so only the sample order may differ
+    pooled, local = run(2, chunk_size=1), run(0)
+    assert sorted(pooled.pop("samples"), key=lambda diff: diff["session_id"]) == sorted(
+        local.pop("samples"), key=lambda diff: diff["session_id"]
+    )
+    assert pooled == local
+
+
+def test_samples_and_diff_file(tmp_path):
+    diffs_path = tmp_path / "diffs.ndjson"
+    with open(diffs_path, "w", encoding="utf-8") as diffs_out:
+        report = run(0, samples=1, diffs_out=diffs_out)
+    assert report["samples"] == SAMPLES[:1]
+    assert [json.loads(line) for line in diffs_path.read_text(encoding="utf-8").splitlines()] == SAMPLES
+
+
+def test_in_process_replay_leaves_the_callers_metrics_and_settings(monkeypatch):
+    monkeypatch.setenv("WEBHOOK_URL", "http://webhook.example/hook")
+    run(0)
+    assert metrics.ENABLED
+    assert os.environ["WEBHOOK_URL"] == "http://webhook.example/hook"
+
+
+def test_cli_writes_the_report(tmp_path, capsys):
+    output = tmp_path / "report.json"
+    assert replay.main([FIXTURE, "--workers", "0", "--output", str(output)]) == 0
+    assert json.loads(output.read_text(encoding="utf-8"))["changed"] == 3
+    assert "4 conversations, 8 messages" in capsys.readouterr().err
@@ -0,0 +1,25 @@
+import itertools
+import pytest
+from benchmarks.slot_extraction import CORPUS, legacy_extract
+from slot_extractor import extract_slots
+
+
+@pytest.mark.parametrize("message", CORPUS)
+def test_matches_legacy_extraction(message):
+    for want in itertools.product((True, False), repeat=3):
+        assert extract_slots(message, *want) == legacy_extract(message, *want), want
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("My name is Amina Yusuf", {"name": "Amina Yusuf", "age": None, "is_name_or_age": True}),
+    ("I'm 34 years old", {"name": None, "age": 34, "is_name_or_age": True}),
+    ("34", {"name": None, "age": None, "is_name_or_age": True}),
+    ("My name is Li Wei, I am 61 years old", {"name": "Li Wei", "age": 61, "is_name_or_age": True}),
+    ("We need rice, beans and cooking oil for a family of six", {"name": None, "age": None, "is_name_or_age": False}),
+    ("Me llamo José Pérez", {"name": "José Pérez", "age": None, "is_name_or_age": True}),
+    ("Tengo 45 años", {"name": None, "age": 45, "is_name_or_age": True}),
+    ("मेरा नाम सीता देवी है", {"name": "सीता देवी", "age": None, "is_name_or_age": True}),
+    ("माझे नाव सुनीता पाटील आहे", {"name": "सुनीता पाटील", "age": None, "is_name_or_age": True}),
+])
+def test_golden_values(message, expected):
+    assert extract_slots(message) == expected
@@ -0,0 +1,157 @@
+import asyncio
+from conversation_flow import ConversationFlow
+from database import Database
+from session_store import SessionStore
+from webhook_client import WebhookClient
+from test_batch import REGISTRATION, RecordingOutbox
+from test_concurrency import make_workers
+
+
+def failing_saves(flow: ConversationFlow):
+    """Make every save fail the way a database error does, returning None; returns the undo"""
+    database = flow.db.db
+    save_conversation = database.save_conversation
+
+    async def fail(*args, **kwargs):
+        return None
+
+    database.save_conversation = fail
+    return lambda: setattr(database, "save_conversation", save_conversation)
+
+
+async def stream(flow: ConversationFlow, state, message: str):
+    return [(event, data) async for event, data in flow.stream_turn(state, message)]
+
+
+def test_failed_save_keeps_messages_for_the_next_one():
+    outbox = RecordingOutbox()
+    flow = ConversationFlow(db=SessionStore(Database()), webhook_client=WebhookClient(), outbox=outbox)
+    state = flow.new_state("resident")
+
+    async def run():
+        for message in REGISTRATION[:2]:
+            assert [event for event, _ in await stream(flow, state, message)] == ["reply", "saved"]
+        restore = failing_saves(flow)
+        events = await stream(flow, state, REGISTRATION[2])
+        assert [event for event, _ in events] == ["reply", "error"]
+        assert events[1][1]["status"] == 503
+        # The last turn's messages are still waiting to be saved, and nothing was sent
+        assert state["saved_message_count"] == 4 and len(state["messages"]) == 6
+        assert outbox.sessions == []
+
+        restore()
+        events = await stream(flow, state, "Thank you")
+        assert [event for event, _ in events] == ["reply", "saved", "webhook"]
+        saved = await flow.db.db.load_conversation_state("resident")
+        assert len(saved["messages"]) == 8 and saved["beneficiary_age"] == 34
+
+    asyncio.run(run())
+
+
+def test_turn_is_saved_when_the_client_leaves_after_the_reply():
+    outbox = RecordingOutbox()
+    flow = ConversationFlow(db=SessionStore(Database()), webhook_client=WebhookClient(), outbox=outbox)
+
+    async def run():
+        for message in REGISTRATION[:2]:
+            await flow.process_message(message, "gone")
+        events = flow.stream_message(REGISTRATION[2], "gone")
+        event, _ = await events.__anext__()
+        assert event == "reply"
+        # What Starlette does to the generator when the client disconnects
+        await events.aclose()
+        await flow.wait_for_turns()
+        return await flow.db.db.load_conversation_state("gone")
+
+    saved = asyncio.run(run())
+    assert saved["beneficiary_age"] == 34 and len(saved["messages"]) == 6
+    assert outbox.sessions == ["gone"]
+
+
+def test_stream_message_retries_a_turn_saved_elsewhere():
+    database = Database()
+    first, second = make_workers(lambda: database, 2)
+
+    async def run():
+        await first.process_message(REGISTRATION[0], "shared")
+        # The other worker moves the session on, so the first one's cached state is stale
+        await second.process_message(REGISTRATION[1], "shared")
+        events = [(event, data) async for event, data in first.stream_message(REGISTRATION[2], "shared")]
+        return events, await database.load_conversation_state("shared")
+
+    events, saved = asyncio.run(run())
+    assert [event for event, _ in events] == ["reply", "reply", "saved", "webhook"]
+    # The stale attempt asked for the name again; the retry's reply replaces it
+    assert events[0][1]["response"] != events[1][1]["response"]
+    assert events[1][1]["response"] == saved["messages"][-1]["content"]
+    assert saved["version"] == 3 and saved["beneficiary_name"] == "Amina Yusuf" and saved["beneficiary_age"] == 34
+
+
+def test_process_message_sends_nothing_after_a_failed_save():
+    outbox = RecordingOutbox()
+    flow = ConversationFlow(db=SessionStore(Database()), webhook_client=WebhookClient(), outbox=outbox)
+
+    async def run():
+        for message in REGISTRATION[:2]:
+            await flow.process_message(message, "unsaved")
+        failing_saves(flow)
+        await flow.process_message(REGISTRATION[2], "unsaved")
+
+    asyncio.run(run())
+    assert outbox.sessions == []
+
+
+def test_chat_answers_503_when_the_turn_is_not_saved():
+    import main
+    from fastapi.testclient import TestClient
+    client = TestClient(main.app)
+    session_id = None
+    for message in REGISTRATION[:2]:
+        session_id = client.post("/chat", json={"message": message, "session_id": session_id}).json()["session_id"]
+
+    restore = failing_saves(main.conversation_flow)
+    try:
+        response = client.post("/chat", json={"message": REGISTRATION[2], "session_id": session_id})
+    finally:
+        restore()
+    # Not "I've registered your request", since nothing was stored
+    assert response.status_code == 503
+    saved = asyncio.run(main.database.load_conversation_state(session_id))
+    assert saved["beneficiary_age"] is None
+
+
+def test_websocket_survives_bad_frames_and_failed_turns(monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+    run_turn = main.conversation_flow.run_turn
+    calls = []
+
+    async def flaky_run_turn(state, message):
+        calls.append(message)
+        if message == "boom":
+            state["messages"].append({"role": "user", "content": message})
+            raise RuntimeError("model exploded")
+        return await run_turn(state, message)
+
+    monkeypatch.setattr(main.conversation_flow, "run_turn", flaky_run_turn)
+    with TestClient(main.app).websocket_connect("/ws/chat") as websocket:
+        session_id = websocket.receive_json()["session_id"]
+
+        websocket.send_text("not json")
+        assert websocket.receive_json() == {"event": "error", "status": 400, "detail": "Frames must be JSON"}
+        for frame in ({"message": 5}, {"text": "hi"}, ["hi"], {"message": "  "}):
+            websocket.send_json(frame)
+            assert websocket.receive_json()["status"] == 422
+
+        websocket.send_json({"message": "boom"})
+        assert websocket.receive_json() == {"event": "error", "status": 500, "detail": "model exploded"}
+        assert websocket.receive_json()["event"] == "done"
+
+        websocket.send_json({"message": REGISTRATION[0]})
+        events = [websocket.receive_json() for _ in range(3)]
+        assert [event["event"] for event in events] == ["reply", "saved", "done"]
+
+    saved = asyncio.run(main.database.load_conversation_state(session_id))
+    # The failed turn's message was dropped with the state it half-updated
+    assert [m["content"] for m in saved["messages"] if m["role"] == "user"] == [REGISTRATION[0]]
+    assert calls == ["boom", REGISTRATION[0]]
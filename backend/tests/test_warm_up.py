@@ -0,0 +1,20 @@
+import asyncio
+
+
+def test_outbox_starts_when_an_earlier_step_fails(monkeypatch, capsys):
+    import main
+
+    async def database_down():
+        raise RuntimeError("database unreachable")
+
+    monkeypatch.setattr(main.database, "start", database_down)
+    monkeypatch.setattr(main.webhook_client, "webhook_url", "http://127.0.0.1:9/webhook")
+
+    async def warm_up():
+        await main.warm_up()
+        started = main.webhook_outbox._task is not None
+        await main.webhook_outbox.stop()
+        return started
+
+    assert asyncio.run(warm_up())
+    assert "Error during startup warm-up (database): database unreachable" in capsys.readouterr().out
@@ -0,0 +1,168 @@
+import asyncio
+import pytest
+import webhook_outbox
+from database import Database
+from metrics import WEBHOOK_OUTCOMES
+from webhook_outbox import SQLiteOutboxStore, WebhookOutbox
+
+REGISTRATION = {
+    "beneficiary_name": "Amina Yusuf",
+    "beneficiary_age": 34,
+    "assistance_request": "Rice and cooking oil for a family of six",
+    "program": "emergency_food_aid",
+}
+
+
+class Clock:
+    """Stands in for the time module, so retries come due without waiting"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+class StubClient:
+    """Webhook client whose sends follow `outcomes` (True delivers), then succeed"""
+
+    def __init__(self, outcomes=()):
+        self.webhook_url = "http://webhook.invalid/hook"
+        self.outcomes = list(outcomes)
+        self.sent = []
+        self.batches = []
+
+    def _outcome(self) -> bool:
+        return self.outcomes.pop(0) if self.outcomes else True
+
+    async def send_webhook(self, idempotency_key=None, **payload) -> bool:
+        self.sent.append(idempotency_key)
+        return self._outcome()
+
+    async def send_batch(self, payloads) -> bool:
+        self.batches.append([payload["idempotency_key"] for payload in payloads])
+        return self._outcome()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(webhook_outbox, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def make_outbox(tmp_path, monkeypatch):
+    monkeypatch.setenv("WEBHOOK_SPOOL_PATH", str(tmp_path / "outbox.sqlite3"))
+
+    def make(client: StubClient, **settings) -> WebhookOutbox:
+        outbox = WebhookOutbox(client, Database())
+        assert isinstance(outbox.store, SQLiteOutboxStore)
+        for name, value in settings.items():
+            setattr(outbox, name, value)
+        return outbox
+
+    return make
+
+
+def row(outbox: WebhookOutbox, session_id: str) -> dict:
+    key = WebhookOutbox.idempotency_key(session_id, REGISTRATION["program"])
+    status, attempts, next_attempt_at, last_error = outbox.store._connect().execute(
+        "SELECT status, attempts, next_attempt_at, last_error FROM webhook_outbox WHERE idempotency_key = ?",
+        (key,)
+    ).fetchone()
+    return {"status": status, "attempts": attempts, "next_attempt_at": next_attempt_at, "last_error": last_error}
+
+
+def test_failed_delivery_is_retried_after_backoff(clock, make_outbox):
+    client = StubClient([False, False])
+    outbox = make_outbox(client, retry_base=2.0, retry_max=300.0)
+
+    async def run():
+        assert await outbox.enqueue("backoff", **REGISTRATION)
+        assert await outbox.drain_once() == 1
+        first = row(outbox, "backoff")
+        # Not due again until the backoff has passed
+        assert await outbox.drain_once() == 0
+        clock.now += 2.0
+        assert await outbox.drain_once() == 1
+        second = row(outbox, "backoff")
+        clock.now += 4.0
+        assert await outbox.drain_once() == 1
+        return first, second, row(outbox, "backoff")
+
+    first, second, last = asyncio.run(run())
+    assert first == {"status": "pending", "attempts": 1, "next_attempt_at": clock.now - 4.0, "last_error": "delivery failed"}
+    assert second["status"] == "pending" and second["next_attempt_at"] == clock.now
+    assert last["status"] == "sent" and last["attempts"] == 3
+    assert len(client.sent) == 3 and len(set(client.sent)) == 1
+
+
+def test_delivery_fails_permanently_after_max_attempts(clock, make_outbox):
+    client = StubClient([False] * 10)
+    outbox = make_outbox(client, max_attempts=3, retry_base=1.0)
+    failed = WEBHOOK_OUTCOMES.value("failed_permanently")
+
+    async def run():
+        await outbox.enqueue("hopeless", **REGISTRATION)
+        for _ in range(3):
+            assert await outbox.drain_once() == 1
+            clock.now += 3600
+        # Given up on: never attempted again
+        assert await outbox.drain_once() == 0
+
+    asyncio.run(run())
+    assert row(outbox, "hopeless")["status"] == "failed"
+    assert len(client.sent) == 3
+    assert WEBHOOK_OUTCOMES.value("failed_permanently") == failed + 1
+
+
+def test_entry_is_reclaimed_once_its_lease_expires(clock, make_outbox):
+    client = StubClient()
+    outbox = make_outbox(client, lease_seconds=60.0)
+
+    async def run():
+        await outbox.enqueue("orphaned", **REGISTRATION)
+        # Another worker claims the entry and dies before finishing it
+        [entry] = await outbox.store.fetch_due(10)
+        assert await outbox.store.claim(entry["idempotency_key"], entry["attempts"], clock.now + 60.0)
+        assert await outbox.drain_once() == 0
+        clock.now += 61.0
+        assert await outbox.drain_once() == 1
+
+    asyncio.run(run())
+    assert row(outbox, "orphaned")["status"] == "sent"
+    assert row(outbox, "orphaned")["attempts"] == 2
+    assert len(client.sent) == 1
+
+
+def test_duplicate_enqueue_is_not_queued_twice(clock, make_outbox):
+    client = StubClient()
+    outbox = make_outbox(client)
+
+    async def run():
+        first = await outbox.enqueue("twice", **REGISTRATION)
+        second = await outbox.enqueue("twice", **REGISTRATION)
+        await outbox.drain_once()
+        return first, second
+
+    assert asyncio.run(run()) == (True, False)
+    assert len(client.sent) == 1
+
+
+def test_entries_are_delivered_in_batches(clock, make_outbox):
+    client = StubClient([True, False])
+    outbox = make_outbox(client, batch_size=3, concurrency=1)
+    sessions = [f"batched-{i}" for i in range(5)]
+
+    async def run():
+        for session_id in sessions:
+            await outbox.enqueue(session_id, **REGISTRATION)
+        assert await outbox.drain_once() == 5
+
+    asyncio.run(run())
+    assert [len(batch) for batch in client.batches] == [3, 2]
+    assert client.sent == []
+    # A batch succeeds or fails as a whole
+    statuses = {session_id: row(outbox, session_id)["status"] for session_id in sessions}
+    assert sorted(statuses.values()) == ["pending", "pending", "sent", "sent", "sent"]
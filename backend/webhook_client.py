@@ -1,22 +1,34 @@
 import os
-import httpx
-from typing import Literal
+from typing import Literal, Optional, List, Dict
+from http_pool import HttpPool
+from metrics import timed, WEBHOOK_OUTCOMES
 
 
 class WebhookClient:
-    def __init__(self):
-        """Initialize webhook client"""
+    def __init__(self, http: Optional[HttpPool] = None):
+        """Initialize webhook client on a shared HTTP pool (its own if none is given)"""
         self.webhook_url = os.getenv("WEBHOOK_URL", "")
-        
+        self._owns_http = http is None
+        self.http = http or HttpPool()
+    
+    def start(self):
+        """Report the configuration at startup"""
         if not self.webhook_url:
             print("Warning: WEBHOOK_URL not set. Webhooks will not be sent.")
     
-    def send_webhook(
+    async def aclose(self):
+        """Close the HTTP pool if this client created it; a shared one is closed by its owner"""
+        if self._owns_http:
+            await self.http.aclose()
+    
+    @timed("webhook")
+    async def send_webhook(
         self,
         beneficiary_name: str,
         beneficiary_age: int,
         assistance_request: str,
-        program: Literal["emergency_food_aid", "nutrition_support", "general_food_access"]
+        program: Literal["emergency_food_aid", "nutrition_support", "general_food_access"],
+        idempotency_key: Optional[str] = None
     ) -> bool:
         """
         Send beneficiary information to webhook endpoint.
@@ -25,6 +37,7 @@ class WebhookClient:
         """
         if not self.webhook_url:
             print(f"[MOCK WEBHOOK] Would send: {beneficiary_name}, {beneficiary_age}, {assistance_request}, {program}")
+            WEBHOOK_OUTCOMES.inc("mock")
             return False
         
         payload = {
@@ -35,21 +48,53 @@ class WebhookClient:
         }
         
         try:
-            response = httpx.post(
+            headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+            response = await self.http.get().post(
                 self.webhook_url,
                 json=payload,
-                timeout=10.0
+                headers=headers
             )
             
             if response.status_code == 200:
                 print(f"Webhook sent successfully for {beneficiary_name}")
+                WEBHOOK_OUTCOMES.inc("sent")
                 return True
             else:
                 print(f"Webhook failed with status {response.status_code}: {response.text}")
+                WEBHOOK_OUTCOMES.inc("http_error")
                 return False
         
         except Exception as e:
             print(f"Error sending webhook: {e}")
+            WEBHOOK_OUTCOMES.inc("exception")
+            return False
+    
+    @timed("webhook_batch")
+    async def send_batch(self, payloads: List[Dict]) -> bool:
+        """
+        Send several beneficiary payloads in a single POST as a JSON array.
+        
+        Each payload should carry its own "idempotency_key". Returns True if successful.
+        """
+        if not self.webhook_url:
+            print(f"[MOCK WEBHOOK] Would send batch of {len(payloads)}")
+            return False
+        
+        try:
+            response = await self.http.get().post(self.webhook_url, json=payloads)
+            
+            if response.status_code == 200:
+                print(f"Webhook batch of {len(payloads)} sent successfully")
+                WEBHOOK_OUTCOMES.inc("sent", amount=len(payloads))
+                return True
+            else:
+                print(f"Webhook batch failed with status {response.status_code}: {response.text}")
+                WEBHOOK_OUTCOMES.inc("http_error", amount=len(payloads))
+                return False
+        
+        except Exception as e:
+            print(f"Error sending webhook batch: {e}")
+            WEBHOOK_OUTCOMES.inc("exception", amount=len(payloads))
             return False
 
 
@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Optional, Dict, List
+from database import Database
+from metrics import timed, WEBHOOK_OUTCOMES
+from redis_backend import RedisOutboxStore
+from webhook_client import WebhookClient
+
+
+class SQLiteOutboxStore:
+    """Local file spool for the webhook outbox, used when Supabase is in mock mode"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the spool file on first use"""
+        if self._conn is not None:
+            return self._conn
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhook_outbox (
+                idempotency_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT
+            )
+            """
+        )
+        self._conn.commit()
+        return self._conn
+
+    async def _run(self, fn, *args):
+        """Run a blocking sqlite call off the event loop, one at a time"""
+        async with self._lock:
+            return await asyncio.to_thread(lambda: fn(self._connect(), *args))
+
+    def _insert(self, conn: sqlite3.Connection, key: str, payload: Dict) -> bool:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO webhook_outbox (idempotency_key, payload, next_attempt_at) VALUES (?, ?, ?)",
+            (key, json.dumps(payload), time.time())
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def _fetch_due(self, conn: sqlite3.Connection, limit: int) -> List[Dict]:
+        rows = conn.execute(
+            "SELECT idempotency_key, payload, attempts FROM webhook_outbox "
+            "WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+        return [
+            {"idempotency_key": key, "payload": json.loads(payload), "attempts": attempts}
+            for key, payload, attempts in rows
+        ]
+
+    def _claim(self, conn: sqlite3.Connection, key: str, attempts: int, lease_until: float) -> bool:
+        cursor = conn.execute(
+            "UPDATE webhook_outbox SET status = 'sending', attempts = attempts + 1, next_attempt_at = ? "
+            "WHERE idempotency_key = ? AND attempts = ?",
+            (lease_until, key, attempts)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def _update(self, conn: sqlite3.Connection, key: str, status: str, next_attempt_at: float, last_error: Optional[str]):
+        conn.execute(
+            "UPDATE webhook_outbox SET status = ?, next_attempt_at = ?, last_error = ? WHERE idempotency_key = ?",
+            (status, next_attempt_at, last_error, key)
+        )
+        conn.commit()
+
+    async def insert(self, key: str, payload: Dict) -> bool:
+        return await self._run(self._insert, key, payload)
+
+    async def fetch_due(self, limit: int) -> List[Dict]:
+        return await self._run(self._fetch_due, limit)
+
+    async def claim(self, key: str, attempts: int, lease_until: float) -> bool:
+        return await self._run(self._claim, key, attempts, lease_until)
+
+    async def update(self, key: str, status: str, next_attempt_at: float, last_error: Optional[str] = None):
+        await self._run(self._update, key, status, next_attempt_at, last_error)
+
+
+class SupabaseOutboxStore:
+    """Webhook outbox persisted in the webhook_outbox table"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def insert(self, key: str, payload: Dict) -> bool:
+        client = await self.db._get_client()
+        result = await client.table("webhook_outbox").upsert(
+            {"idempotency_key": key, "payload": payload, "next_attempt_at": time.time()},
+            on_conflict="idempotency_key",
+            ignore_duplicates=True
+        ).execute()
+        return bool(result.data)
+
+    async def fetch_due(self, limit: int) -> List[Dict]:
+        client = await self.db._get_client()
+        result = await client.table("webhook_outbox").select(
+            "idempotency_key,payload,attempts"
+        ).in_(
+            "status", ["pending", "sending"]
+        ).lte(
+            "next_attempt_at", time.time()
+        ).order("next_attempt_at").limit(limit).execute()
+        return result.data or []
+
+    async def claim(self, key: str, attempts: int, lease_until: float) -> bool:
+        # Optimistic claim: only one worker can move attempts from N to N+1
+        client = await self.db._get_client()
+        result = await client.table("webhook_outbox").update({
+            "status": "sending",
+            "attempts": attempts + 1,
+            "next_attempt_at": lease_until
+        }).eq("idempotency_key", key).eq("attempts", attempts).execute()
+        return bool(result.data)
+
+    async def update(self, key: str, status: str, next_attempt_at: float, last_error: Optional[str] = None):
+        client = await self.db._get_client()
+        await client.table("webhook_outbox").update({
+            "status": status,
+            "next_attempt_at": next_attempt_at,
+            "last_error": last_error
+        }).eq("idempotency_key", key).execute()
+
+
+class WebhookOutbox:
+    def __init__(self, webhook_client: WebhookClient, db: Optional[Database] = None):
+        """
+        Durable queue of completed registrations, drained by a background worker.
+
+        Entries live in the webhook_outbox table or, when the database is in
+        mock mode, in Redis (REDIS_URL) or a local SQLite spool (WEBHOOK_SPOOL_PATH).
+        """
+        self.webhook_client = webhook_client
+        db = db or Database()
+        if db.mock_mode and db.redis_url:
+            self.store = RedisOutboxStore(db.redis_url)
+        elif db.mock_mode:
+            self.store = SQLiteOutboxStore(os.getenv("WEBHOOK_SPOOL_PATH", "webhook_outbox.sqlite3"))
+        else:
+            self.store = SupabaseOutboxStore(db)
+
+        self.max_attempts = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+        self.retry_base = float(os.getenv("WEBHOOK_RETRY_BASE", "2.0"))
+        self.retry_max = float(os.getenv("WEBHOOK_RETRY_MAX", "300"))
+        self.concurrency = int(os.getenv("WEBHOOK_CONCURRENCY", "4"))
+        self.batch_size = int(os.getenv("WEBHOOK_BATCH_SIZE", "1"))
+        self.poll_interval = float(os.getenv("WEBHOOK_POLL_INTERVAL", "5.0"))
+        # How long a claimed entry stays invisible to other workers
+        self.lease_seconds = float(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Earliest retry this worker has scheduled, so it wakes up for it
+        self._next_retry_at: Optional[float] = None
+
+    @staticmethod
+    def idempotency_key(session_id: str, program: str) -> str:
+        """One registration per session and program"""
+        return hashlib.sha256(f"{session_id}:{program}".encode("utf-8")).hexdigest()
+
+    @timed("webhook_enqueue")
+    async def enqueue(
+        self,
+        session_id: str,
+        beneficiary_name: str,
+        beneficiary_age: int,
+        assistance_request: str,
+        program: str
+    ) -> bool:
+        """
+        Queue a completed registration for delivery.
+
+        Returns True if it was newly queued, False if it was already queued or could not be stored.
+        """
+        if not self.webhook_client.webhook_url:
+            # Nothing to deliver to; keep the mock log line
+            await self.webhook_client.send_webhook(
+                beneficiary_name=beneficiary_name,
+                beneficiary_age=beneficiary_age,
+                assistance_request=assistance_request,
+                program=program
+            )
+            return False
+
+        payload = {
+            "beneficiary_name": beneficiary_name,
+            "beneficiary_age": beneficiary_age,
+            "assistance_request": assistance_request,
+            "program": program
+        }
+
+        try:
+            queued = await self.store.insert(self.idempotency_key(session_id, program), payload)
+        except Exception as e:
+            print(f"Error queueing webhook: {e}")
+            WEBHOOK_OUTCOMES.inc("enqueue_error")
+            return False
+
+        if queued:
+            WEBHOOK_OUTCOMES.inc("queued")
+            self._wakeup.set()
+        else:
+            WEBHOOK_OUTCOMES.inc("duplicate")
+        return queued
+
+    def _backoff(self, attempts: int) -> float:
+        """Delay before the next attempt after `attempts` failures"""
+        return min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+
+    async def _finish(self, entry: Dict, ok: bool, error: Optional[str]):
+        """Mark an attempted entry as sent, or reschedule/fail it"""
+        attempts = entry["attempts"] + 1
+        now = time.time()
+        if ok:
+            await self.store.update(entry["idempotency_key"], "sent", now)
+        elif attempts >= self.max_attempts:
+            print(f"Webhook {entry['idempotency_key'][:12]} failed permanently after {attempts} attempts")
+            WEBHOOK_OUTCOMES.inc("failed_permanently")
+            await self.store.update(entry["idempotency_key"], "failed", now, error)
+        else:
+            retry_at = now + self._backoff(attempts)
+            if self._next_retry_at is None or retry_at < self._next_retry_at:
+                self._next_retry_at = retry_at
+            await self.store.update(entry["idempotency_key"], "pending", retry_at, error)
+
+    async def _deliver(self, entries: List[Dict]):
+        """Send one entry (or one batch of entries) and record the outcome"""
+        async with self._semaphore:
+            error = None
+            try:
+                if len(entries) == 1:
+                    payload = entries[0]["payload"]
+                    ok = await self.webhook_client.send_webhook(
+                        beneficiary_name=payload["beneficiary_name"],
+                        beneficiary_age=payload["beneficiary_age"],
+                        assistance_request=payload["assistance_request"],
+                        program=payload["program"],
+                        idempotency_key=entries[0]["idempotency_key"]
+                    )
+                else:
+                    ok = await self.webhook_client.send_batch([
+                        {**entry["payload"], "idempotency_key": entry["idempotency_key"]}
+                        for entry in entries
+                    ])
+            except Exception as e:
+                ok = False
+                error = str(e)
+
+            if not ok and error is None:
+                error = "delivery failed"
+            for entry in entries:
+                await self._finish(entry, ok, error)
+
+    async def drain_once(self) -> int:
+        """Claim and deliver every entry that is currently due. Returns the number attempted."""
+        due = await self.store.fetch_due(self.concurrency * self.batch_size * 4)
+        claimed = []
+        lease_until = time.time() + self.lease_seconds
+        for entry in due:
+            if await self.store.claim(entry["idempotency_key"], entry["attempts"], lease_until):
+                claimed.append(entry)
+
+        batches = [claimed[i:i + self.batch_size] for i in range(0, len(claimed), self.batch_size)]
+        await asyncio.gather(*(self._deliver(batch) for batch in batches))
+        return len(claimed)
+
+    async def run(self):
+        """Background worker loop; wakes on enqueue or every poll interval"""
+        while True:
+            self._wakeup.clear()
+            try:
+                attempted = await self.drain_once()
+            except Exception as e:
+                print(f"Error draining webhook outbox: {e}")
+                attempted = 0
+
+            if attempted == 0:
+                timeout = self.poll_interval
+                if self._next_retry_at is not None:
+                    timeout = max(0.0, min(timeout, self._next_retry_at - time.time()))
+                    self._next_retry_at = None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        """Start the background worker on the running event loop (no-op without a webhook URL)"""
+        if self._task is None and self.webhook_client.webhook_url:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Cancel the background worker; undelivered entries stay queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
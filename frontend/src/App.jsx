@@ -2,6 +2,8 @@ import { useState, useRef, useEffect } from 'react'
 import './App.css'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+// Times a turn is sent when its reply arrives but the server couldn't save it
+const MAX_RESENDS = 2
 
 function App() {
   const [messages, setMessages] = useState([
@@ -37,30 +39,27 @@ function App() {
     setIsLoading(true)
 
     try {
-      const response = await fetch(`${API_URL}/chat`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          message: userMessage,
-          session_id: sessionId
-        })
-      })
-
-      if (!response.ok) {
-        throw new Error('Failed to get response from server')
-      }
-
-      const data = await response.json()
-      
-      // Update session ID if received
-      if (data.session_id && !sessionId) {
-        setSessionId(data.session_id)
+      let activeSessionId = sessionId
+      for (let attempt = 0; ; attempt++) {
+        const outcome = await streamTurn(userMessage, activeSessionId, newMessages)
+        activeSessionId = outcome.sessionId || activeSessionId
+        if (!outcome.saveError) break
+
+        // The reply is on screen but the turn wasn't stored; the server keeps nothing of it, so send it again
+        console.error('Error saving message:', outcome.saveError)
+        if (attempt + 1 >= MAX_RESENDS) {
+          setMessages([
+            ...newMessages,
+            {
+              role: 'assistant',
+              content: 'Sorry, your last message could not be saved. Please send it again.'
+            }
+          ])
+          setInputValue(userMessage)
+          break
+        }
+        setIsLoading(true)
       }
-
-      // Add assistant response
-      setMessages([...newMessages, { role: 'assistant', content: data.response }])
     } catch (error) {
       console.error('Error sending message:', error)
       setMessages([
@@ -75,6 +74,81 @@ function App() {
     }
   }
 
+  // Stream one turn; returns the session id and, if the turn failed after its reply was shown, why
+  const streamTurn = async (userMessage, activeSessionId, newMessages) => {
+    // Stream the turn so the reply shows up before the server has saved it
+    const response = await fetch(`${API_URL}/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        message: userMessage,
+        session_id: activeSessionId
+      })
+    })
+
+    if (!response.ok || !response.body) {
+      throw new Error('Failed to get response from server')
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let gotReply = false
+    let saved = false
+    let saveError = null
+    let replySessionId = null
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      // Server-Sent Events are separated by a blank line
+      const events = buffer.split('\n\n')
+      buffer = events.pop()
+
+      for (const rawEvent of events) {
+        const eventLine = rawEvent.split('\n').find((line) => line.startsWith('event: '))
+        const dataLine = rawEvent.split('\n').find((line) => line.startsWith('data: '))
+        if (!eventLine || !dataLine) continue
+
+        const event = eventLine.slice('event: '.length)
+        const data = JSON.parse(dataLine.slice('data: '.length))
+
+        if (event === 'reply') {
+          gotReply = true
+          replySessionId = data.session_id
+
+          // Update session ID if received
+          if (data.session_id && !sessionId) {
+            setSessionId(data.session_id)
+          }
+
+          // Add assistant response; a retried turn sends a new reply that replaces it
+          setMessages([...newMessages, { role: 'assistant', content: data.response }])
+          setIsLoading(false)
+        } else if (event === 'saved') {
+          saved = true
+        } else if (event === 'error') {
+          if (!gotReply) {
+            throw new Error(data.detail)
+          }
+          // Once saved, the turn is stored and must not be sent twice
+          if (!saved) {
+            saveError = data.detail
+          }
+        }
+      }
+    }
+
+    if (!gotReply) {
+      throw new Error('No reply received from server')
+    }
+    return { sessionId: replySessionId, saveError }
+  }
+
   return (
     <div className="app">
       <header className="app-header">